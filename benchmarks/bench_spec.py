@@ -0,0 +1,41 @@
+"""Micro-benchmark for parsing the spec models.
+
+Usage: poetry run python benchmarks/bench_spec.py [--number N]
+
+Compare `Model(**json.loads(raw))` (what the resources did before) with `Model.parse(raw)`,
+which validates the json document natively by `model_validate_json` with pydantic v2,
+or decodes it by orjson (if installed) with pydantic v1.
+"""
+import argparse
+import json
+import timeit
+from pathlib import Path
+
+from moby_distribution.spec.base import orjson, pydantic_version
+from moby_distribution.spec.image_json import ImageJSON
+from moby_distribution.spec.manifest import ManifestSchema2, OCIManifestSchema1
+
+assets = Path(__file__).parent.parent / "tests" / "spec" / "assets"
+
+CASES = [
+    (ManifestSchema2, "docker_manifest_schema2.json"),
+    (OCIManifestSchema1, "oci_manifest_schema1.json"),
+    (ImageJSON, "image_json.pydantic_v2.json"),
+]
+
+
+def bench(number: int):
+    print(f"pydantic: {pydantic_version}, orjson: {'enabled' if orjson is not None else 'disabled'}")
+    print(f"iterations: {number}")
+    print(f"{'model':<20}{'json.loads (us)':>16}{'parse (us)':>16}{'speedup':>10}")
+    for model, filename in CASES:
+        raw = (assets / filename).read_bytes()
+        before = min(timeit.repeat(lambda: model(**json.loads(raw)), number=number, repeat=3)) / number
+        parsed = min(timeit.repeat(lambda: model.parse(raw), number=number, repeat=3)) / number
+        print(f"{model.__name__:<20}{before * 1e6:>16.2f}{parsed * 1e6:>16.2f}{before / parsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000)
+    bench(parser.parse_args().number)
@@ -0,0 +1,174 @@
+"""Benchmark the transports with a storm of small requests (`Blob.stat`) against a local registry stand-in.
+
+Usage: poetry run python benchmarks/bench_transport.py [--requests N] [--concurrency C] [--latency SECONDS]
+
+The stand-in answers `HEAD /v2/<repo>/blobs/<digest>` after `--latency` seconds (to simulate the round trip),
+it talks HTTP/1.1, or HTTP/2 with prior knowledge (h2c). `RequestsTransport` needs a connection for each
+request in flight, while `HttpxTransport` multiplexes them over a few HTTP/2 connections.
+
+`HttpxTransport` requires `pip install httpx[http2]`.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from moby_distribution.registry.client import DockerRegistryV2Client, PoolConfig
+from moby_distribution.registry.concurrency import NoConcurrencyLimit
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.transport import HttpxTransport, RequestsTransport
+
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+
+class RegistryStandIn:
+    """a minimal registry answering the blob HEAD requests, in a background thread"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def close(self):
+        # the loop keeps serving the open connections until they are closed by the clients
+        self.loop.call_soon_threadsafe(self.server.close)
+
+    @staticmethod
+    def respond(path: str):
+        if path == "/v2/":
+            return [(":status", "200"), ("content-type", "application/json"), ("content-length", "2")], b"{}"
+        digest = path.rsplit("/", 1)[-1]
+        headers = [
+            (":status", "200"),
+            ("content-type", "application/octet-stream"),
+            ("content-length", "1024"),
+            ("docker-content-digest", digest),
+        ]
+        return headers, b""
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            preface = await reader.readexactly(len(H2_PREFACE))
+            if preface == H2_PREFACE:
+                await self.serve_h2(preface, reader, writer)
+            else:
+                await self.serve_h1(preface, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_h1(self, buffer: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            while b"\r\n\r\n" not in buffer:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                buffer += chunk
+            head, buffer = buffer.split(b"\r\n\r\n", 1)
+            path = head.split(b" ", 2)[1].decode()
+            await asyncio.sleep(self.latency)
+            headers, body = self.respond(path)
+            lines = [f"HTTP/1.1 {headers[0][1]} OK"] + [f"{k}: {v}" for k, v in headers[1:]]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+
+    async def serve_h2(self, preface: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+        import h2.settings
+
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        # allow the client to open streams before receiving the settings
+        conn.local_settings = h2.settings.Settings(
+            client=False, initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 1000}
+        )
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+
+        async def respond(stream_id: int, path: str):
+            await asyncio.sleep(self.latency)
+            headers, body = self.respond(path)
+            try:
+                conn.send_headers(stream_id, headers, end_stream=not body)
+                if body:
+                    conn.send_data(stream_id, body, end_stream=True)
+            except h2.exceptions.ProtocolError:
+                # the connection has been closed
+                return
+            writer.write(conn.data_to_send())
+
+        data = preface
+        while data:
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    path = dict(event.headers)[b":path"].decode()
+                    asyncio.ensure_future(respond(event.stream_id, path))
+            writer.write(conn.data_to_send())
+            await writer.drain()
+            data = await reader.read(65536)
+
+
+def bench(name: str, client: DockerRegistryV2Client, number: int, concurrency: int) -> float:
+    def stat(i: int):
+        return Blob(repo="library/python", client=client).stat(f"sha256:{i:064x}")
+
+    # warm up the connections
+    client.ping()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(stat, range(number)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    print(f"{name:<28}{elapsed:>10.2f}{number / elapsed:>12.0f}", end="")
+    return elapsed
+
+
+def main(number: int, concurrency: int, latency: float, max_connections: int):
+    print(f"requests: {number}, concurrency: {concurrency}, latency: {latency * 1000:.0f}ms")
+    print(f"{'transport':<28}{'time (s)':>10}{'req/s':>12}{'connections':>14}")
+    options = dict(rate_limiter=NoRateLimit(), governor=NoConcurrencyLimit())
+
+    cases = [
+        (
+            f"requests (pool={max_connections})",
+            lambda: RequestsTransport(PoolConfig(pool_maxsize=max_connections, pool_block=True).new_session()),
+        ),
+        (
+            f"requests (pool={concurrency})",
+            lambda: RequestsTransport(PoolConfig(pool_maxsize=concurrency).new_session()),
+        ),
+        (
+            f"httpx h2 (conns={max_connections})",
+            lambda: HttpxTransport(http1=False, http2=True, max_connections=max_connections),
+        ),
+    ]
+    for name, new_transport in cases:
+        stand_in = RegistryStandIn(latency)
+        try:
+            transport = new_transport()
+        except ImportError as e:
+            print(f"{name:<28}skipped: {e}")
+            continue
+        client = DockerRegistryV2Client(f"http://127.0.0.1:{stand_in.port}", transport=transport, **options)
+        bench(name, client, number, concurrency)
+        print(f"{stand_in.connections:>14}")
+        stand_in.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-connections", type=int, default=4)
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.latency, args.max_connections)
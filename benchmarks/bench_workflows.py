@@ -0,0 +1,387 @@
+"""End-to-end benchmarks of the transfer workflows, against the in-process `FakeRegistry`.
+
+Usage (install the package first by `poetry install`):
+    poetry run python benchmarks/bench_workflows.py run [--layers N] [--layer-size MiB] [--latency SECONDS]
+        [--bandwidth MiB/s] [--repeat N] [--save PATH] [--baseline PATH]
+    poetry run python benchmarks/bench_workflows.py compare BASELINE CURRENT [--threshold 0.1]
+
+A synthetic image of `--layers` layers of `--layer-size` MiB each (half of the 64KiB blocks are random,
+the others are zeros, so the layers are compressible) is used by the operations:
+
+- `from_tarball`: load the image from a `docker save` tarball (extract, gzip and hash the layers)
+- `add_layer`: add the gzipped layers to an image (hash them and their uncompressed content)
+- `blob.upload` / `blob.download`: transfer the gzipped layers one by one
+- `push_v2`: push the image to a new repository
+- `save`: pull the image pushed and save it as a tarball
+
+For each operation, the median wall time over `--repeat` runs, the throughput (MiB/s of the uncompressed
+layers, or of the blobs transferred), the requests sent, the CPU time and the peak RSS of the benchmark
+process (the median of the peaks of the runs) are reported. The registry runs in a child process, so its
+CPU time and memory are not counted. The peak RSS is only measured on Linux, where it can be reset before
+each run; elsewhere it is recorded as unavailable (null) and not compared.
+
+No baseline is shipped, because the numbers only hold on the machine producing them. Produce one on the
+machine (and with the params) to compare on, e.g. before a change:
+    poetry run python benchmarks/bench_workflows.py run --save .benchmarks/baseline.json
+and after the change:
+    poetry run python benchmarks/bench_workflows.py run --baseline .benchmarks/baseline.json
+
+`run --save PATH` writes the results as a baseline, `run --baseline PATH` and `compare` flag the regressions:
+the wall time, the CPU time or the peak RSS increased, or the throughput decreased, by more than `--threshold`,
+or more requests were sent. `compare` exits with 1 if any regression is found.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import platform
+import random
+import statistics
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.concurrency import NoConcurrencyLimit
+from moby_distribution.registry.metrics import MetricsCollector, RequestEvent
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.resources.image import ImageRef, LayerRef
+from moby_distribution.testing import FakeRegistry
+
+MiB = 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+
+# the metrics to compare, and whether the higher value is better
+METRICS = {"seconds": False, "mib_per_s": True, "requests": False, "cpu_seconds": False, "peak_rss_mib": False}
+
+
+class RequestCounter(MetricsCollector):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, event: RequestEvent):
+        with self._lock:
+            self.count += 1
+
+
+def reset_peak_rss() -> bool:
+    """reset the peak RSS of the process, return whether it is supported (only on Linux)"""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+def get_peak_rss_mib() -> Optional[float]:
+    """return the peak RSS since it was reset, None if unavailable.
+
+    NOTE: `ru_maxrss` is not a fallback, it is the peak since the process started, which can't be reset,
+    so it would grow across the operations and be reported as regressions.
+    """
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def serve(conn, latency: float, bandwidth: Optional[float]):
+    """run the registry in the child process until the parent closes the pipe"""
+    with FakeRegistry(latency=latency, bandwidth=bandwidth) as registry:
+        conn.send(registry.url)
+        try:
+            conn.recv()
+        except EOFError:
+            pass
+
+
+class SyntheticImage:
+    """the layers and the `docker save` tarball of a synthetic image, in `workdir`"""
+
+    def __init__(self, workdir: Path, layers: int, layer_size: int, seed: int = 0):
+        rand = random.Random(seed)
+        self.raw_layers: List[Path] = []
+        self.gzipped_layers: List[Path] = []
+        for i in range(layers):
+            raw = workdir / f"layer-{i}.tar"
+            with raw.open("wb") as fh:
+                for _ in range(0, layer_size, BLOCK_SIZE):
+                    if rand.random() < 0.5:
+                        fh.write(rand.getrandbits(BLOCK_SIZE * 8).to_bytes(BLOCK_SIZE, "little"))
+                    else:
+                        fh.write(bytes(BLOCK_SIZE))
+            gzipped = workdir / f"layer-{i}.tar.gz"
+            with raw.open("rb") as src, gzip.open(gzipped, "wb") as dest:
+                dest.write(src.read())
+            self.raw_layers.append(raw)
+            self.gzipped_layers.append(gzipped)
+
+        self.raw_size = sum(path.stat().st_size for path in self.raw_layers)
+        self.gzipped_size = sum(path.stat().st_size for path in self.gzipped_layers)
+        self.config = json.dumps(
+            {
+                "architecture": "amd64",
+                "os": "linux",
+                "created": "2024-01-01T00:00:00Z",
+                "config": {},
+                "rootfs": {"type": "layers", "diff_ids": [self._sha256(path) for path in self.raw_layers]},
+                "history": [{"created_by": "bench"} for _ in self.raw_layers],
+            },
+            separators=(",", ":"),
+        )
+        self.tarball = workdir / "image.tar"
+        self._write_tarball()
+
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        signer = hashlib.sha256()
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(MiB), b""):
+                signer.update(chunk)
+        return f"sha256:{signer.hexdigest()}"
+
+    def _write_tarball(self):
+        manifest = [
+            {
+                "Config": "config.json",
+                "RepoTags": ["bench/image:latest"],
+                "Layers": [f"{i}/layer.tar" for i in range(len(self.raw_layers))],
+            }
+        ]
+        with tarfile.open(self.tarball, mode="w") as tarball:
+            for name, data in (("manifest.json", json.dumps(manifest)), ("config.json", self.config)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data.encode())
+                tarball.addfile(info, io.BytesIO(data.encode()))
+            for i, path in enumerate(self.raw_layers):
+                tarball.add(str(path), arcname=f"{i}/layer.tar")
+
+
+class Benchmark:
+    def __init__(self, client: DockerRegistryV2Client, counter: RequestCounter, image: SyntheticImage, args):
+        self.client = client
+        self.counter = counter
+        self.image = image
+        self.repeat = args.repeat
+        self.max_worker = args.max_worker
+        self.workdir = Path(args.workdir)
+        self._runs = 0
+
+    def new_repo(self, name: str) -> str:
+        self._runs += 1
+        return f"bench/{name}-{self._runs}"
+
+    def measure(self, func: Callable[[], None], size: int) -> Dict[str, Optional[float]]:
+        seconds, cpu_seconds, peak_rss, requests = [], [], [], 0
+        for _ in range(self.repeat):
+            self.counter.count = 0
+            rss_reset = reset_peak_rss()
+            start, start_cpu = time.perf_counter(), time.process_time()
+            func()
+            seconds.append(time.perf_counter() - start)
+            cpu_seconds.append(time.process_time() - start_cpu)
+            requests = self.counter.count
+            peak_rss.append(get_peak_rss_mib() if rss_reset else None)
+        median = statistics.median(seconds)
+        return {
+            "seconds": median,
+            "mib_per_s": size / MiB / median if median > 0 else 0.0,
+            "requests": requests,
+            "cpu_seconds": statistics.median(cpu_seconds),
+            "peak_rss_mib": None if None in peak_rss else statistics.median(peak_rss),
+        }
+
+    def new_image_with_layers(self, repo: str) -> ImageRef:
+        """build the image by adding the gzipped layers to the base image without layer"""
+        config = json.loads(self.image.config)
+        config["rootfs"]["diff_ids"], config["history"] = [], []
+        ref = ImageRef(repo=repo, reference="latest", layers=[], initial_config=json.dumps(config), client=self.client)
+        for path in self.image.gzipped_layers:
+            ref.add_layer(LayerRef(local_path=path))
+        return ref
+
+    def run(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            "from_tarball": self.bench_from_tarball(),
+            "add_layer": self.bench_add_layer(),
+            "blob.upload": self.bench_blob_upload(),
+            "blob.download": self.bench_blob_download(),
+            "push_v2": self.bench_push_v2(),
+            "save": self.bench_save(),
+        }
+
+    def bench_from_tarball(self) -> Dict[str, float]:
+        def from_tarball():
+            with tempfile.TemporaryDirectory(dir=self.workdir) as workplace:
+                ImageRef.from_tarball(Path(workplace), self.image.tarball, client=self.client)
+
+        return self.measure(from_tarball, self.image.raw_size)
+
+    def bench_add_layer(self) -> Dict[str, float]:
+        def add_layer():
+            self.new_image_with_layers("bench/add-layer")
+
+        return self.measure(add_layer, self.image.raw_size)
+
+    def bench_blob_upload(self) -> Dict[str, float]:
+        def upload():
+            repo = self.new_repo("blob")
+            for path in self.image.gzipped_layers:
+                Blob(repo=repo, local_path=path, client=self.client).upload()
+
+        return self.measure(upload, self.image.gzipped_size)
+
+    def bench_blob_download(self) -> Dict[str, float]:
+        repo = self.new_repo("blob")
+        digests = [
+            Blob(repo=repo, local_path=path, client=self.client).upload().digest for path in self.image.gzipped_layers
+        ]
+
+        def download():
+            for digest in digests:
+                Blob(repo=repo, digest=digest, fileobj=io.BytesIO(), client=self.client).download()
+
+        return self.measure(download, self.image.gzipped_size)
+
+    def bench_push_v2(self) -> Dict[str, float]:
+        ref = self.new_image_with_layers("bench/push")
+
+        def push():
+            # push to a new repository each time, otherwise nothing is uploaded
+            ref.repo = self.new_repo("push")
+            ref.push_v2(max_worker=self.max_worker)
+
+        return self.measure(push, self.image.gzipped_size)
+
+    def bench_save(self) -> Dict[str, float]:
+        repo = self.new_repo("save")
+        self.new_image_with_layers(repo).push_v2(max_worker=self.max_worker)
+        pulled = ImageRef.from_image(from_repo=repo, from_reference="latest", client=self.client)
+
+        def save():
+            with tempfile.TemporaryDirectory(dir=self.workdir) as dest:
+                pulled.save(str(Path(dest) / "image.tar"))
+
+        return self.measure(save, self.image.raw_size)
+
+
+def print_results(results: Dict[str, Dict[str, Optional[float]]]):
+    print(f"{'operation':<16}{'time (s)':>10}{'MiB/s':>10}{'requests':>10}{'cpu (s)':>10}{'peak RSS (MiB)':>15}")
+    for name, result in results.items():
+        peak_rss = "n/a" if result["peak_rss_mib"] is None else f"{result['peak_rss_mib']:.1f}"
+        print(
+            f"{name:<16}{result['seconds']:>10.3f}{result['mib_per_s']:>10.1f}{result['requests']:>10d}"
+            f"{result['cpu_seconds']:>10.3f}{peak_rss:>15}"
+        )
+
+
+def run(args) -> int:
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    bandwidth = args.bandwidth * MiB if args.bandwidth else None
+    server = ctx.Process(target=serve, args=(child_conn, args.latency, bandwidth), daemon=True)
+    server.start()
+    url = parent_conn.recv()
+
+    counter = RequestCounter()
+    client = DockerRegistryV2Client(url, rate_limiter=NoRateLimit(), governor=NoConcurrencyLimit(), metrics=counter)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            args.workdir = workdir
+            image = SyntheticImage(Path(workdir), args.layers, int(args.layer_size * MiB))
+            print(
+                f"layers: {args.layers} x {args.layer_size} MiB ({image.gzipped_size / MiB:.1f} MiB gzipped), "
+                f"latency: {args.latency * 1000:.0f}ms, bandwidth: {args.bandwidth or 'unlimited'} MiB/s, "
+                f"repeat: {args.repeat}"
+            )
+            results = Benchmark(client, counter, image, args).run()
+    finally:
+        client.close()
+        parent_conn.close()
+        server.join(timeout=5)
+
+    print_results(results)
+    report = {
+        "params": {
+            key: getattr(args, key) for key in ("layers", "layer_size", "latency", "bandwidth", "repeat", "max_worker")
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2))
+        print(f"saved to {args.save}")
+    if args.baseline:
+        return compare_reports(json.loads(Path(args.baseline).read_text()), report, args.threshold)
+    return 0
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float) -> int:
+    if baseline["params"] != current["params"]:
+        print(f"WARNING: the params differ, baseline: {baseline['params']}, current: {current['params']}")
+
+    regressions = 0
+    print(f"{'operation':<16}{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = base.get(metric), result.get(metric)
+            if before is None or after is None:
+                # e.g. the peak RSS is unavailable on the platform
+                continue
+            change = (after - before) / before if before else 0.0
+            if metric == "requests":
+                regressed = after > before
+            else:
+                regressed = (-change if higher_is_better else change) > threshold
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<16}{metric:<14}{before:>12.3f}{after:>12.3f}{change:>+10.1%}{flag}")
+    print(f"{regressions} regression(s) found, threshold: {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--layers", type=int, default=4)
+    run_parser.add_argument("--layer-size", type=float, default=16, help="the size of each layer in MiB")
+    run_parser.add_argument("--latency", type=float, default=0.005, help="the round trip of each request in seconds")
+    run_parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s of the registry, 0 means unlimited")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--max-worker", type=int, default=5)
+    run_parser.add_argument("--save", help="save the results as a baseline to the path")
+    run_parser.add_argument("--baseline", help="compare the results with the baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+
+    compare_parser = subparsers.add_parser("compare", help="compare the results with the baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return run(args)
+    return compare_reports(
+        json.loads(Path(args.baseline).read_text()), json.loads(Path(args.current).read_text()), args.threshold
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,22 @@
-from moby_distribution.registry.client import (
-    DockerRegistryV2Client,
-    default_client,
-    set_default_client,
-)
-from moby_distribution.registry.resources.blobs import Blob
-from moby_distribution.registry.resources.image import ImageRef, LayerRef
-from moby_distribution.registry.resources.manifests import ManifestRef
-from moby_distribution.registry.resources.tags import Tags
-from moby_distribution.spec.endpoint import OFFICIAL_ENDPOINT, APIEndpoint
-from moby_distribution.spec.image_json import ImageJSON
-from moby_distribution.spec.manifest import (
-    ManifestSchema1,
-    ManifestSchema2,
-    OCIManifestSchema1,
-)
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from moby_distribution.registry.client import (
+        DockerRegistryV2Client,
+        default_client,
+        set_default_client,
+    )
+    from moby_distribution.registry.resources.blobs import Blob
+    from moby_distribution.registry.resources.image import ImageRef, LayerRef
+    from moby_distribution.registry.resources.manifests import ManifestRef
+    from moby_distribution.registry.resources.tags import Tags
+    from moby_distribution.spec.endpoint import OFFICIAL_ENDPOINT, APIEndpoint
+    from moby_distribution.spec.image_json import ImageJSON
+    from moby_distribution.spec.manifest import (
+        ManifestSchema1,
+        ManifestSchema2,
+        OCIManifestSchema1,
+    )
 
 __version__ = "0.8.2"
 __all__ = [
@@ -32,3 +35,35 @@ __all__ = [
     "default_client",
     "set_default_client",
 ]
+
+# the exports are imported on first use, so importing a part of the package doesn't load the others
+_exports = {
+    "DockerRegistryV2Client": "moby_distribution.registry.client",
+    "default_client": "moby_distribution.registry.client",
+    "set_default_client": "moby_distribution.registry.client",
+    "Blob": "moby_distribution.registry.resources.blobs",
+    "ImageRef": "moby_distribution.registry.resources.image",
+    "LayerRef": "moby_distribution.registry.resources.image",
+    "ManifestRef": "moby_distribution.registry.resources.manifests",
+    "Tags": "moby_distribution.registry.resources.tags",
+    "APIEndpoint": "moby_distribution.spec.endpoint",
+    "OFFICIAL_ENDPOINT": "moby_distribution.spec.endpoint",
+    "ImageJSON": "moby_distribution.spec.image_json",
+    "ManifestSchema1": "moby_distribution.spec.manifest",
+    "ManifestSchema2": "moby_distribution.spec.manifest",
+    "OCIManifestSchema1": "moby_distribution.spec.manifest",
+}
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_exports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
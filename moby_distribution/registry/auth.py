@@ -4,7 +4,6 @@ import logging
 from typing import Any, Dict, Optional
 
 import requests
-from www_authenticate import parse
 
 from moby_distribution.registry.exceptions import AuthFailed
 from moby_distribution.registry.utils import TypeTimeout
@@ -24,15 +23,32 @@ class AuthorizationProvider:
 
 
 class BaseAuthentication:
-    """Base Authentication Protocol"""
+    """Base Authentication Protocol
 
-    def __init__(self, www_authenticate: str):
+    The owning client will set `session` to its pooled session, authenticators should send requests with it,
+    so that the connections to the authorization service are reused.
+    """
+
+    session: Optional[requests.Session] = None
+
+    def __init__(self, www_authenticate: str, session: Optional[requests.Session] = None):
         self._raw_www_authenticate = www_authenticate
         self._www_authenticate = None
+        if session is not None:
+            self.session = session
+
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """send GET request with the pooled session if any"""
+        if self.session is not None:
+            # the session may skip verifying the certificate of the registry, but not of the authorization service
+            return self.session.get(url, verify=True, **kwargs)
+        return requests.get(url, **kwargs)
 
     @property
     def www_authenticate(self):
         if self._www_authenticate is None:
+            from www_authenticate import parse
+
             self._www_authenticate = parse(self._raw_www_authenticate)
         return self._www_authenticate
 
@@ -99,8 +115,10 @@ class DockerRegistryTokenAuthentication(BaseAuthentication):
     service: str
     scope: str
 
-    def __init__(self, www_authenticate: str, offline_token: bool = True):
-        super().__init__(www_authenticate)
+    def __init__(
+        self, www_authenticate: str, offline_token: bool = True, session: Optional[requests.Session] = None
+    ):
+        super().__init__(www_authenticate, session=session)
         self.offline_token = offline_token
 
         assert "bearer" in self.www_authenticate
@@ -137,7 +155,7 @@ class DockerRegistryTokenAuthentication(BaseAuthentication):
             logger.warning("请同时提供 username 和 password!")
 
         logger.info("sending authentication request to authorization service<%s>", self.backend)
-        resp = requests.get(self.backend, headers=headers, params=params, timeout=timeout)
+        resp = self._get(self.backend, headers=headers, params=params, timeout=timeout)
         if resp.status_code != 200:
             raise AuthFailed(
                 message="用户凭证校验失败, 请检查用户信息和操作权限",
@@ -154,9 +172,11 @@ class UniversalAuthentication(BaseAuthentication):
         self, username: Optional[str] = None, password: Optional[str] = None, *, timeout: TypeTimeout = AUTH_TIMEOUT
     ) -> AuthorizationProvider:
         if "basic" in self.www_authenticate:
-            return HTTPBasicAuthentication(self.raw_www_authenticate).authenticate(username, password, timeout=timeout)
+            return HTTPBasicAuthentication(self.raw_www_authenticate, session=self.session).authenticate(
+                username, password, timeout=timeout
+            )
         elif "bearer" in self.www_authenticate:
-            return DockerRegistryTokenAuthentication(self.raw_www_authenticate).authenticate(
+            return DockerRegistryTokenAuthentication(self.raw_www_authenticate, session=self.session).authenticate(
                 username, password, timeout=timeout
             )
         raise NotImplementedError("未支持的认证方式")
@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Mapping, Optional, Tuple, cast
+
+from moby_distribution.registry.utils import LazyProxy
+from moby_distribution.spec.endpoint import WELL_KNOWN_ENDPOINTS
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir() -> Optional[Path]:
+    """return the directory to persist the local caches, None means the caches are kept in memory only.
+
+    Persisting is opt-in, by setting the environment variable `MOBY_DISTRIBUTION_CACHE_DIR` to the directory.
+    """
+    path = os.getenv("MOBY_DISTRIBUTION_CACHE_DIR")
+    return Path(path) if path else None
+
+
+def load_json(path: Optional[Path]) -> Dict:
+    """load the json object from path, return an empty dict if the file is missing or broken"""
+    if path is None:
+        return {}
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def dump_json(path: Optional[Path], data: Dict):
+    """dump the json object to path atomically, so concurrent readers never see a half written file"""
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with os.fdopen(fd, mode="w") as fh:
+            json.dump(data, fh)
+        os.replace(temp_path, path)
+    except OSError:
+        logger.debug("failed to persist cache to %s", path, exc_info=True)
+
+
+class LayerMetadataIndex:
+    """LayerMetadataIndex maps the digest of the compressed layer to its diff_id
+    (the digest of the uncompressed tarball), so the layer needn't be downloaded to compute the diff_id again.
+
+    The index is loaded from `path` on first use, and new entries are merged into `path` when recorded.
+
+    :param max_entries: the max number of entries to keep (and persist), the least recently used ones are dropped.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = 4096):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._diff_ids: "Optional[OrderedDict[str, str]]" = None
+
+    def _ensure_loaded(self) -> "OrderedDict[str, str]":
+        if self._diff_ids is None:
+            self._diff_ids = self._load()
+        return self._diff_ids
+
+    def _load(self) -> "OrderedDict[str, str]":
+        # the entries are persisted from the least recently used to the most recently used
+        return OrderedDict((k, v) for k, v in load_json(self.path).items() if isinstance(v, str))
+
+    def _put(self, entries: "OrderedDict[str, str]", digest: str, diff_id: str):
+        entries[digest] = diff_id
+        entries.move_to_end(digest)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get(self, digest: str) -> Optional[str]:
+        """return the diff_id of the compressed layer identified by digest, or None if unknown"""
+        with self._lock:
+            known = self._ensure_loaded()
+            diff_id = known.get(digest)
+            if diff_id is not None:
+                known.move_to_end(digest)
+            return diff_id
+
+    def record(self, digest: str, diff_id: str):
+        """record the diff_id of the compressed layer identified by digest"""
+        self.record_many([digest], [diff_id])
+
+    def record_many(self, digests: Iterable[str], diff_ids: Iterable[str]):
+        """record the diff_ids of compressed layers, the two iterables should be in the same order.
+
+        `path` is rewritten only if a new entry is recorded, its size is bounded by `max_entries`.
+        """
+        entries = {digest: diff_id for digest, diff_id in zip(digests, diff_ids) if digest and diff_id}
+        with self._lock:
+            known = self._ensure_loaded()
+            if all(known.get(digest) == diff_id for digest, diff_id in entries.items()):
+                for digest in entries:
+                    known.move_to_end(digest)
+                return
+            for digest, diff_id in entries.items():
+                self._put(known, digest, diff_id)
+            if self.path is not None:
+                # merge with the entries recorded by other processes
+                persisted = self._load()
+                for digest, diff_id in entries.items():
+                    self._put(persisted, digest, diff_id)
+                dump_json(self.path, persisted)
+
+
+def _new_default_layer_index() -> LayerMetadataIndex:
+    cache_dir = get_cache_dir()
+    return LayerMetadataIndex(cache_dir / "layers.json" if cache_dir else None)
+
+
+default_layer_index = cast(LayerMetadataIndex, LazyProxy(_new_default_layer_index))
+
+
+def set_default_layer_index(index: LayerMetadataIndex):
+    default_layer_index.__dict__["_wrapped"] = index
+
+
+EndpointStatus = Tuple[bool, bool]
+
+_SCHEME_STATUSES: Dict[str, EndpointStatus] = {
+    "https": (True, True),
+    "https-insecure": (True, False),
+    "http": (False, False),
+}
+
+
+def parse_endpoint_statuses(value: str) -> Dict[str, EndpointStatus]:
+    """parse the endpoint statuses like `registry.local:5000=http,harbor.corp=https-insecure`,
+    the scheme is one of `https`, `https-insecure` (https with an invalid certificate) and `http`.
+    """
+    statuses = {}
+    for item in value.split(","):
+        url, _, scheme = item.strip().rpartition("=")
+        if not url or scheme not in _SCHEME_STATUSES:
+            if item.strip():
+                logger.warning("ignore the invalid endpoint status: %s", item)
+            continue
+        statuses[url] = _SCHEME_STATUSES[scheme]
+    return statuses
+
+
+class EndpointStatusCache:
+    """EndpointStatusCache keeps the results of `APIEndpoint.is_secure_repository`, so the TLS probe of
+    a registry needn't be repeated by every process.
+
+    The results are persisted to `path` with an expiry, the ones without https support (which may be caused by
+    a transient network failure) expire after `negative_ttl` seconds, the others after `ttl` seconds.
+    The primed statuses (e.g. from configuration) never expire and are not persisted.
+
+    :param primed: the known statuses of the endpoints, `(support https, certificate valid)` keyed by the url.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl: float = 7 * 24 * 3600,
+        negative_ttl: float = 10 * 60,
+        primed: Optional[Mapping[str, EndpointStatus]] = None,
+        clock=time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.primed: Dict[str, EndpointStatus] = dict(primed or {})
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    def _ensure_loaded(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            self._entries = {k: v for k, v in load_json(self.path).items() if self._is_valid_entry(v)}
+        return self._entries
+
+    @staticmethod
+    def _is_valid_entry(entry) -> bool:
+        return (
+            isinstance(entry, dict)
+            and isinstance(entry.get("https"), bool)
+            and isinstance(entry.get("certificate_valid"), bool)
+            and isinstance(entry.get("expires_at"), (int, float))
+        )
+
+    def prime(self, statuses: Mapping[str, EndpointStatus]):
+        """set the known statuses of the endpoints, they are used without probing"""
+        with self._lock:
+            self.primed.update(statuses)
+
+    def get(self, url: str) -> Optional[EndpointStatus]:
+        """return the status of the endpoint identified by url, or None if unknown or expired"""
+        with self._lock:
+            if url in self.primed:
+                return self.primed[url]
+            entry = self._ensure_loaded().get(url)
+            if entry is None or entry["expires_at"] <= self.clock():
+                return None
+            return entry["https"], entry["certificate_valid"]
+
+    def put(self, url: str, status: EndpointStatus):
+        """record the probed status of the endpoint identified by url"""
+        enable_https, certificate_valid = status
+        ttl = self.ttl if enable_https else self.negative_ttl
+        entry = {"https": enable_https, "certificate_valid": certificate_valid, "expires_at": self.clock() + ttl}
+        with self._lock:
+            self._ensure_loaded()[url] = entry
+            if self.path is not None:
+                # merge with the entries recorded by other processes, and drop the expired ones
+                now = self.clock()
+                persisted = {
+                    k: v for k, v in load_json(self.path).items() if self._is_valid_entry(v) and v["expires_at"] > now
+                }
+                persisted[url] = entry
+                dump_json(self.path, persisted)
+
+    def invalidate(self, url: str):
+        with self._lock:
+            self.primed.pop(url, None)
+            self._ensure_loaded().pop(url, None)
+            if self.path is not None:
+                persisted = load_json(self.path)
+                if persisted.pop(url, None) is not None:
+                    dump_json(self.path, persisted)
+
+
+def _new_default_endpoint_status_cache() -> EndpointStatusCache:
+    """the endpoint statuses can be primed by the environment variable `MOBY_DISTRIBUTION_ENDPOINTS`,
+    e.g. `registry.local:5000=http,harbor.corp=https-insecure`
+    """
+    cache_dir = get_cache_dir()
+    primed = dict(WELL_KNOWN_ENDPOINTS)
+    primed.update(parse_endpoint_statuses(os.getenv("MOBY_DISTRIBUTION_ENDPOINTS", "")))
+    return EndpointStatusCache(cache_dir / "endpoints.json" if cache_dir else None, primed=primed)
+
+
+default_endpoint_status_cache = cast(EndpointStatusCache, LazyProxy(_new_default_endpoint_status_cache))
+
+
+def set_default_endpoint_status_cache(cache: EndpointStatusCache):
+    default_endpoint_status_cache.__dict__["_wrapped"] = cache
+
+
+def cache_endpoint_status(func: Callable[..., EndpointStatus]) -> Callable[..., EndpointStatus]:
+    """cache the status probed by `func(api_endpoint, *, timeout)` by `default_endpoint_status_cache`,
+    which may be persisted across processes
+    """
+
+    @wraps(func)
+    def probe(api_endpoint, *, timeout: Optional[float] = None) -> EndpointStatus:
+        status = default_endpoint_status_cache.get(api_endpoint.url)
+        if status is None:
+            status = func(api_endpoint, timeout=timeout)
+            default_endpoint_status_cache.put(api_endpoint.url, status)
+        return status
+
+    return probe
@@ -1,22 +1,94 @@
 import logging
+import threading
+import time
 from functools import partial
 from math import isinf
-from typing import Optional, Type, cast
+from typing import ContextManager, NamedTuple, Optional, Tuple, Type, cast
+from urllib.parse import urlparse
 
-import curlify
 import requests
+from requests.adapters import HTTPAdapter
 
 from moby_distribution.registry import exceptions
 from moby_distribution.registry.auth import AuthorizationProvider, BaseAuthentication, UniversalAuthentication
-from moby_distribution.registry.utils import LazyProxy, TypeTimeout
+from moby_distribution.registry.concurrency import ConcurrencyGovernor, default_governor, get_operation
+from moby_distribution.registry.detect import detect_api_base_url
+from moby_distribution.registry.metrics import MetricsCollector, NoMetrics, RequestTrace
+from moby_distribution.registry.ratelimit import RateLimiter, default_rate_limiter
+from moby_distribution.registry.redirects import RedirectCache
+from moby_distribution.registry.retry import RetryPolicy
+from moby_distribution.registry.tracing import start_span
+from moby_distribution.registry.transport import RequestsTransport, Transport
+from moby_distribution.registry.utils import LazyCurl, LazyProxy, TypeTimeout, get_route_kind
 from moby_distribution.spec.endpoint import OFFICIAL_ENDPOINT, APIEndpoint
 
 logger = logging.getLogger(__name__)
 
 
+class PoolConfig(NamedTuple):
+    """Connection pool settings of `DockerRegistryV2Client`
+
+    The pools are shared by all the hosts the client talks to, including the registry and
+    the authorization service, the storage backends the registry redirects to are pooled separately.
+    """
+
+    # the number of hosts to keep a connection pool for
+    pool_connections: int = 10
+    # the max number of connections to keep for each host
+    pool_maxsize: int = 32
+    # if True, requests wait for a free connection when `pool_maxsize` connections to the host are in use,
+    # which is a hard limit of the connections per host; otherwise extra connections are opened and discarded.
+    pool_block: bool = False
+    # reuse the connections (HTTP keep-alive), if False, every connection will be closed after the response
+    keep_alive: bool = True
+
+    def new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+
+class AuthStats:
+    """The latency of authentication round trips (including requesting token from the authorization service),
+    which is recorded separately from the latency of the requests to the registry."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def record(self, elapsed: float):
+        self.count += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        self.last_seconds = elapsed
+
+    @property
+    def avg_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return (
+            f"AuthStats(count={self.count}, avg_seconds={self.avg_seconds:.3f}, "
+            f"max_seconds={self.max_seconds:.3f}, last_seconds={self.last_seconds:.3f})"
+        )
+
+
 class DockerRegistryV2Client:
     """A Client implement APIs of Docker Registry HTTP API V2 and OCI Distribution Spec API
 
+    The client is safe to be shared by threads, the connections are pooled (see `PoolConfig`)
+    and the authentication is performed once for concurrent requests which are challenged at the same time.
+
     spec: https://github.com/distribution/distribution/blob/main/docs/spec/api.md
     reference: https://github.com/distribution/distribution/tree/main/registry/client
     """
@@ -31,30 +103,25 @@ class DockerRegistryV2Client:
         default_timeout: TypeTimeout = 60 * 10,
         https_detect_timeout: float = 30,
         auth_timeout: TypeTimeout = 30,
+        **kwargs,
     ):
-        https_scheme = "https://"
-        http_scheme = "http://"
-        enable_https, certificate_valid = api_endpoint.is_secure_repository(timeout=https_detect_timeout)
-        if enable_https:
-            client = cls(
-                api_base_url=f"{https_scheme}{api_endpoint.api_base_url}",
-                username=username,
-                password=password,
-                verify_certificate=certificate_valid,
-                authenticator_class=authenticator_class,
-                default_timeout=default_timeout,
-                auth_timeout=auth_timeout,
-            )
-            if certificate_valid or client.ping():
-                return client
+        """initial a client to the `api_endpoint`, the scheme will be detected if it is not provided.
+
+        The detection races the TLS probe and the API Version Check over https and http,
+        it takes at most `https_detect_timeout` seconds, see `detect_api_base_url`.
+
+        other keyword arguments (e.g. `pool_config`) are passed to the constructor.
+        """
+        api_base_url, verify_certificate = detect_api_base_url(api_endpoint, timeout=https_detect_timeout)
         return cls(
-            api_base_url=f"{http_scheme}{api_endpoint.api_base_url}",
+            api_base_url=api_base_url,
             username=username,
             password=password,
-            verify_certificate=False,
+            verify_certificate=verify_certificate,
             authenticator_class=authenticator_class,
             default_timeout=default_timeout,
             auth_timeout=auth_timeout,
+            **kwargs,
         )
 
     def __init__(
@@ -66,7 +133,31 @@ class DockerRegistryV2Client:
         authenticator_class: Type[BaseAuthentication] = UniversalAuthentication,
         default_timeout: TypeTimeout = 60 * 10,
         auth_timeout: TypeTimeout = 30,
+        pool_config: Optional[PoolConfig] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        governor: Optional[ConcurrencyGovernor] = None,
+        transport: Optional[Transport] = None,
+        storage_transport: Optional[Transport] = None,
+        metrics: Optional[MetricsCollector] = None,
     ):
+        """
+        :param pool_config: the connection pool settings, the client (and the resources bound to it) can be used
+                            by many threads concurrently, so `pool_maxsize` should be no less than the concurrency.
+        :param retry_policy: the policy to retry the transient failures, use `NoRetry()` to disable retrying.
+        :param rate_limiter: the limiter to pace the requests according to the rate limit headers,
+                             the process-wide `default_rate_limiter` is used by default,
+                             use `NoRateLimit()` to disable it.
+        :param governor: the governor to cap the concurrent operations against the registry,
+                         the process-wide `default_governor` (unlimited unless `set_default_governor` is called)
+                         is used by default.
+        :param transport: the transport to send the requests to the registry, `RequestsTransport` by default.
+                          `pool_config` and `verify_certificate` only apply to the default transport.
+        :param storage_transport: the transport to send the requests to the storage backends
+                                  which the registry redirects to, `RequestsTransport` by default.
+        :param metrics: the collector receiving the metrics of every request, e.g. `HistogramMetrics()`,
+                        nothing is collected by default.
+        """
         if default_timeout is not None and not isinstance(default_timeout, tuple) and isinf(default_timeout):
             raise ValueError("default_timeout should not be infinity.")
         if auth_timeout is not None and not isinstance(auth_timeout, tuple) and isinf(auth_timeout):
@@ -74,21 +165,50 @@ class DockerRegistryV2Client:
         if api_base_url.endswith("/"):
             api_base_url = api_base_url.rstrip("/")
         self.api_base_url = api_base_url
-        self.session = requests.session()
-        self.session.verify = verify_certificate
+        self.pool_config = pool_config or PoolConfig()
+        if transport is None:
+            session = self.pool_config.new_session()
+            session.verify = verify_certificate
+            transport = RequestsTransport(session)
+        self.transport = transport
+        # the session of the transport (if any) is shared with the authorization requests
+        self.session: Optional[requests.Session] = getattr(transport, "session", None)
+        # the storage backends which the registry redirects to have their own pools
+        self.storage_transport = storage_transport or RequestsTransport(self.pool_config.new_session())
+        self.storage_session: Optional[requests.Session] = getattr(self.storage_transport, "session", None)
+        self.redirect_cache = RedirectCache()
         self.default_timeout = default_timeout
         self.auth_timeout = auth_timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.governor = governor or default_governor
+        self.metrics = metrics or NoMetrics()
 
         self.username = username
         self.password = password
         self.authenticator_class = authenticator_class
         self._authed: Optional[AuthorizationProvider] = None
+        # the `www-authenticate` challenge which `_authed` is obtained for
+        self._authed_challenge: Optional[str] = None
+        self._auth_lock = threading.Lock()
+        self.auth_stats = AuthStats()
+
+    def close(self):
+        """close all the pooled connections"""
+        self.transport.close()
+        self.storage_transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def ping(self) -> bool:
         """API Version Check."""
         url = URLBuilder.build_v2_url(self.api_base_url)
         try:
-            self._request(self.session.get, url=url)
+            self._request("GET", url=url)
         except exceptions.RequestError:
             logger.debug("Can't not connect to server<%s>", url)
             return False
@@ -102,54 +222,181 @@ class DockerRegistryV2Client:
 
     @property
     def get(self):
-        return partial(self._request, self.session.get)
+        return partial(self._request, "GET")
 
     @property
     def put(self):
-        return partial(self._request, self.session.put)
+        return partial(self._request, "PUT")
 
     @property
     def patch(self):
-        return partial(self._request, self.session.patch)
+        return partial(self._request, "PATCH")
 
     @property
     def post(self):
-        return partial(self._request, self.session.post)
+        return partial(self._request, "POST")
 
     @property
     def delete(self):
-        return partial(self._request, self.session.delete)
+        return partial(self._request, "DELETE")
 
     @property
     def head(self):
-        return partial(self._request, self.session.head)
+        return partial(self._request, "HEAD")
 
-    def _request(self, method, *, should_retry: bool = True, **kwargs):
+    def _request(
+        self,
+        method: str,
+        *,
+        should_retry: bool = True,
+        idempotent: Optional[bool] = None,
+        retry_transient: bool = True,
+        **kwargs,
+    ):
+        """send the request, transient failures are retried according to the `retry_policy`
+
+        :param should_retry: whether to authenticate and retry if the request is unauthorized.
+        :param idempotent: whether the request can be sent again safely, guess by method and url if not provided.
+        :param retry_transient: whether to retry the transient failures, disable it if the caller retries itself.
+        """
+        self._resolve_timeout(kwargs)
+        headers = kwargs.setdefault("headers", {})
+        operation = get_operation(method, kwargs.get("url", ""))
+        trace = RequestTrace(method, kwargs.get("url", "")) if self.metrics.enabled else None
+        with self.hold(operation):
+            while True:
+                headers["Authorization"] = self.authorization
+                try:
+                    resp = self._validate_response(
+                        self._send(
+                            method, idempotent=idempotent, retry_transient=retry_transient, trace=trace, **kwargs
+                        ),
+                        auto_auth=should_retry,
+                    )
+                except exceptions.RetryAgain:
+                    should_retry = False
+                    if trace is not None:
+                        trace.auth_round_trips += 1
+                    continue
+                except Exception as e:
+                    if trace is not None:
+                        self.metrics.record(trace.finish(error=e, stream=kwargs.get("stream", False)))
+                    raise
+                break
+        if trace is not None:
+            self.metrics.record(trace.finish(stream=kwargs.get("stream", False)))
+        return resp
+
+    def storage_get(self, url: str, **kwargs) -> requests.Response:
+        """GET from the storage backend (e.g. S3, GCS or CDN) which the registry redirects to.
+
+        The storage backends are requested over a dedicated connection pool, and the registry credentials
+        are never sent to them, the signed url is the credential.
+        """
+        self._resolve_timeout(kwargs)
+        trace = RequestTrace("GET", url, route="storage") if self.metrics.enabled else None
+        try:
+            resp = self._send("GET", url=url, transport=self.storage_transport, trace=trace, **kwargs)
+            if not resp.ok:
+                logger.debug("Requesting storage %s, but responded %d", urlparse(url).netloc, resp.status_code)
+                raise exceptions.RequestErrorWithResponse(
+                    "failed to request the storage backend", status_code=resp.status_code, response=resp
+                )
+        except Exception as e:
+            if trace is not None:
+                self.metrics.record(trace.finish(error=e, stream=kwargs.get("stream", False)))
+            raise
+        if trace is not None:
+            self.metrics.record(trace.finish(stream=kwargs.get("stream", False)))
+        return resp
+
+    def _resolve_timeout(self, kwargs: dict):
         # here use inf as a flag to use default timeout
         kwargs.setdefault("timeout", self.default_timeout)
         if kwargs["timeout"] is not None and not isinstance(kwargs["timeout"], tuple) and isinf(kwargs["timeout"]):
             kwargs["timeout"] = self.default_timeout
-        headers = kwargs.setdefault("headers", {})
-        headers["Authorization"] = self.authorization
-        try:
-            resp = self._validate_response(method(**kwargs), auto_auth=should_retry)
-        except exceptions.RetryAgain:
-            return self._request(method, should_retry=False, **kwargs)
+
+    def hold(self, operation: str) -> ContextManager[None]:
+        """hold a slot of the `governor` for the operation against the registry,
+        the requests sent by the same thread in the block won't acquire slots again.
+
+        Usage:
+        >>> with client.hold(BLOB_DOWNLOAD):
+        ...     resp = client.get(url=url, stream=True)
+        ...     body = resp.content
+        """
+        return self.governor.hold(urlparse(self.api_base_url).netloc, operation)
+
+    def _send(
+        self,
+        method: str,
+        *,
+        idempotent: Optional[bool] = None,
+        retry_transient: bool = True,
+        transport: Optional[Transport] = None,
+        trace: Optional[RequestTrace] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """send the request by the transport, retry on transient failures unless `retry_transient` is False"""
+        transport = transport or self.transport
+        policy = self.retry_policy
+        if idempotent is None:
+            idempotent = policy.is_idempotent(method, kwargs.get("url", ""))
+        # the streaming body can not be sent again
+        if hasattr(kwargs.get("data"), "read"):
+            idempotent = False
+
+        rate_limit_key = self._rate_limit_key(kwargs.get("url", ""))
+        attempt = 1
+        while True:
+            self.rate_limiter.acquire(rate_limit_key)
+            try:
+                resp = self._transport_request(transport, method, trace, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not (retry_transient and policy.should_retry(attempt, idempotent=idempotent, error=e)):
+                    raise
+                logger.info("Requesting %s, but %s", kwargs.get("url"), e.__class__.__name__)
+                policy.wait(attempt)
+            else:
+                self.rate_limiter.update(rate_limit_key, resp)
+                if not (retry_transient and policy.should_retry(attempt, idempotent=idempotent, response=resp)):
+                    if resp.ok:
+                        policy.on_success()
+                    return resp
+                logger.info("Requesting %s, but responded %d", resp.request.url, resp.status_code)
+                resp.close()
+                policy.wait(attempt, resp)
+            attempt += 1
+
+    @staticmethod
+    def _transport_request(
+        transport: Transport, method: str, trace: Optional[RequestTrace], **kwargs
+    ) -> requests.Response:
+        if trace is None:
+            return transport.request(method, **kwargs)
+        trace.attempts += 1
+        trace.response = None
+        trace.response = resp = transport.request(method, **kwargs)
         return resp
 
+    def _rate_limit_key(self, url: str) -> Tuple[str, str, str]:
+        # the requests to the same registry with the same credential share the quota,
+        # registries (e.g. Docker Hub) may only limit some kinds of routes, so they are paced separately
+        netloc = urlparse(url).netloc or urlparse(self.api_base_url).netloc
+        return netloc, self.username or "", get_route_kind(url)
+
     def _validate_response(self, resp: requests.Response, auto_auth: bool = True) -> requests.Response:
+        if resp.ok:
+            return resp
+
         url = resp.request.url
-        try:
-            curl = curlify.to_curl(resp.request)
-        except Exception:
-            curl = "<unknown>"
+        # the curl command is only rendered if the log record is emitted
+        curl = LazyCurl(resp.request)
 
         if resp.status_code == 401:
             if auto_auth:
-                www_authenticate = resp.headers["www-authenticate"]
-                auth = self.authenticator_class(www_authenticate)
-                self._authed = auth.authenticate(
-                    username=self.username, password=self.password, timeout=self.auth_timeout
+                self._refresh_authorization(
+                    resp.headers["www-authenticate"], stale=resp.request.headers.get("Authorization", "")
                 )
                 raise exceptions.RetryAgain
 
@@ -167,10 +414,28 @@ class DockerRegistryV2Client:
             logger.info("Requesting %s, but ResourceNotFound, Equivalent curl command: %s", url, curl)
             raise exceptions.ResourceNotFound
 
-        if not resp.ok:
-            logger.warning("Requesting %s, but Response Not OK, Equivalent curl command: %s", url, curl)
-            raise exceptions.RequestErrorWithResponse(message=resp.text, status_code=resp.status_code, response=resp)
-        return resp
+        logger.warning("Requesting %s, but Response Not OK, Equivalent curl command: %s", url, curl)
+        raise exceptions.RequestErrorWithResponse(message=resp.text, status_code=resp.status_code, response=resp)
+
+    def _refresh_authorization(self, www_authenticate: str, stale: str):
+        """authenticate for the challenge, unless another thread has done it while this request was in flight"""
+        with self._auth_lock:
+            if self._authed_challenge == www_authenticate and self.authorization != stale:
+                return
+            auth = self.authenticator_class(www_authenticate)
+            # route the requests to the authorization service through the pooled connections
+            auth.session = self.session
+            start = time.perf_counter()
+            try:
+                with start_span("registry.auth", endpoint=self.api_base_url):
+                    self._authed = auth.authenticate(
+                        username=self.username, password=self.password, timeout=self.auth_timeout
+                    )
+            finally:
+                elapsed = time.perf_counter() - start
+                self.auth_stats.record(elapsed)
+                logger.debug("authentication for <%s> took %.3fs", self.api_base_url, elapsed)
+            self._authed_challenge = www_authenticate
 
 
 class URLBuilder:
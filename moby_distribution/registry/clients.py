@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple, Type
+
+from moby_distribution.registry.auth import BaseAuthentication, UniversalAuthentication
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.singleflight import SingleFlight
+from moby_distribution.spec.endpoint import OFFICIAL_ENDPOINT, APIEndpoint
+
+
+class ClientPool:
+    """ClientPool shares the clients across the callers using the same registry and credential,
+    so the scheme detection, the pooled connections and the authorization tokens are reused.
+
+    The clients are keyed by (endpoint, username, password, authenticator_class and the other constructor
+    arguments), the password is hashed in the key, so a caller never gets a client authorized by another password.
+
+    :param max_size: the max number of clients to keep, the least recently used ones are evicted.
+    :param idle_timeout: the clients not used in `idle_timeout` seconds are evicted.
+
+    The evicted clients are closed (except the ones with a transport given by the caller), a caller still holding
+    an evicted client can keep using it, the connections will be re-established on demand.
+
+    Usage:
+    >>> client = default_client_pool.get(APIEndpoint(url="registry.example.com"), username="u", password="p")
+    """
+
+    def __init__(self, max_size: int = 64, idle_timeout: float = 600, clock=time.monotonic):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (client, last used at, whether to close the client on eviction)
+        self._clients: "OrderedDict[Hashable, Tuple[DockerRegistryV2Client, float, bool]]" = OrderedDict()
+        self._creating = SingleFlight()
+
+    def get(
+        self,
+        api_endpoint: APIEndpoint = OFFICIAL_ENDPOINT,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        authenticator_class: Type[BaseAuthentication] = UniversalAuthentication,
+        **kwargs,
+    ) -> DockerRegistryV2Client:
+        """return the shared client, create it by `DockerRegistryV2Client.from_api_endpoint` if missing.
+
+        other keyword arguments are passed to `from_api_endpoint`, they should be hashable.
+        """
+        password_hash = hashlib.sha256(password.encode()).hexdigest() if password is not None else None
+        key = (api_endpoint.url, username, password_hash, authenticator_class, tuple(sorted(kwargs.items())))
+        with self._lock:
+            client, expired = self._checkout(key)
+        self._close(expired)
+        if client is not None:
+            return client
+
+        def create() -> DockerRegistryV2Client:
+            client = DockerRegistryV2Client.from_api_endpoint(
+                api_endpoint, username=username, password=password, authenticator_class=authenticator_class, **kwargs
+            )
+            # the transports given by the caller are not owned by the pool
+            owned = kwargs.get("transport") is None and kwargs.get("storage_transport") is None
+            with self._lock:
+                self._clients[key] = (client, self.clock(), owned)
+                evicted = self._evict()
+            self._close(evicted)
+            return client
+
+        return self._creating.do(key, create)
+
+    def _checkout(self, key: Hashable) -> Tuple[Optional[DockerRegistryV2Client], List[DockerRegistryV2Client]]:
+        """return the live client of `key` if any, and the idle expired one to close"""
+        entry = self._clients.get(key)
+        if entry is None:
+            return None, []
+        client, last_used_at, owned = entry
+        if self.clock() - last_used_at >= self.idle_timeout:
+            del self._clients[key]
+            return None, [client] if owned else []
+        self._clients[key] = (client, self.clock(), owned)
+        self._clients.move_to_end(key)
+        return client, []
+
+    def _evict(self) -> List[DockerRegistryV2Client]:
+        """drop the idle clients and the least recently used ones beyond `max_size`, return the ones to close"""
+        evicted = []
+        now = self.clock()
+        for key, (_, last_used_at, _) in list(self._clients.items()):
+            if now - last_used_at >= self.idle_timeout:
+                evicted.append(self._clients.pop(key))
+        while len(self._clients) > self.max_size:
+            evicted.append(self._clients.popitem(last=False)[1])
+        return [client for client, _, owned in evicted if owned]
+
+    @staticmethod
+    def _close(clients: List[DockerRegistryV2Client]):
+        for client in clients:
+            client.close()
+
+    def evict_idle(self):
+        """close and drop the idle clients"""
+        with self._lock:
+            evicted = self._evict()
+        self._close(evicted)
+
+    def clear(self):
+        """close and drop all the clients"""
+        with self._lock:
+            evicted = [client for client, _, owned in self._clients.values() if owned]
+            self._clients.clear()
+        self._close(evicted)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+default_client_pool = ClientPool()
@@ -0,0 +1,118 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple, cast
+
+from moby_distribution.registry.utils import LazyProxy, get_route_kind
+
+BLOB_UPLOAD = "blob_upload"
+BLOB_DOWNLOAD = "blob_download"
+MANIFEST = "manifest"
+OTHER = "other"
+
+DEFAULT_OPERATION_LIMITS: Dict[str, int] = {BLOB_UPLOAD: 8, BLOB_DOWNLOAD: 8, MANIFEST: 16}
+
+
+def get_operation(method: str, url: str) -> str:
+    """return the type of the operation which the request performs
+
+    Usage:
+    >>> get_operation("PATCH", "https://registry/v2/library/python/blobs/uploads/uuid")
+    'blob_upload'
+
+    >>> get_operation("HEAD", "https://registry/v2/library/python/blobs/sha256:x")
+    'other'
+    """
+    kind = get_route_kind(url)
+    if kind == "manifests":
+        return MANIFEST
+    if kind == "blobs":
+        method = method.upper()
+        if method == "GET":
+            return BLOB_DOWNLOAD
+        if method in ("POST", "PATCH", "PUT"):
+            return BLOB_UPLOAD
+    return OTHER
+
+
+class ConcurrencyGovernor:
+    """ConcurrencyGovernor caps the concurrent operations against each registry host,
+    no matter how many clients or thread pools are sending the requests.
+
+    A slot of the operation type and then a slot of the host are held by each operation. The holds are reentrant
+    in the same thread: a slot already held by the thread is not acquired again, so an operation holding
+    its slots (e.g. downloading a blob while streaming the body) can send the nested requests of the same type,
+    while a nested operation of another type still waits for a slot of its type.
+
+    The process-wide `default_governor` is unlimited unless it is configured by `set_default_governor`,
+    `ConcurrencyGovernor()` has the recommended limits: 32 operations per host, of which at most 8 blob uploads,
+    8 blob downloads and 16 manifest operations.
+
+    :param per_host: the max number of concurrent operations against a host, None means unlimited.
+    :param per_operation: the max number of concurrent operations of each type against a host,
+                          the types absent are unlimited.
+    """
+
+    def __init__(self, per_host: Optional[int] = 32, per_operation: Optional[Dict[str, int]] = None):
+        self.per_host = per_host
+        self.per_operation = dict(DEFAULT_OPERATION_LIMITS if per_operation is None else per_operation)
+        self._semaphores: Dict[Tuple[str, str], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_semaphore(self, host: str, operation: Optional[str]) -> Optional[threading.BoundedSemaphore]:
+        limit = self.per_host if operation is None else self.per_operation.get(operation)
+        if limit is None:
+            return None
+        key = (host, operation or "")
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = self._semaphores[key] = threading.BoundedSemaphore(limit)
+            return semaphore
+
+    @property
+    def _held(self) -> Set[Tuple[str, Optional[str]]]:
+        """the slots held by the current thread, (host, operation) for the operation slots and (host, None)
+        for the host slots
+        """
+        if not hasattr(self._local, "held"):
+            self._local.held = set()
+        return self._local.held
+
+    @contextmanager
+    def hold(self, host: str, operation: str) -> Iterator[None]:
+        """hold a slot for the operation against the host, block until the slot is available"""
+        held = self._held
+        acquired: List[Tuple[Tuple[str, Optional[str]], Optional[threading.BoundedSemaphore]]] = []
+        try:
+            # the slot of the operation type first, so the operations queued behind a saturated type never hold
+            # the slots of the host and block the other types (e.g. the manifests behind the uploads)
+            for key in ((host, operation), (host, None)):
+                if key in held:
+                    continue
+                semaphore = self._get_semaphore(*key)
+                if semaphore is not None:
+                    semaphore.acquire()
+                held.add(key)
+                acquired.append((key, semaphore))
+            yield
+        finally:
+            for key, semaphore in reversed(acquired):
+                held.discard(key)
+                if semaphore is not None:
+                    semaphore.release()
+
+
+class NoConcurrencyLimit(ConcurrencyGovernor):
+    """the governor never blocks"""
+
+    def __init__(self):
+        super().__init__(per_host=None, per_operation={})
+
+
+default_governor = cast(ConcurrencyGovernor, LazyProxy(NoConcurrencyLimit))
+
+
+def set_default_governor(governor: ConcurrencyGovernor):
+    """set the governor shared by the clients created without `governor`, e.g. `ConcurrencyGovernor()`"""
+    default_governor.__dict__["_wrapped"] = governor
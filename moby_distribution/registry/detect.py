@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from moby_distribution.registry.cache import EndpointStatus, cache_endpoint_status, default_endpoint_status_cache
+from moby_distribution.spec.endpoint import APIEndpoint
+
+logger = logging.getLogger(__name__)
+
+_PROBE = "probe"
+_HTTPS = "https"
+_HTTP = "http"
+
+
+@cache_endpoint_status
+def probe_endpoint(api_endpoint: APIEndpoint, *, timeout: Optional[float] = None) -> EndpointStatus:
+    """the TLS probe of `APIEndpoint.is_secure_repository`, the results are cached"""
+    return api_endpoint.is_secure_repository(timeout=timeout)
+
+
+def ping_v2(api_base_url: str, timeout: Optional[float] = None) -> Optional[bool]:
+    """check whether the registry API is served at `api_base_url` without authentication.
+
+    returns whether the certificate is valid (always True over http), or None if the API is unreachable.
+    """
+    url = f"{api_base_url}/v2/"
+    with requests.Session() as session:
+        for verify in (True, False):
+            session.verify = verify
+            try:
+                resp = session.get(url, timeout=timeout, allow_redirects=False)
+            except requests.exceptions.SSLError:
+                continue
+            except requests.exceptions.RequestException:
+                return None
+            # the API Version Check answers 401 if authentication is required
+            return verify if resp.status_code in (200, 401) else None
+    return None
+
+
+def _decide(api_endpoint: APIEndpoint, outcomes: Dict[str, Any], final: bool) -> Optional[Tuple[str, bool]]:
+    """pick the most preferred scheme which is confirmed, once the more preferred ones are ruled out.
+
+    The preference is https with a valid certificate, https with an invalid certificate, and then http.
+    http is picked only if it is confirmed or https is ruled out, otherwise https is picked when `final`.
+    """
+    https_url = f"https://{api_endpoint.get_base_url(secure=True)}"
+    http_url = f"http://{api_endpoint.get_base_url(secure=False)}"
+    probe, https, http = outcomes.get(_PROBE), outcomes.get(_HTTPS), outcomes.get(_HTTP)
+
+    if probe == (True, True) or https is True:
+        return https_url, True
+    if https is False:
+        return https_url, False
+    if probe == (False, False):
+        return http_url, False
+    if _HTTPS in outcomes and https is None and (http is True or _PROBE in outcomes or final):
+        # https is unreachable
+        return http_url, False
+    if final:
+        if probe == (True, False):
+            # ssl is served, e.g. the cached or primed status of a registry with a self-signed certificate
+            return https_url, False
+        if http is True:
+            # https didn't answer in time, but the API is confirmed over http
+            return http_url, False
+        # nothing confirmed in time, never send the credentials over an unconfirmed http
+        return https_url, True
+    return None
+
+
+def detect_api_base_url(api_endpoint: APIEndpoint, timeout: float = 30) -> Tuple[str, bool]:
+    """detect the scheme of the endpoint, return the api base url and whether to verify the certificate.
+
+    The TLS probe (`probe_endpoint`), the API Version Check over https and over http are raced
+    (like happy eyeballs) under one deadline, the most preferred scheme is picked as soon as it is confirmed,
+    the stragglers keep running in the background and their results are dropped.
+    """
+    status = default_endpoint_status_cache.get(api_endpoint.url)
+    if status is not None:
+        return _decide(api_endpoint, {_PROBE: status}, final=True)  # type: ignore
+
+    outcomes: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+    def run(name: str, func: Callable[[], Any]):
+        try:
+            outcome = func()
+        except Exception as e:
+            logger.debug("failed to detect %s of %s: %s", name, api_endpoint.url, e)
+            outcome = e
+        outcomes.put((name, outcome))
+
+    racers = {
+        _PROBE: lambda: probe_endpoint(api_endpoint, timeout=timeout),
+        _HTTPS: lambda: ping_v2(f"https://{api_endpoint.get_base_url(secure=True)}", timeout=timeout),
+        _HTTP: lambda: ping_v2(f"http://{api_endpoint.get_base_url(secure=False)}", timeout=timeout),
+    }
+    for name, func in racers.items():
+        threading.Thread(target=run, args=(name, func), name=f"detect-{name}", daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    known: Dict[str, Any] = {}
+    while len(known) < len(racers):
+        decision = _decide(api_endpoint, known, final=False)
+        if decision is not None:
+            return decision
+        try:
+            name, outcome = outcomes.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            logger.warning("detecting the scheme of %s timed out", api_endpoint.url)
+            break
+        known[name] = outcome
+    return _decide(api_endpoint, known, final=True)  # type: ignore
@@ -37,3 +37,13 @@ class ResourceNotFound(Exception):
 
 class UnSupportMediaType(Exception):
     """raise when the media type is unsupported"""
+
+
+class TransferStalled(Exception):
+    """raise when the throughput of a transfer stays below the minimum, see also `StallPolicy`"""
+
+    def __init__(self, name: str, rate: float, min_rate: float):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        super().__init__(f"transfer of {name} stalled: {rate:.0f} B/s < {min_rate:.0f} B/s")
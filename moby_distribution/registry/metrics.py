@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from moby_distribution.registry.utils import get_route_template
+
+
+class RequestEvent(NamedTuple):
+    """the metrics of a request sent by `DockerRegistryV2Client`, including its retries and re-authorization"""
+
+    method: str
+    # the route template, e.g. `blobs/{digest}`, or `storage` for the storage backends
+    route: str
+    host: str
+    # None if no response is received
+    status: Optional[int]
+    # the class name of the exception raised, if any
+    error: Optional[str]
+    bytes_sent: int
+    # the Content-Length is used for the streaming responses, whose body is consumed by the caller
+    bytes_received: int
+    # the seconds from sending the first attempt to receiving the final response
+    latency: float
+    # the times the request was sent again because of transient failures
+    retries: int
+    # the times the request was sent again after (re)authorization
+    auth_round_trips: int
+
+
+class RequestTrace:
+    """collect the facts of a request in flight, which are emitted as a `RequestEvent`"""
+
+    __slots__ = ("method", "url", "route", "start", "attempts", "auth_round_trips", "response")
+
+    def __init__(self, method: str, url: str, route: Optional[str] = None):
+        self.method = method
+        self.url = url
+        self.route = route or get_route_template(url)
+        self.start = time.perf_counter()
+        self.attempts = 0
+        self.auth_round_trips = 0
+        self.response: Optional[requests.Response] = None
+
+    def finish(self, error: Optional[BaseException] = None, stream: bool = False) -> RequestEvent:
+        latency = time.perf_counter() - self.start
+        resp = self.response
+        bytes_sent = bytes_received = 0
+        if resp is not None:
+            request = resp.request
+            bytes_sent = _content_length(request.headers) if request is not None else 0
+            if request is not None and request.method == "HEAD":
+                bytes_received = 0
+            elif stream:
+                bytes_received = _content_length(resp.headers)
+            else:
+                bytes_received = len(resp.content or b"")
+        return RequestEvent(
+            method=self.method,
+            route=self.route,
+            host=urlparse(self.url).netloc,
+            status=resp.status_code if resp is not None else None,
+            error=error.__class__.__name__ if error is not None else None,
+            bytes_sent=bytes_sent,
+            bytes_received=bytes_received,
+            latency=latency,
+            retries=max(self.attempts - 1 - self.auth_round_trips, 0),
+            auth_round_trips=self.auth_round_trips,
+        )
+
+
+def _content_length(headers) -> int:
+    try:
+        return int((headers or {}).get("Content-Length") or 0)
+    except ValueError:
+        return 0
+
+
+class MetricsCollector:
+    """MetricsCollector receives the `RequestEvent` of every request sent by `DockerRegistryV2Client`.
+
+    `record` is called by the thread which sends the request, it should be fast and thread-safe.
+    """
+
+    # the events are not built at all if False
+    enabled = True
+
+    def record(self, event: RequestEvent):
+        raise NotImplementedError
+
+
+class NoMetrics(MetricsCollector):
+    enabled = False
+
+    def record(self, event: RequestEvent):
+        pass
+
+
+# 1ms, 2ms, 4ms ... about 65s
+DEFAULT_LATENCY_BOUNDS = tuple(0.001 * 2**i for i in range(17))
+
+
+class Histogram:
+    """a histogram with fixed buckets, the quantiles are estimated by the upper bound of the bucket"""
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BOUNDS):
+        self.bounds = list(bounds)
+        # the last one counts the values beyond the bounds
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+
+class RouteStats:
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BOUNDS):
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.auth_round_trips = 0
+        self.latency = Histogram(bounds)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.latency.count,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "retries": self.retries,
+            "auth_round_trips": self.auth_round_trips,
+            "latency_avg": self.latency.sum / self.latency.count if self.latency.count else 0.0,
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p90": self.latency.quantile(0.9),
+            "latency_p99": self.latency.quantile(0.99),
+            "latency_max": self.latency.max,
+        }
+
+
+class HistogramMetrics(MetricsCollector):
+    """HistogramMetrics aggregates the events in memory by (method, route, status class),
+    e.g. `GET blobs/{digest} 2xx`, the status class is `error` if no response is received.
+
+    Usage:
+    >>> metrics = HistogramMetrics()
+    >>> client = DockerRegistryV2Client.from_api_endpoint(OFFICIAL_ENDPOINT, metrics=metrics)
+    >>> metrics.snapshot()["GET manifests/{reference} 2xx"]["latency_p99"]
+    """
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BOUNDS):
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str, str], RouteStats] = {}
+
+    def record(self, event: RequestEvent):
+        status_class = f"{event.status // 100}xx" if event.status is not None else "error"
+        key = (event.method, event.route, status_class)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = RouteStats(self.bounds)
+            if event.error is not None:
+                stats.errors += 1
+            stats.bytes_sent += event.bytes_sent
+            stats.bytes_received += event.bytes_received
+            stats.retries += event.retries
+            stats.auth_round_trips += event.auth_round_trips
+            stats.latency.observe(event.latency)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """return the aggregated metrics keyed by `{method} {route} {status class}`"""
+        with self._lock:
+            return {" ".join(key): stats.to_dict() for key, stats in sorted(self._stats.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+from moby_distribution.registry.exceptions import TransferStalled
+
+
+class TransferProgress(NamedTuple):
+    """the progress of a transfer, the transfer of a blob is named by its digest,
+    the transfer of an image (the sum of its blobs) is named `{repo}:{reference}`.
+    """
+
+    name: str
+    bytes_done: int
+    # None if the size is unknown in advance
+    total: Optional[int]
+    # bytes per second since the previous report
+    rate: float
+    # bytes per second since the transfer started
+    average_rate: float
+    elapsed: float
+    finished: bool
+
+    @property
+    def fraction(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return min(self.bytes_done / self.total, 1.0)
+
+
+class ProgressObserver:
+    """ProgressObserver receives the progress of the transfers, implement the hooks to report it (e.g. to update a UI).
+
+    The hooks are called by the threads which run the transfers (e.g. the layers of an image are uploaded
+    concurrently), at most once every `TransferMeter.interval` seconds for each transfer, and once when it finishes.
+    """
+
+    def on_progress(self, progress: TransferProgress):
+        """the progress of a blob"""
+
+    def on_image_progress(self, progress: TransferProgress):
+        """the progress of an image, aggregated from its blobs"""
+
+
+class StallPolicy(NamedTuple):
+    """abort the transfer by raising `TransferStalled` if its throughput stays below `min_rate`
+    (bytes per second) over the last `window` seconds.
+
+    The throughput is checked when the bytes are transferred, a transfer which receives no byte at all
+    is aborted by the read timeout of the client instead.
+    """
+
+    min_rate: float
+    window: float = 30
+
+
+class TransferMeter:
+    """TransferMeter counts the bytes of a transfer, reports the progress and detects the stall.
+
+    Usage:
+    >>> meter = TransferMeter(digest, total=size, callback=print)
+    >>> for chunk in resp.iter_content(chunk_size=1024):
+    ...     fh.write(chunk)
+    ...     meter.update(len(chunk))
+    >>> meter.finish()
+
+    :param callback: called with the `TransferProgress` at most once every `interval` seconds, and when finished.
+    :param stall_policy: raise `TransferStalled` from `update` if the transfer stalls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        total: Optional[int] = None,
+        callback: Optional[Callable[[TransferProgress], None]] = None,
+        stall_policy: Optional[StallPolicy] = None,
+        *,
+        interval: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.total = total
+        self.callback = callback
+        self.stall_policy = stall_policy
+        self.interval = interval
+        self.clock = clock
+        self.bytes_done = 0
+        self.start = clock()
+        self._lock = threading.Lock()
+        self._last_sample: Tuple[float, int] = (self.start, 0)
+        # the samples in the stall window, the oldest one is just before the window
+        self._samples: Deque[Tuple[float, int]] = deque([self._last_sample])
+
+    def update(self, n: int):
+        """count `n` bytes transferred
+
+        :raise TransferStalled: if the throughput stays below the minimum of the stall policy.
+        """
+        now = self.clock()
+        with self._lock:
+            self.bytes_done += n
+            if now - self._last_sample[0] < self.interval:
+                return
+            stalled_rate = self._stalled_rate(now)
+            progress = self._sample(now, finished=False)
+        if self.callback is not None:
+            self.callback(progress)
+        if stalled_rate is not None:
+            raise TransferStalled(self.name, stalled_rate, self.stall_policy.min_rate)  # type: ignore
+
+    def finish(self) -> TransferProgress:
+        with self._lock:
+            progress = self._sample(self.clock(), finished=True)
+        if self.callback is not None:
+            self.callback(progress)
+        return progress
+
+    def _sample(self, now: float, finished: bool) -> TransferProgress:
+        last_time, last_bytes = self._last_sample
+        elapsed = now - self.start
+        progress = TransferProgress(
+            name=self.name,
+            bytes_done=self.bytes_done,
+            total=self.total,
+            rate=(self.bytes_done - last_bytes) / (now - last_time) if now > last_time else 0.0,
+            average_rate=self.bytes_done / elapsed if elapsed > 0 else 0.0,
+            elapsed=elapsed,
+            finished=finished,
+        )
+        self._last_sample = (now, self.bytes_done)
+        if self.stall_policy is not None:
+            self._samples.append(self._last_sample)
+        return progress
+
+    def _stalled_rate(self, now: float) -> Optional[float]:
+        """return the throughput over the stall window if it is below the minimum"""
+        policy = self.stall_policy
+        if policy is None or now - self.start < policy.window:
+            return None
+        while len(self._samples) > 1 and self._samples[1][0] <= now - policy.window:
+            self._samples.popleft()
+        since, bytes_done = self._samples[0]
+        if now <= since:
+            return None
+        rate = (self.bytes_done - bytes_done) / (now - since)
+        if rate < policy.min_rate:
+            return rate
+        return None
+
+
+class ImageProgress(ProgressObserver):
+    """ImageProgress forwards the progress of the blobs of an image to `observer`,
+    and reports the progress of the image, aggregated from the blobs, to `observer.on_image_progress`.
+    """
+
+    def __init__(self, name: str, observer: ProgressObserver, total: Optional[int] = None, **kwargs):
+        self.observer = observer
+        self.meter = TransferMeter(name, total=total, callback=observer.on_image_progress, **kwargs)
+        self._lock = threading.Lock()
+        self._bytes_done: Dict[str, int] = {}
+
+    def on_progress(self, progress: TransferProgress):
+        with self._lock:
+            delta = progress.bytes_done - self._bytes_done.get(progress.name, 0)
+            self._bytes_done[progress.name] = progress.bytes_done
+        self.observer.on_progress(progress)
+        self.meter.update(delta)
+
+    def finish(self) -> TransferProgress:
+        return self.meter.finish()
+
+
+def new_transfer_meter(
+    name: str,
+    total: Optional[int],
+    observer: Optional[ProgressObserver],
+    stall_policy: Optional[StallPolicy],
+) -> Optional[TransferMeter]:
+    """return None if neither the progress nor the stall is watched, so nothing is counted at all"""
+    if observer is None and stall_policy is None:
+        return None
+    return TransferMeter(
+        name, total=total, callback=observer.on_progress if observer is not None else None, stall_policy=stall_policy
+    )
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+import requests
+
+from moby_distribution.registry.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitInfo(NamedTuple):
+    """the quota responded by the registry
+
+    :param limit: the max number of requests in a window.
+    :param remaining: the number of requests left in the current window.
+    :param window: the length of the window (in seconds).
+    """
+
+    limit: int
+    remaining: int
+    window: float
+
+
+def _parse_quota(value: str) -> Tuple[int, Optional[float]]:
+    """parse the quota header like `100;w=21600`, return the quota and the window (if provided)"""
+    quota, *params = value.split(";")
+    window = None
+    for param in params:
+        key, _, v = param.strip().partition("=")
+        if key == "w":
+            window = float(v)
+    return int(quota.strip()), window
+
+
+def parse_rate_limit(response: requests.Response, default_window: float = 60) -> Optional[RateLimitInfo]:
+    """parse the rate limit headers of the response, return None if absent or malformed.
+
+    Both the headers of Docker Hub (`RateLimit-Limit: 100;w=21600`) and the ones of IETF draft
+    (`RateLimit-Limit: 100`, `RateLimit-Reset: 30`) are supported, `X-RateLimit-*` are accepted as well.
+    """
+    headers = response.headers
+    for prefix in ("RateLimit-", "X-RateLimit-"):
+        limit_value = headers.get(prefix + "Limit")
+        remaining_value = headers.get(prefix + "Remaining")
+        if limit_value and remaining_value:
+            break
+    else:
+        return None
+
+    try:
+        limit, window = _parse_quota(limit_value)
+        remaining, remaining_window = _parse_quota(remaining_value)
+        reset = headers.get(prefix + "Reset")
+        window = window or remaining_window or (float(reset) if reset else None) or default_window
+    except ValueError:
+        logger.debug("malformed rate limit headers: %s, %s", limit_value, remaining_value)
+        return None
+    if limit <= 0 or window <= 0:
+        return None
+    return RateLimitInfo(limit=limit, remaining=max(0, remaining), window=window)
+
+
+class TokenBucket:
+    """TokenBucket paces the requests sharing a quota.
+
+    The bucket is unlimited until it learns the quota from the responses, then it holds the remaining requests
+    as tokens, which are refilled at the rate of `limit / window`. The callers reserve tokens in order,
+    so the waiting callers are served fairly.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.rate: Optional[float] = None
+        self.capacity: float = 0
+        self._tokens: float = 0
+        self._updated_at = clock()
+        self._blocked_until: float = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def update(self, info: RateLimitInfo):
+        """synchronize the bucket with the quota responded by the registry"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.rate = info.limit / info.window
+            self.capacity = info.limit
+            # the registry is the source of truth, but the tokens reserved by the in-flight requests
+            # are not counted by the registry yet
+            self._tokens = min(self._tokens, info.remaining) if self._tokens < 0 else info.remaining
+
+    def block(self, seconds: float):
+        """block all the callers for seconds, e.g. the registry responds 429 with `Retry-After`"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+
+    def reserve(self) -> float:
+        """reserve a token, return the seconds to wait before sending the request"""
+        with self._lock:
+            now = self.clock()
+            delay = max(0.0, self._blocked_until - now)
+            if self.rate is None:
+                return delay
+            self._refill(now)
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay = max(delay, -self._tokens / self.rate)
+            return delay
+
+    def cancel(self):
+        """give back the token reserved"""
+        with self._lock:
+            if self.rate is not None:
+                self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class RateLimiter:
+    """RateLimiter paces the requests to registries according to the rate limit headers.
+
+    A bucket is maintained for each key (the registry, the credential and the kind of route), the buckets
+    are shared by all the clients (and the threads using them) with the same key, so parallel pulls
+    slow down together instead of slamming into 429.
+
+    :param max_wait: never wait longer than it (in seconds) for a request, then the request is sent anyway
+                     and the registry decides whether to reject it. It is short by default, so an exhausted
+                     long-window quota (e.g. `100;w=21600` of Docker Hub) surfaces as a 429 quickly, whose backoff
+                     is driven by the retry policy, instead of hanging every request.
+    """
+
+    def __init__(self, max_wait: float = 5, clock=time.monotonic):
+        self.max_wait = max_wait
+        self.clock = clock
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, key: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(clock=self.clock)
+            return bucket
+
+    def acquire(self, key: Hashable):
+        """wait until the request identified by key is allowed to be sent"""
+        bucket = self.get_bucket(key)
+        delay = bucket.reserve()
+        if delay <= 0:
+            return
+        if delay > self.max_wait:
+            logger.warning("rate limited for %s, need to wait %.0fs, wait %.0fs at most", key, delay, self.max_wait)
+            bucket.cancel()
+            delay = self.max_wait
+        logger.debug("rate limited for %s, waiting %.2fs", key, delay)
+        self.sleep(delay)
+
+    def update(self, key: Hashable, response: requests.Response):
+        """learn the quota from the response"""
+        info = parse_rate_limit(response)
+        if info is not None:
+            self.get_bucket(key).update(info)
+        if response.status_code == 429:
+            retry_after = RetryPolicy.retry_after(response)
+            if retry_after > 0:
+                self.get_bucket(key).block(min(retry_after, self.max_wait))
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class NoRateLimit(RateLimiter):
+    """the limiter never waits"""
+
+    def acquire(self, key: Hashable):
+        return
+
+    def update(self, key: Hashable, response: requests.Response):
+        return
+
+
+default_rate_limiter = RateLimiter()
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Hashable, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+
+def _parse_compact_datetime(value: str) -> float:
+    """parse the datetime like `20240101T000000Z` used by the signed urls of S3 and GCS"""
+    return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+def get_signed_url_expiry(url: str) -> Optional[float]:
+    """return the expiry (unix timestamp) of the signed url, None if unknown.
+
+    The signed urls of S3 (`X-Amz-Date` + `X-Amz-Expires` or `Expires`), GCS (`X-Goog-Date` + `X-Goog-Expires`
+    or `Expires`), Azure Blob (`se`) and CloudFront (`Expires`) are supported.
+    """
+    params = {k.lower(): v for k, v in parse_qsl(urlparse(url).query)}
+    try:
+        for prefix in ("x-amz-", "x-goog-"):
+            if prefix + "date" in params and prefix + "expires" in params:
+                return _parse_compact_datetime(params[prefix + "date"]) + float(params[prefix + "expires"])
+        if "expires" in params:
+            return float(params["expires"])
+        if "se" in params:
+            return datetime.fromisoformat(params["se"].replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+    return None
+
+
+class RedirectCache:
+    """RedirectCache keeps the signed urls of the storage backends which the registry redirects the blob requests to,
+    so the requests of the same blob go to the storage backend directly in the validity window of the url.
+
+    :param margin: the url is considered expired `margin` seconds in advance, to leave time for the transfer to start.
+    :param default_ttl: the seconds to keep the urls whose expiry is unknown, 0 means not to keep them.
+    :param max_entries: the max number of urls to keep, the least recently used ones are dropped.
+    """
+
+    def __init__(self, margin: float = 30, default_ttl: float = 0, max_entries: int = 1024, clock=time.time):
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+
+    def put(self, key: Hashable, url: str):
+        expiry = get_signed_url_expiry(url)
+        if expiry is None:
+            expiry = self.clock() + self.default_ttl
+        expires_at = expiry - self.margin
+        if expires_at <= self.clock():
+            return
+
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
@@ -1,19 +1,36 @@
 import hashlib
 import io
+import logging
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
-from typing import IO, Optional, Tuple, Union
-from urllib.parse import urlparse
+from typing import IO, Callable, Dict, Iterable, Optional, Tuple, TypeVar, Union
+from urllib.parse import urljoin, urlparse
+
+import requests
 
 from moby_distribution.registry import exceptions
 from moby_distribution.registry.client import DockerRegistryV2Client, URLBuilder, default_client
+from moby_distribution.registry.concurrency import BLOB_DOWNLOAD, BLOB_UPLOAD
+from moby_distribution.registry.progress import ProgressObserver, StallPolicy, TransferMeter, new_transfer_meter
 from moby_distribution.registry.resources import RepositoryResource
+from moby_distribution.registry.singleflight import default_singleflight
+from moby_distribution.registry.tracing import propagate, start_span
 from moby_distribution.registry.utils import TypeTimeout
 from moby_distribution.spec.base import Descriptor
 
+T = TypeVar("T")
+logger = logging.getLogger(__name__)
+
 
 class Blob(RepositoryResource):
+    """Blob is used to transfer the blobs (layers, config, etc.) from or to the registry
+
+    :param progress: the observer of the progress of `download` and `upload`.
+    :param stall_policy: abort `download` and `upload` by raising `TransferStalled` if the throughput is too low.
+    """
+
     def __init__(
         self,
         repo: str,
@@ -23,6 +40,8 @@ class Blob(RepositoryResource):
         client: DockerRegistryV2Client = default_client,
         *,
         timeout: TypeTimeout = None,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
     ):
         super().__init__(repo, client, timeout=timeout)
         if isinstance(local_path, str):
@@ -31,6 +50,8 @@ class Blob(RepositoryResource):
         self.digest = digest
         self.local_path = local_path
         self.fileobj = fileobj
+        self.progress = progress
+        self.stall_policy = stall_policy
         self._accessor = None
 
     @property
@@ -45,9 +66,16 @@ class Blob(RepositoryResource):
         if digest is None:
             raise RuntimeError("unknown digest")
 
+        return self._coalesce("stat", digest, lambda: self._stat(digest))
+
+    def _stat(self, digest: str) -> Descriptor:
         url = URLBuilder.build_blobs_url(self.client.api_base_url, repo=self.repo, digest=digest)
         resp = self.client.head(url=url, timeout=self.timeout)
         headers = resp.headers
+        if resp.is_redirect:
+            location = urljoin(url, headers["Location"])
+            if urlparse(location).netloc != urlparse(url).netloc:
+                self.client.redirect_cache.put((self.repo, digest), location)
         return Descriptor(
             # Content-Type: application/octet-stream
             mediaType=headers["Content-Type"],
@@ -57,28 +85,177 @@ class Blob(RepositoryResource):
             urls=[headers.get("Location", url)],
         )
 
+    def _new_meter(self, total: Optional[int]) -> Optional[TransferMeter]:
+        name = self.digest or str(self.local_path or "blob")
+        return new_transfer_meter(name, total, self.progress, self.stall_policy)
+
+    def _coalesce(self, operation: str, digest: str, func: Callable[[], T]) -> T:
+        """the concurrent operations on the same blob share one request and its result
+
+        the key includes the credential (the password is hashed, like `ClientPool`), so a caller never shares the
+        result of a request authorized by another password.
+        """
+        password = self.client.password
+        password_hash = hashlib.sha256(password.encode()).hexdigest() if password is not None else None
+        netloc = urlparse(self.client.api_base_url).netloc
+        key = (netloc, self.client.username, password_hash, self.repo, digest, operation)
+        return default_singleflight.do(key, func)
+
+    @classmethod
+    def stat_many(
+        cls,
+        repo: str,
+        digests: Iterable[str],
+        client: DockerRegistryV2Client = default_client,
+        *,
+        max_workers: int = 8,
+        timeout: TypeTimeout = None,
+    ) -> Dict[str, Descriptor]:
+        """Obtain the information of many blobs at once, the HEAD requests are sent concurrently
+        (at most `max_workers` in flight) over the connection pool of the client.
+
+        return a mapping from digest to descriptor, the blobs not exist in the repo are omitted.
+        """
+
+        def stat(digest: str) -> Optional[Descriptor]:
+            try:
+                return cls(repo=repo, client=client, timeout=timeout).stat(digest)
+            except exceptions.ResourceNotFound:
+                return None
+
+        unique_digests = list(dict.fromkeys(digest for digest in digests if digest))
+        if not unique_digests:
+            return {}
+        if len(unique_digests) == 1:
+            descriptors = [stat(unique_digests[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_digests))) as thread_pool:
+                descriptors = list(thread_pool.map(propagate(stat), unique_digests))
+        return {
+            digest: descriptor for digest, descriptor in zip(unique_digests, descriptors) if descriptor is not None
+        }
+
+    @classmethod
+    def exists_many(
+        cls,
+        repo: str,
+        digests: Iterable[str],
+        client: DockerRegistryV2Client = default_client,
+        *,
+        max_workers: int = 8,
+        timeout: TypeTimeout = None,
+    ) -> Dict[str, bool]:
+        """Check whether each of the blobs exists in the repo, see also `stat_many`"""
+        digests = list(digests)
+        existing = cls.stat_many(repo, digests, client, max_workers=max_workers, timeout=timeout)
+        return {digest: digest in existing for digest in digests}
+
     def download(self, digest: Optional[str] = None):
         """download the blob from registry to `local_path` or `fileobj`"""
         digest = digest or self.digest
         if digest is None:
             raise RuntimeError("unknown digest")
 
+        # hold the slot until the streaming body is consumed
+        with start_span("blob.download", repo=self.repo, digest=digest) as span, self.client.hold(BLOB_DOWNLOAD):
+            resp = self._open(digest)
+            content_length = resp.headers.get("Content-Length")
+            meter = new_transfer_meter(
+                digest, int(content_length) if content_length else None, self.progress, self.stall_policy
+            )
+            try:
+                with self.accessor.open(mode="wb") as fh:
+                    for chunk in resp.iter_content(chunk_size=1024):
+                        fh.write(chunk)
+                        span.add_bytes(len(chunk))
+                        if meter is not None:
+                            meter.update(len(chunk))
+            finally:
+                # drop the connection if the transfer is aborted
+                resp.close()
+            if meter is not None:
+                meter.finish()
+
+    def _open(self, digest: str) -> requests.Response:
+        """send the GET request of the blob, return the streaming response.
+
+        If the registry redirects to another host (the storage backend), the redirect is followed without
+        the registry credentials, and the signed url is cached, so the following requests of the blob
+        skip the registry in the validity window of the url.
+        """
+        cache_key = (self.repo, digest)
+        cached_url = self.client.redirect_cache.get(cache_key)
+        if cached_url is not None:
+            try:
+                return self.client.storage_get(url=cached_url, stream=True, timeout=self.timeout)
+            except exceptions.RequestErrorWithResponse:
+                # the url may be revoked before expiry, ask the registry again
+                self.client.redirect_cache.invalidate(cache_key)
+
         url = URLBuilder.build_blobs_url(self.client.api_base_url, repo=self.repo, digest=digest)
-        resp = self.client.get(url=url, stream=True, timeout=self.timeout)
-        with self.accessor.open(mode="wb") as fh:
-            for chunk in resp.iter_content(chunk_size=1024):
-                fh.write(chunk)
+        resp = self.client.get(url=url, stream=True, allow_redirects=False, timeout=self.timeout)
+        if not resp.is_redirect:
+            return resp
+
+        location = urljoin(url, resp.headers["location"])
+        resp.close()
+        if urlparse(location).netloc == urlparse(url).netloc:
+            return self.client.get(url=location, stream=True, timeout=self.timeout)
+        self.client.redirect_cache.put(cache_key, location)
+        return self.client.storage_get(url=location, stream=True, timeout=self.timeout)
+
+    def read(self, digest: Optional[str] = None) -> bytes:
+        """download the blob from registry into memory, the concurrent reads of the same blob share one request"""
+        digest = digest or self.digest
+        if digest is None:
+            raise RuntimeError("unknown digest")
+
+        def read() -> bytes:
+            fh = io.BytesIO()
+            Blob(
+                repo=self.repo,
+                digest=digest,
+                fileobj=fh,
+                client=self.client,
+                timeout=self.timeout,
+                progress=self.progress,
+                stall_policy=self.stall_policy,
+            ).download()
+            return fh.getvalue()
+
+        return self._coalesce("read", digest, read)
 
     def upload(self) -> Descriptor:
-        """upload the blob from `local_path` or `fileobj` to the registry by streaming"""
-        uuid, location = self._initiate_blob_upload()
-        blob = BlobWriter(uuid, location, client=self.client)
-        with self.accessor.open(mode="rb") as fh:
-            signer = HashSignWrapper(fh=blob)
-            shutil.copyfileobj(fsrc=fh, fdst=signer, length=1024 * 1024 * 64)
-
-        digest = signer.digest()
-        blob.commit(digest)
+        """upload the blob from `local_path` or `fileobj` to the registry by streaming
+
+        if the digest is known in advance, the concurrent uploads of the same blob share one upload.
+        """
+        if not self.digest:
+            return self._upload()
+        descriptor = self._coalesce("upload", self.digest, self._upload)
+        self.digest = descriptor.digest
+        return descriptor
+
+    def _upload(self) -> Descriptor:
+        with start_span("blob.upload", repo=self.repo) as span, self.client.hold(BLOB_UPLOAD):
+            uuid, location = self._initiate_blob_upload()
+            meter = self._new_meter(self.accessor.size())
+            blob = BlobWriter(uuid, location, client=self.client, meter=meter)
+            try:
+                with self.accessor.open(mode="rb") as fh:
+                    signer = HashSignWrapper(fh=blob)
+                    shutil.copyfileobj(fsrc=fh, fdst=signer, length=1024 * 1024 * 64)
+
+                digest = signer.digest()
+                blob.commit(digest)
+            except Exception:
+                # e.g. `TransferStalled`, don't leave the upload session open on the registry
+                blob.cancel()
+                raise
+            span.set_attribute("digest", digest)
+            span.add_bytes(signer.tell())
+        if meter is not None:
+            meter.finish()
         self.digest = digest
         return self.stat()
 
@@ -90,12 +267,17 @@ class Blob(RepositoryResource):
         headers = {"content_type": "application/octect-stream"}
         params = {"digest": digest}
 
-        uuid, location = self._initiate_blob_upload()
-        resp = self.client.put(url=location, headers=headers, params=params, data=data, timeout=self.timeout)
+        with self.client.hold(BLOB_UPLOAD):
+            uuid, location = self._initiate_blob_upload()
+            resp = self.client.put(url=location, headers=headers, params=params, data=data, timeout=self.timeout)
 
         if resp.status_code != 201:
             raise exceptions.RequestErrorWithResponse("failed to upload", status_code=resp.status_code, response=resp)
         self.digest = digest
+        meter = self._new_meter(len(data))
+        if meter is not None:
+            meter.update(len(data))
+            meter.finish()
         return self.stat()
 
     def _initiate_blob_upload(self) -> Tuple[str, str]:
@@ -129,7 +311,9 @@ class Blob(RepositoryResource):
         """Mount the blob from the given repo, if the client has read access to."""
         if self.digest is None:
             raise RuntimeError("unknown digest")
+        return self._coalesce(f"mount:{from_repo}", self.digest, lambda: self._mount_from(from_repo))
 
+    def _mount_from(self, from_repo: str) -> Descriptor:
         url = URLBuilder.build_upload_blobs_url(self.client.api_base_url, self.repo)
         resp = self.client.post(url=url, params={"from": from_repo, "mount": self.digest}, timeout=self.timeout)
 
@@ -163,27 +347,83 @@ class Blob(RepositoryResource):
         """Fallback action for mount_from"""
         if self.fileobj is None and self.local_path is None:
             self.fileobj = fileobj = io.BytesIO()
-            other = Blob(repo=from_repo, digest=self.digest, client=self.client, fileobj=fileobj)
+            other = Blob(
+                repo=from_repo,
+                digest=self.digest,
+                client=self.client,
+                fileobj=fileobj,
+                stall_policy=self.stall_policy,
+            )
             other.download()
             fileobj.seek(0)
         return self.upload()
 
 
 class BlobWriter:
-    def __init__(self, uuid: str, location: str, client: DockerRegistryV2Client, *, timeout: TypeTimeout = None):
+    """BlobWriter uploads a blob chunk by chunk
+
+    :param meter: count the bytes received by the registry, to report the progress and detect the stall.
+    """
+
+    def __init__(
+        self,
+        uuid: str,
+        location: str,
+        client: DockerRegistryV2Client,
+        *,
+        timeout: TypeTimeout = None,
+        meter: Optional[TransferMeter] = None,
+    ):
         self.uuid = uuid
         self.location = location
         self.client = client
         self._committed = False
         self._offset = 0
         self.timeout = timeout
+        self.meter = meter
 
     def write(self, buffer: Union[bytes, bytearray]) -> int:
+        """upload the buffer as a chunk, return the number of bytes written.
+
+        The PATCH request is not idempotent, so it is not retried blindly. Instead, when it fails transiently,
+        the upload status is queried and only the bytes which the registry hasn't received are sent again.
+        This is the only retry loop of the chunk, the client doesn't retry the PATCH request itself.
+        """
+        start = self._offset
+        policy = self.client.retry_policy
+        attempt = 1
+        while self._offset - start < len(buffer):
+            chunk = buffer if self._offset == start else buffer[self._offset - start :]
+            try:
+                self._patch(chunk)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not policy.should_retry(attempt, idempotent=True, error=e):
+                    raise
+                policy.wait(attempt)
+            except exceptions.RequestErrorWithResponse as e:
+                if e.response is None or not policy.should_retry(attempt, idempotent=True, response=e.response):
+                    raise
+                policy.wait(attempt, e.response)
+            attempt += 1
+            self._resume()
+        if self.meter is not None:
+            self.meter.update(self._offset - start)
+        return self._offset - start
+
+    def _patch(self, chunk: Union[bytes, bytearray]):
         headers = {
-            "content-range": f"{self._offset}-{self._offset + len(buffer) - 1}",
+            "content-range": f"{self._offset}-{self._offset + len(chunk) - 1}",
             "content-type": "application/octet-stream",
         }
-        resp = self.client.patch(url=self.location, data=buffer, headers=headers, timeout=self.timeout)
+        resp = self.client.patch(
+            url=self.location,
+            data=chunk,
+            headers=headers,
+            timeout=self.timeout,
+            idempotent=False,
+            retry_transient=False,
+        )
 
         if resp.status_code != 202:
             raise exceptions.RequestErrorWithResponse(
@@ -191,11 +431,20 @@ class BlobWriter:
                 status_code=resp.status_code,
                 response=resp,
             )
+        self._update_status(resp, expected=self._offset + len(chunk))
 
-        start_s, end_s = resp.headers["range"].split("-", 1)
-        start, end = int(start_s), int(end_s)
-        size = end - start + 1 - self._offset
+    def _resume(self):
+        """query the upload status, to resume the upload from the offset the registry has received"""
+        resp = self.client.get(url=self.location, timeout=self.timeout)
+        if resp.status_code != 204:
+            raise exceptions.RequestErrorWithResponse(
+                "fail to retrieve the upload status of blobs",
+                status_code=resp.status_code,
+                response=resp,
+            )
+        self._update_status(resp, expected=self._offset)
 
+    def _update_status(self, resp: requests.Response, expected: int):
         uuid = resp.headers.get("docker-upload-uuid")
         location = resp.headers["location"]
 
@@ -211,8 +460,22 @@ class BlobWriter:
 
         self.uuid = uuid
         self.location = location
-        self._offset += size
-        return size
+        self._offset = self._parse_range(resp.headers.get("range"), expected)
+
+    @staticmethod
+    def _parse_range(value: Optional[str], expected: int) -> int:
+        """parse the `Range` header ("0-{end}") of the upload status, return the number of bytes received.
+
+        "0-0" is ambiguous, it is responded both for an empty upload and an upload of a single byte,
+        so the `expected` offset is trusted in this case.
+        """
+        if not value:
+            return expected
+        _, end_s = value.split("-", 1)
+        end = int(end_s)
+        if end == 0:
+            return min(expected, 1)
+        return end + 1
 
     def commit(self, digest: str) -> bool:
         params = {"digest": digest}
@@ -226,6 +489,22 @@ class BlobWriter:
         self._committed = True
         return True
 
+    def cancel(self):
+        """cancel the upload, so the registry can drop the data received. It never raises,
+        because it is called when the upload has failed already.
+        """
+        if self._committed:
+            return
+        try:
+            resp = self.client.delete(url=self.location, timeout=self.timeout)
+        except exceptions.ResourceNotFound:
+            return
+        except Exception:
+            logger.warning("failed to cancel the upload %s", self.uuid, exc_info=True)
+            return
+        if resp.status_code != 204:
+            logger.warning("failed to cancel the upload %s, status code: %s", self.uuid, resp.status_code)
+
     def tell(self) -> int:
         return self._offset
 
@@ -247,6 +526,18 @@ class Accessor:
             with self.local_path.open(*args, **kwargs) as fh:
                 yield fh
 
+    def size(self) -> Optional[int]:
+        """return the number of bytes to read, None if unknown (e.g. the fileobj is not seekable)"""
+        if self.local_path:
+            return self.local_path.stat().st_size
+        try:
+            position = self.fileobj.tell()
+            end = self.fileobj.seek(0, io.SEEK_END)
+            self.fileobj.seek(position)
+        except (AttributeError, OSError):
+            return None
+        return end - position
+
     def read_bytes(self):
         if self.fileobj:
             self.fileobj.seek(0)
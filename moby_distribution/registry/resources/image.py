@@ -6,8 +6,9 @@ import logging
 import shutil
 import tarfile
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
@@ -17,17 +18,21 @@ except ImportError:
     # pydantic <= 1.8.2 does not have __version__
     from pydantic import VERSION as pydantic_version
 
+from moby_distribution.registry.cache import default_layer_index
 from moby_distribution.registry.client import DockerRegistryV2Client, default_client
+from moby_distribution.registry.progress import ImageProgress, ProgressObserver, StallPolicy
 from moby_distribution.registry.resources import RepositoryResource
 from moby_distribution.registry.resources.blobs import Blob, HashSignWrapper
 from moby_distribution.registry.resources.manifests import ManifestRef
+from moby_distribution.registry.tracing import propagate, start_span
 from moby_distribution.registry.utils import (
     TypeTimeout,
     client_default_timeout,
     generate_temp_dir,
     parse_image,
 )
-from moby_distribution.spec.image_json import History, ImageJSON, default_created
+from moby_distribution.spec.base import Descriptor
+from moby_distribution.spec.image_json import ContainerConfig, History, ImageJSON, default_created
 from moby_distribution.spec.manifest import (
     DockerManifestConfigDescriptor,
     DockerManifestLayerDescriptor,
@@ -36,6 +41,11 @@ from moby_distribution.spec.manifest import (
 
 logger = logging.getLogger(__name__)
 
+if pydantic_version.startswith("2."):
+    container_config_fields = ContainerConfig.model_fields
+else:
+    container_config_fields = ContainerConfig.__fields__
+
 
 class ImageManifest(BaseModel):
     config: str = Field(default="", alias="Config")
@@ -72,6 +82,10 @@ class ImageRef(RepositoryResource):
         # diff id is the digest of uncompressed tarball
         self._append_diff_ids: List[str] = []
         self._append_historys: List[History] = []
+        # the parsed image json and its serialization are cached, until `add_layer` or `edit_image_json` called
+        self._image_json: Optional[ImageJSON] = None
+        self._image_json_str: Optional[str] = None
+        self._image_json_digest: Optional[str] = None
 
     @classmethod
     def from_image(
@@ -90,25 +104,43 @@ class ImageRef(RepositoryResource):
             to_repo = from_repo
         if to_reference is None:
             to_reference = from_reference
-        manifest = ManifestRef(
-            repo=from_repo, reference=from_reference, client=client
-        ).get(ManifestSchema2.content_type())
+        with start_span("image.from_image", repo=from_repo, reference=from_reference):
+            return cls._from_image(from_repo, from_reference, to_repo, to_reference, client)
+
+    @classmethod
+    def _from_image(
+        cls,
+        from_repo: str,
+        from_reference: str,
+        to_repo: str,
+        to_reference: str,
+        client: DockerRegistryV2Client,
+    ):
+        with start_span("manifest.get"):
+            manifest = ManifestRef(
+                repo=from_repo, reference=from_reference, client=client
+            ).get(ManifestSchema2.content_type())
         layers = [
             LayerRef(repo=from_repo, digest=layer.digest, size=layer.size, exists=True)
             for layer in manifest.layers
         ]
 
-        fh = io.BytesIO()
-        Blob(
-            repo=from_repo, digest=manifest.config.digest, client=client, fileobj=fh
-        ).download()
-        fh.seek(0)
+        initial_config = (
+            Blob(repo=from_repo, digest=manifest.config.digest, client=client)
+            .read()
+            .decode()
+        )
+
+        # the layers in manifest are in the same order as the diff_ids in the image json
+        diff_ids = (json.loads(initial_config).get("rootfs") or {}).get("diff_ids") or []
+        if len(diff_ids) == len(layers):
+            default_layer_index.record_many([layer.digest for layer in layers], diff_ids)
 
         return cls(
             repo=to_repo,
             reference=to_reference,
             layers=layers,
-            initial_config=fh.read().decode(),
+            initial_config=initial_config,
             client=client,
         )
 
@@ -130,8 +162,12 @@ class ImageRef(RepositoryResource):
 
         if no `to_repo` or `to_reference` given, will use RepoTags in `manifest.json`
         """
-        with tarfile.open(name=src) as tarball:
-            tarball.extractall(workplace)
+        with start_span("image.from_tarball", src=str(src)), tarfile.open(
+            name=src
+        ) as tarball:
+            with start_span("tarball.extract") as span:
+                tarball.extractall(workplace)
+                span.add_bytes(Path(src).stat().st_size)
 
             manifest_list = json.loads((workplace / "manifest.json").read_text())
             if not isinstance(manifest_list, list) or len(manifest_list) == 0:
@@ -152,16 +188,20 @@ class ImageRef(RepositoryResource):
             for layer in manifest.Layers:
                 # gzip it for smaller size
                 gzipped_filepath = workplace / (layer + ".gz")
-                with (workplace / layer).open(mode="rb") as fh, gzip.open(
-                    gzipped_filepath, mode="wb"
-                ) as compressed:
-                    shutil.copyfileobj(fh, compressed)
+                with start_span("layer.gzip", layer=layer) as span:
+                    with (workplace / layer).open(mode="rb") as fh, gzip.open(
+                        gzipped_filepath, mode="wb"
+                    ) as compressed:
+                        shutil.copyfileobj(fh, compressed)
+                        span.add_bytes(fh.tell())
 
                 # The gzipped file can only be obtained after the compressed object is closed
                 # (because the gzip context information has not yet been written).
                 gzipped_signer = HashSignWrapper()
-                with gzipped_filepath.open(mode="rb") as fh:
-                    shutil.copyfileobj(fh, gzipped_signer)
+                with start_span("layer.hash", layer=layer) as span:
+                    with gzipped_filepath.open(mode="rb") as fh:
+                        shutil.copyfileobj(fh, gzipped_signer)
+                    span.add_bytes(gzipped_signer.tell())
 
                 layers.append(
                     LayerRef(
@@ -180,22 +220,46 @@ class ImageRef(RepositoryResource):
                 client=client,
             )
 
-    def save(self, dest: str):
+    def save(
+        self,
+        dest: str,
+        *,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
+    ):
         """save the image to dest, as Docker Image Specification v1.2 Format
 
         spec: https://github.com/moby/moby/blob/master/image/spec/v1.2.md
+
+        :param progress: the observer of the progress of the layers downloaded, and of the image.
+        :param stall_policy: abort the download of a layer if its throughput is too low.
         """
         manifest = ImageManifest(RepoTags=[f"{self.repo}:{self.reference}"])
-        with generate_temp_dir() as workplace:
+        image_progress = self._new_image_progress(
+            progress, [layer for layer in self.layers if layer.local_path is None]
+        )
+        with start_span(
+            "image.save", repo=self.repo, reference=self.reference
+        ), generate_temp_dir() as workplace:
             # Step 1. save image json
-            image_json_digest = hashlib.sha256(self.image_json_str.encode()).hexdigest()
+            image_json_digest = self.image_json_digest.split(":", 1)[1]
 
             manifest.config = f"{image_json_digest}.json"
             (workplace / manifest.config).write_text(self.image_json_str)
 
             # Step 2. download layers
             for layer in self.layers:
-                manifest.Layers.append(self._save_layer(workplace, layer=layer))
+                with start_span("layer.save", digest=layer.digest):
+                    manifest.Layers.append(
+                        self._save_layer(
+                            workplace,
+                            layer=layer,
+                            progress=image_progress,
+                            stall_policy=stall_policy,
+                        )
+                    )
+            if image_progress is not None:
+                image_progress.finish()
 
             # Step 3. save manifest
             (workplace / "manifest.json").write_text(
@@ -203,50 +267,159 @@ class ImageRef(RepositoryResource):
             )
 
             # Step 4. save as tar
-            with tarfile.open(mode="w", name=dest) as tarball:
-                for f in workplace.iterdir():
-                    tarball.add(
-                        name=str(f.absolute()), arcname=str(f.relative_to(workplace))
-                    )
+            with start_span("tarball.write") as span:
+                with tarfile.open(mode="w", name=dest) as tarball:
+                    for f in workplace.iterdir():
+                        tarball.add(
+                            name=str(f.absolute()),
+                            arcname=str(f.relative_to(workplace)),
+                        )
+                span.add_bytes(Path(dest).stat().st_size)
         return dest
 
     def push(
-        self, media_type: str = ManifestSchema2.content_type(), *, max_worker: int = 5
+        self,
+        media_type: str = ManifestSchema2.content_type(),
+        *,
+        max_worker: int = 5,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
     ):
         """push the image to the registry."""
         if media_type == ManifestSchema2.content_type():
-            return self.push_v2(max_worker=max_worker)
+            return self.push_v2(
+                max_worker=max_worker, progress=progress, stall_policy=stall_policy
+            )
         raise NotImplementedError("only support push images with Manifest Schema2.")
 
-    def push_v2(self, *, max_worker: int = 5) -> ManifestSchema2:
-        """push the image to the registry, with Manifest Schema2."""
-        layer_descriptors_futures = []
-        layer_descriptors = []
-        # Step 1: upload all layers
-        with ThreadPoolExecutor(max_workers=max_worker) as thread_pool:
-            for layer in self.layers:
-                layer_descriptors_futures.append(
-                    thread_pool.submit(self._upload_layer, layer)
-                )
-        for future in layer_descriptors_futures:
-            layer_descriptors.append(future.result())
+    def push_v2(
+        self,
+        *,
+        max_worker: int = 5,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
+    ) -> ManifestSchema2:
+        """push the image to the registry, with Manifest Schema2.
 
-        # Step 2: upload the image json
-        config_descriptor = self._upload_config(self.image_json_str)
+        If the manifest this image would produce is already present in the repository,
+        nothing is uploaded and the reference is only (re)tagged when needed.
 
-        # Step 3.: upload the manifest
-        manifest = ManifestSchema2(config=config_descriptor, layers=layer_descriptors)
+        :param progress: the observer of the progress of the blobs uploaded, and of the image.
+        :param stall_policy: abort the upload of a blob if its throughput is too low.
+        """
+        with start_span("image.push", repo=self.repo, reference=self.reference):
+            return self._push_v2(
+                max_worker=max_worker, progress=progress, stall_policy=stall_policy
+            )
+
+    def _push_v2(
+        self,
+        *,
+        max_worker: int,
+        progress: Optional[ProgressObserver],
+        stall_policy: Optional[StallPolicy],
+    ) -> ManifestSchema2:
         ref = ManifestRef(
             repo=self.repo,
             reference=self.reference,
             client=self.client,
             timeout=self.timeout,
         )
-        ref.put(manifest)
+        image_json_str = self.image_json_str
+
+        # Step 0: short-circuit if the same manifest has been pushed before
+        with start_span("manifest.plan"):
+            planned = self._plan_manifest(image_json_str)
+            if planned is not None and self._retag_if_exists(ref, planned):
+                return planned
+
+        # Step 1: find out which blobs are already in the repository
+        digests = [layer.digest for layer in self.layers]
+        if planned is not None:
+            digests.append(planned.config.digest)
+        with start_span("blobs.stat", count=len(digests)):
+            existing = Blob.stat_many(
+                self.repo, digests, client=self.client, max_workers=max_worker, timeout=self.timeout
+            )
+
+        # Step 2: mount or upload the missing layers only
+        config_existed = existing.get(planned.config.digest) if planned else None
+        image_progress = self._new_image_progress(
+            progress,
+            [layer for layer in self.layers if layer.digest not in existing and not layer.exists],
+            config_size=None if config_existed else len(image_json_str.encode()),
+        )
+        layer_descriptors_futures = {}
+        with start_span("layers.upload"), ThreadPoolExecutor(max_workers=max_worker) as thread_pool:
+            upload_layer = propagate(self._upload_layer)
+            for idx, layer in enumerate(self.layers):
+                if layer.digest not in existing:
+                    layer_descriptors_futures[idx] = thread_pool.submit(
+                        upload_layer, layer, progress=image_progress, stall_policy=stall_policy
+                    )
+        layer_descriptors = [
+            layer_descriptors_futures[idx].result()
+            if idx in layer_descriptors_futures
+            else self._to_layer_descriptor(layer, existing[layer.digest])
+            for idx, layer in enumerate(self.layers)
+        ]
+
+        # Step 3: upload the image json
+        with start_span("config.upload"):
+            config_descriptor = self._upload_config(
+                image_json_str,
+                config_existed,
+                progress=image_progress,
+                stall_policy=stall_policy,
+            )
+        if image_progress is not None:
+            image_progress.finish()
+
+        # Step 4: upload the manifest
+        manifest = ManifestSchema2(config=config_descriptor, layers=layer_descriptors)
+        with start_span("manifest.put"):
+            ref.put(manifest)
         if self._dirty:
             return ref.get(media_type=ManifestSchema2.content_type())
         return manifest
 
+    def _plan_manifest(self, image_json_str: str) -> Optional[ManifestSchema2]:
+        """Build the manifest this image would be pushed as, without touching the registry.
+
+        return None if any layer has not been hashed yet (e.g. a local layer not added by `add_layer`).
+        """
+        layers = []
+        for layer in self.layers:
+            if not layer.digest or layer.size < 0:
+                return None
+            layers.append(DockerManifestLayerDescriptor(digest=layer.digest, size=layer.size))
+
+        return ManifestSchema2(
+            config=DockerManifestConfigDescriptor(
+                digest=self.image_json_digest,
+                size=len(image_json_str.encode()),
+            ),
+            layers=layers,
+        )
+
+    def _retag_if_exists(self, ref: ManifestRef, manifest: ManifestSchema2) -> bool:
+        """Tag `ref` with the manifest if the manifest already exists in the repository.
+
+        return True if the manifest exists, which means nothing else need to be pushed.
+        """
+        digest = ManifestRef.compute_digest(manifest)
+        existed = ManifestRef(
+            repo=self.repo, reference=digest, client=self.client, timeout=self.timeout
+        ).get_metadata()
+        if existed is None:
+            return False
+
+        current = ref.get_metadata()
+        if current is None or current.digest != digest:
+            logger.debug("manifest<%s> already exists, tagging it as %s", digest, self.reference)
+            ref.put(manifest)
+        return True
+
     def add_layer(
         self, layer: LayerRef, history: Optional[History] = None
     ) -> DockerManifestLayerDescriptor:
@@ -255,101 +428,191 @@ class ImageRef(RepositoryResource):
         Step:
           1. calculate the sha256 sum for the gzipped_tarball, as digest
           2. calculate the sha256 sum for the uncompressed_tarball, as diff_id
+
+        For the remote layer whose diff_id is recorded in the layer index (e.g. the layer belongs to
+        an image loaded by `from_image`), both steps are skipped and nothing will be downloaded,
+        the existence and the size of the layer are still checked by a HEAD request.
         """
         if not layer.exists and not layer.local_path:
             raise ValueError("Unknown layer")
 
-        uncompressed_tarball_signer = HashSignWrapper()
-        # Add local layer
-        if layer.local_path:
-            # Step 1: calculate the sha256 sum for the tarball file
-            raw_tarball_signer = HashSignWrapper()
-            with layer.local_path.open(mode="rb") as gzipped:
-                shutil.copyfileobj(gzipped, raw_tarball_signer)
-                size = raw_tarball_signer.tell()
-
-            # Step 2: calculate the sha256 sum for the uncompressed_tarball
-            # for gzipped tarball, we need decompress first
-            try:
-                with gzip.open(filename=layer.local_path) as uncompressed:
-                    shutil.copyfileobj(uncompressed, uncompressed_tarball_signer)
-            except OSError:
-                uncompressed_tarball_signer = raw_tarball_signer
-
-            if layer.digest and layer.digest != raw_tarball_signer.digest():
-                raise ValueError(
-                    "Wrong digest, layer.digest<'%s'> != signer.digest<'%s'>",
-                    layer.digest,
-                    raw_tarball_signer.digest(),
+        with start_span("image.add_layer", digest=layer.digest) as span:
+            # Add local layer
+            if layer.local_path:
+                digest, size, diff_id = self._hash_local_layer(layer)
+                layer.digest = digest
+                layer.repo = self.repo
+                layer.size = size
+            # Add remote layer if the layer is exists in registry
+            else:
+                known_diff_id = (
+                    default_layer_index.get(layer.digest) if layer.size >= 0 else None
                 )
+                span.set_attribute("cached", known_diff_id is not None)
+                if known_diff_id is not None:
+                    self._stat_remote_layer(layer)
+                    digest, size, diff_id = layer.digest, layer.size, known_diff_id
+                else:
+                    digest, size, diff_id = self._hash_remote_layer(layer)
+            default_layer_index.record(digest, diff_id)
+
+        history = history or History(
+            comment="add by moby-distribution",
+            created_by="add by moby-distribution",
+            created=default_created(),
+            empty_layer=False,
+        )
+        self._append_diff_ids.append(diff_id)
+        self._append_historys.append(history)
+        if self._image_json is not None:
+            self._image_json.rootfs.diff_ids.append(diff_id)
+            self._image_json.history.append(history)
+        self._mark_image_json_changed()
+        self.layers.append(layer)
 
-            layer.digest = raw_tarball_signer.digest()
-            layer.repo = self.repo
-            layer.size = size
+        return DockerManifestLayerDescriptor(digest=digest, size=size)
+
+    def _hash_local_layer(self, layer: LayerRef) -> Tuple[str, int, str]:
+        """calculate the digest, size and diff_id for the layer locate in local disk"""
+        assert layer.local_path
+        # Step 1: calculate the sha256 sum for the tarball file
+        raw_tarball_signer = HashSignWrapper()
+        with start_span("layer.hash") as span, layer.local_path.open(
+            mode="rb"
+        ) as gzipped:
+            shutil.copyfileobj(gzipped, raw_tarball_signer)
+            size = raw_tarball_signer.tell()
+            span.add_bytes(size)
+
+        # Step 2: calculate the sha256 sum for the uncompressed_tarball
+        # for gzipped tarball, we need decompress first
+        uncompressed_tarball_signer = HashSignWrapper()
+        try:
+            with start_span("layer.gunzip") as span, gzip.open(
+                filename=layer.local_path
+            ) as uncompressed:
+                shutil.copyfileobj(uncompressed, uncompressed_tarball_signer)
+                span.add_bytes(uncompressed_tarball_signer.tell())
+        except OSError:
+            uncompressed_tarball_signer = raw_tarball_signer
+
+        if layer.digest and layer.digest != raw_tarball_signer.digest():
+            raise ValueError(
+                "Wrong digest, layer.digest<'%s'> != signer.digest<'%s'>",
+                layer.digest,
+                raw_tarball_signer.digest(),
+            )
+        return raw_tarball_signer.digest(), size, uncompressed_tarball_signer.digest()
+
+    def _stat_remote_layer(self, layer: LayerRef):
+        """check the layer exists in registry, and its size matches"""
+        descriptor = Blob(repo=layer.repo, client=self.client).stat(layer.digest)
+        if layer.size != descriptor.size:
+            raise ValueError(
+                "Wrong Size, layer.size<'%d'> != blob.size<'%d'>",
+                layer.size,
+                descriptor.size,
+            )
 
-        # Add remote layer if the layer is exists in registry
-        else:
-            with generate_temp_dir() as temp_dir:
-                # Step 1: calculate the sha256 sum for the gzipped_tarball
-                with (temp_dir / "blob").open(mode="wb") as fh:
-                    raw_tarball_signer = HashSignWrapper(fh=fh)
-                    Blob(
-                        repo=layer.repo,
-                        digest=layer.digest,
-                        fileobj=raw_tarball_signer,
-                        client=self.client,
-                    ).download()
-                    size = raw_tarball_signer.tell()
-
-                # Step 2: calculate the sha256 sum for the uncompressed_tarball
-                with gzip.open(filename=(temp_dir / "blob")) as uncompressed:
-                    shutil.copyfileobj(uncompressed, uncompressed_tarball_signer)
-
-            if layer.size != size:
-                raise ValueError(
-                    "Wrong Size, layer.size<'%d'> != signer.size<'%d'>",
-                    layer.size,
-                    size,
-                )
-            if layer.digest != raw_tarball_signer.digest():
-                raise ValueError(
-                    "Wrong digest, layer.digest<'%s'> != signer.digest<'%s'>",
-                    layer.digest,
-                    raw_tarball_signer.digest(),
-                )
+    def _hash_remote_layer(self, layer: LayerRef) -> Tuple[str, int, str]:
+        """download the layer exists in registry, then calculate the digest, size and diff_id"""
+        uncompressed_tarball_signer = HashSignWrapper()
+        with generate_temp_dir() as temp_dir:
+            # Step 1: calculate the sha256 sum for the gzipped_tarball
+            with (temp_dir / "blob").open(mode="wb") as fh:
+                raw_tarball_signer = HashSignWrapper(fh=fh)
+                Blob(
+                    repo=layer.repo,
+                    digest=layer.digest,
+                    fileobj=raw_tarball_signer,
+                    client=self.client,
+                ).download()
+                size = raw_tarball_signer.tell()
 
-        self._dirty = True
-        self._append_diff_ids.append(uncompressed_tarball_signer.digest())
-        self._append_historys.append(
-            history
-            or History(
-                comment="add by moby-distribution",
-                created_by="add by moby-distribution",
-                created=default_created(),
-                empty_layer=False,
+            # Step 2: calculate the sha256 sum for the uncompressed_tarball
+            with start_span("layer.gunzip") as span, gzip.open(
+                filename=(temp_dir / "blob")
+            ) as uncompressed:
+                shutil.copyfileobj(uncompressed, uncompressed_tarball_signer)
+                span.add_bytes(uncompressed_tarball_signer.tell())
+
+        if layer.size != size:
+            raise ValueError(
+                "Wrong Size, layer.size<'%d'> != signer.size<'%d'>",
+                layer.size,
+                size,
             )
-        )
-        self.layers.append(layer)
-
-        return DockerManifestLayerDescriptor(
-            digest=raw_tarball_signer.digest(),
-            size=size,
-        )
+        if layer.digest != raw_tarball_signer.digest():
+            raise ValueError(
+                "Wrong digest, layer.digest<'%s'> != signer.digest<'%s'>",
+                layer.digest,
+                raw_tarball_signer.digest(),
+            )
+        return raw_tarball_signer.digest(), size, uncompressed_tarball_signer.digest()
 
     @property
     def image_json(self) -> ImageJSON:
-        base = ImageJSON(**json.loads(self._initial_config))
-        if not self._dirty:
-            return base
-        base.rootfs.diff_ids.extend(self._append_diff_ids)
-        base.history.extend(self._append_historys)
-        return base
+        """the parsed Image JSON, it is parsed only once and kept up to date by `add_layer`.
+
+        NOTE: modify it in `edit_image_json()` or by `update_config()`, otherwise the change
+        may not be reflected in `image_json_str`.
+        """
+        if self._image_json is None:
+            image_json = ImageJSON.parse(self._initial_config)
+            image_json.rootfs.diff_ids.extend(self._append_diff_ids)
+            image_json.history.extend(self._append_historys)
+            self._image_json = image_json
+        return self._image_json
 
     @property
     def image_json_str(self) -> str:
         if not self._dirty:
             return self._initial_config
+        if self._image_json_str is None:
+            self._image_json_str = self._dump_image_json(self.image_json)
+        return self._image_json_str
+
+    @property
+    def image_json_digest(self) -> str:
+        """the digest of `image_json_str`, aka the digest of the config blob"""
+        if self._image_json_digest is None:
+            self._image_json_digest = f"sha256:{hashlib.sha256(self.image_json_str.encode()).hexdigest()}"
+        return self._image_json_digest
+
+    @contextmanager
+    def edit_image_json(self) -> Iterator[ImageJSON]:
+        """Modify the Image JSON in place, the cached serialization and digest are kept if nothing changed.
+
+        Usage:
+        >>> with image_ref.edit_image_json() as image_json:
+        ...     image_json.config.Env = ["FOO=bar"]
+        """
         image_json = self.image_json
+        before = self._dump_image_json(image_json)
+        try:
+            yield image_json
+        finally:
+            if self._dump_image_json(image_json) != before:
+                self._mark_image_json_changed()
+
+    def update_config(self, **fields) -> ContainerConfig:
+        """Update the fields of the container config, e.g. `update_config(Env=["FOO=bar"], User="nobody")`"""
+        unknown = set(fields) - set(container_config_fields)
+        if unknown:
+            raise ValueError(f"unknown fields of ContainerConfig: {sorted(unknown)}")
+
+        with self.edit_image_json() as image_json:
+            for key, value in fields.items():
+                setattr(image_json.config, key, value)
+        return image_json.config
+
+    def _mark_image_json_changed(self):
+        self._dirty = True
+        self._image_json_str = None
+        self._image_json_digest = None
+
+    @staticmethod
+    def _dump_image_json(image_json: ImageJSON) -> str:
         if pydantic_version.startswith("2."):
             return json.dumps(
                 image_json.model_dump(
@@ -362,7 +625,28 @@ class ImageRef(RepositoryResource):
                 exclude_unset=True, exclude_defaults=True, separators=(",", ":")
             )
 
-    def _save_layer(self, workplace: Path, layer: LayerRef) -> str:
+    def _new_image_progress(
+        self,
+        observer: Optional[ProgressObserver],
+        layers: List[LayerRef],
+        config_size: Optional[int] = None,
+    ) -> Optional[ImageProgress]:
+        """aggregate the progress of the given layers (and the config) as the progress of the image"""
+        if observer is None:
+            return None
+        total: Optional[int] = sum(layer.size for layer in layers) + (config_size or 0)
+        if any(layer.size < 0 for layer in layers):
+            total = None
+        return ImageProgress(f"{self.repo}:{self.reference}", observer, total=total)
+
+    def _save_layer(
+        self,
+        workplace: Path,
+        layer: LayerRef,
+        *,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
+    ) -> str:
         """Download the gzipped layer, and uncompress as the raw tarball.
 
         if layer is exists in local disk(the local_path is not None), will skip download.
@@ -378,13 +662,16 @@ class ImageRef(RepositoryResource):
                 digest=layer.digest,
                 local_path=gzip_path,
                 client=self.client,
+                progress=progress,
+                stall_policy=stall_policy,
             ).download()
 
-        with gzip.open(filename=gzip_path) as uncompressed, temp_tarball_path.open(
-            mode="wb"
-        ) as fh:
+        with start_span("layer.gunzip") as span, gzip.open(
+            filename=gzip_path
+        ) as uncompressed, temp_tarball_path.open(mode="wb") as fh:
             signer = HashSignWrapper(fh)
             shutil.copyfileobj(uncompressed, signer)
+            span.add_bytes(signer.tell())
 
         tarball_path = f"{signer.digest()}/layer.tar"
         (workplace / tarball_path).parent.mkdir(exist_ok=True, parents=True)
@@ -398,41 +685,82 @@ class ImageRef(RepositoryResource):
         )
         return tarball_path
 
-    def _upload_layer(self, layer: LayerRef) -> DockerManifestLayerDescriptor:
+    def _upload_layer(
+        self,
+        layer: LayerRef,
+        *,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
+    ) -> DockerManifestLayerDescriptor:
         """Upload the layer to the registry
         this func will mount the existed layers from other repo or upload the local layers to the repo.
 
         :raise RequestErrorWithResponse: raise if an error occur.
         """
+        with start_span("layer.upload", digest=layer.digest, size=layer.size):
+            return self._do_upload_layer(
+                layer, progress=progress, stall_policy=stall_policy
+            )
 
+    def _do_upload_layer(
+        self,
+        layer: LayerRef,
+        *,
+        progress: Optional[ProgressObserver],
+        stall_policy: Optional[StallPolicy],
+    ) -> DockerManifestLayerDescriptor:
         if layer.exists and layer.repo != self.repo:
             descriptor = Blob(
-                repo=self.repo, digest=layer.digest, client=self.client
+                repo=self.repo,
+                digest=layer.digest,
+                client=self.client,
+                stall_policy=stall_policy,
             ).mount_from(from_repo=layer.repo)
         elif not layer.exists:
-            blob = Blob(repo=self.repo, local_path=layer.local_path, client=self.client)
+            blob = Blob(
+                repo=self.repo,
+                digest=layer.digest or None,
+                local_path=layer.local_path,
+                client=self.client,
+                progress=progress,
+                stall_policy=stall_policy,
+            )
             descriptor = blob.upload()
         else:
             descriptor = Blob(repo=self.repo, client=self.client).stat(layer.digest)
+        return self._to_layer_descriptor(layer, descriptor)
 
+    @staticmethod
+    def _to_layer_descriptor(layer: LayerRef, descriptor: Descriptor) -> DockerManifestLayerDescriptor:
         return DockerManifestLayerDescriptor(
             size=layer.size,
             digest=descriptor.digest,
             urls=descriptor.urls,
         )
 
-    def _upload_config(self, image_json_str: str) -> DockerManifestConfigDescriptor:
+    def _upload_config(
+        self,
+        image_json_str: str,
+        existed: Optional[Descriptor] = None,
+        *,
+        progress: Optional[ProgressObserver] = None,
+        stall_policy: Optional[StallPolicy] = None,
+    ) -> DockerManifestConfigDescriptor:
         """Upload the Image JSON to the registry
 
+        :param existed: the descriptor of the Image JSON if it is already in the repo, uploading will be skipped.
         :raise RequestErrorWithResponse: raise if an error occur.
         """
-        descriptor = Blob(
+        data = image_json_str.encode()
+        descriptor = existed or Blob(
             repo=self.repo,
-            fileobj=io.BytesIO(image_json_str.encode()),
+            fileobj=io.BytesIO(data),
             client=self.client,
+            progress=progress,
+            stall_policy=stall_policy,
         ).upload()
         return DockerManifestConfigDescriptor(
-            size=len(image_json_str),
+            size=len(data),
             digest=descriptor.digest,
             urls=descriptor.urls,
         )
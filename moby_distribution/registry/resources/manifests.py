@@ -1,7 +1,6 @@
+import hashlib
 from typing import Optional, Union
 
-import libtrust
-
 from moby_distribution.registry.client import (
     DockerRegistryV2Client,
     URLBuilder,
@@ -50,8 +49,8 @@ class ManifestRef(RepositoryResource):
             self.client.api_base_url, self.repo, self.reference
         )
         headers = {"Accept": media_type}
-        data = self.client.get(url=url, headers=headers, timeout=self.timeout).json()
-        return type_(**data)
+        resp = self.client.get(url=url, headers=headers, timeout=self.timeout)
+        return type_.parse(resp.content)
 
     def get_metadata(
         self, media_type: str = ManifestSchema2.content_type()
@@ -116,6 +115,9 @@ class ManifestRef(RepositoryResource):
         url = URLBuilder.build_manifests_url(
             self.client.api_base_url, self.repo, self.reference
         )
+        # libtrust (and cryptography) is only required to sign the schema 1 manifest
+        import libtrust
+
         private_key = get_private_key()
         data = manifest.json(
             include={
@@ -142,12 +144,22 @@ class ManifestRef(RepositoryResource):
             self.client.api_base_url, self.repo, self.reference
         )
         headers = {"Content-Type": manifest.content_type()}
-        data = manifest.json(
+        data = self.serialize(manifest)
+        return self.client.put(
+            url=url, data=data, headers=headers, timeout=self.timeout
+        )
+
+    @staticmethod
+    def serialize(manifest: Union[ManifestSchema2, OCIManifestSchema1]) -> str:
+        """serialize the docker schema 2 manifest or OCI manifest exactly as `put` will send it"""
+        return manifest.json(
             exclude={
                 "config": {"urls"},
                 "layers": {"__all__": {"urls"}},
             }
         )
-        return self.client.put(
-            url=url, data=data, headers=headers, timeout=self.timeout
-        )
+
+    @classmethod
+    def compute_digest(cls, manifest: Union[ManifestSchema2, OCIManifestSchema1]) -> str:
+        """compute the digest the registry will assign to the manifest once it is put."""
+        return f"sha256:{hashlib.sha256(cls.serialize(manifest).encode()).hexdigest()}"
@@ -0,0 +1,186 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Collection, Optional
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# the methods which can be sent again safely, no matter whether the server has processed the request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "DELETE", "OPTIONS"})
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryBudget:
+    """RetryBudget limits the ratio of retries to requests, to prevent retry storms when a registry is down.
+
+    It works like the retry throttling of gRPC: every retry costs a token, every success refunds
+    `token_ratio` token, and retries are only allowed while more than half of `max_tokens` are left.
+    A budget can be shared by many clients (the default one is shared by the whole process).
+    """
+
+    def __init__(self, max_tokens: float = 100, token_ratio: float = 0.1):
+        self.max_tokens = max_tokens
+        self.token_ratio = token_ratio
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def acquire(self) -> bool:
+        """consume a token for a retry, return False if the retry is not allowed"""
+        with self._lock:
+            if self._tokens <= self.max_tokens / 2:
+                return False
+            self._tokens -= 1
+            return True
+
+    def on_success(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.token_ratio)
+
+
+default_retry_budget = RetryBudget()
+
+
+class RetryPolicy:
+    """RetryPolicy decides whether and when a failed request should be sent again.
+
+    - transient failures are retried: connection errors, timeouts and the responses with `retry_statuses`
+    - idempotent requests (GET, HEAD, DELETE and PUT manifest) are retried on every transient failure,
+      other requests are only retried when the server surely has not processed them,
+      that is 429 (Too Many Requests) or failing to connect.
+    - the delay is exponential backoff with full jitter, or the `Retry-After` responded by the server
+    - retries are limited by `max_attempts` of each request and the `budget` shared between requests
+
+    :param max_attempts: the max number of attempts of a request, including the first one, 1 means no retry.
+    :param backoff_base: the delay before the first retry, it doubles for each retry.
+    :param backoff_max: the max delay of exponential backoff.
+    :param max_retry_after: give up if the server asks to retry after longer than it (in seconds).
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+        jitter: bool = True,
+        retry_statuses: Collection[int] = RETRYABLE_STATUSES,
+        respect_retry_after: bool = True,
+        max_retry_after: float = 300,
+        budget: Optional[RetryBudget] = default_retry_budget,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+
+    @staticmethod
+    def is_idempotent(method: str, url: str) -> bool:
+        if method in IDEMPOTENT_METHODS:
+            return True
+        # put the same manifest again is harmless
+        return method == "PUT" and "/manifests/" in url
+
+    def is_transient(
+        self, *, response: Optional[requests.Response] = None, error: Optional[Exception] = None
+    ) -> bool:
+        """return True if the failure may disappear by retrying"""
+        if response is not None:
+            return response.status_code in self.retry_statuses
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def should_retry(
+        self,
+        attempt: int,
+        *,
+        idempotent: bool,
+        response: Optional[requests.Response] = None,
+        error: Optional[Exception] = None,
+    ) -> bool:
+        """decide whether the request which failed at the `attempt`-th (starting from 1) attempt should be retried.
+
+        NOTE: a token of the retry budget is consumed if it returns True.
+        """
+        if attempt >= self.max_attempts or not self.is_transient(response=response, error=error):
+            return False
+        if not idempotent and not self._surely_unprocessed(response=response, error=error):
+            return False
+        if self.respect_retry_after and self.retry_after(response) > self.max_retry_after:
+            return False
+        if self.budget is not None and not self.budget.acquire():
+            logger.warning("retry budget exhausted, giving up retrying")
+            return False
+        return True
+
+    def on_success(self):
+        if self.budget is not None:
+            self.budget.on_success()
+
+    @staticmethod
+    def _surely_unprocessed(
+        *, response: Optional[requests.Response] = None, error: Optional[Exception] = None
+    ) -> bool:
+        if response is not None:
+            return response.status_code == 429
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            # requests wraps the error of urllib3 as `ConnectionError(MaxRetryError(reason=NewConnectionError))`
+            reason = getattr(error.args[0], "reason", error.args[0])
+            return isinstance(reason, NewConnectionError)
+        return False
+
+    @staticmethod
+    def retry_after(response: Optional[requests.Response]) -> float:
+        """parse the `Retry-After` header (delay-seconds or HTTP-date) of the response, 0 if absent"""
+        if response is None:
+            return 0
+        value = response.headers.get("Retry-After")
+        if not value:
+            return 0
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0
+
+    def backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """return the delay (in seconds) before the next attempt"""
+        if self.respect_retry_after:
+            retry_after = self.retry_after(response)
+            if retry_after > 0:
+                return retry_after
+
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def wait(self, attempt: int, response: Optional[requests.Response] = None):
+        delay = self.backoff(attempt, response)
+        logger.info("retrying in %.2fs (attempt %d/%d)", delay, attempt + 1, self.max_attempts)
+        self.sleep(delay)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class NoRetry(RetryPolicy):
+    """the policy never retries"""
+
+    def __init__(self):
+        super().__init__(max_attempts=1, budget=None)
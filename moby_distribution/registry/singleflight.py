@@ -0,0 +1,63 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.shared = 0
+
+
+class SingleFlight:
+    """SingleFlight coalesces the duplicate calls in flight, the concurrent calls with the same key
+    share one execution and its result (or exception).
+
+    Usage:
+    >>> group = SingleFlight()
+    >>> group.do(("registry", "library/python", "sha256:...", "stat"), lambda: blob.stat())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """execute func, or wait for the result of the execution in flight with the same key"""
+        nested = leading = False
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leading = True
+            elif call.owner == threading.get_ident():
+                nested = True
+            else:
+                call.shared += 1
+
+        if nested:
+            # a nested call with the same key in the leading thread, waiting for itself would deadlock
+            return func()
+        if not leading:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+default_singleflight = SingleFlight()
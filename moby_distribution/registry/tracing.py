@@ -0,0 +1,168 @@
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "moby_distribution_span", default=None
+)
+
+
+class Span:
+    """Span is a timed phase of an operation (e.g. pushing an image, or uploading one of its layers).
+
+    `cpu_seconds` is the CPU time of the thread which runs the span, the time spent waiting
+    (for network, disk or locks) is `wait_seconds`. The phases run by other threads are the children spans,
+    their CPU time is not included.
+
+    Usage:
+    >>> with start_span("layer.upload", digest=digest) as span:
+    ...     span.add_bytes(size)
+    """
+
+    __slots__ = ("tracer", "name", "attributes", "parent", "start", "end", "_start_cpu", "cpu_seconds", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any], parent: Optional["Span"]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = 0.0
+        self.end: Optional[float] = None
+        self._start_cpu = 0.0
+        self.cpu_seconds = 0.0
+        self._token: Optional[contextvars.Token] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_bytes(self, n: int):
+        """count the bytes processed (hashed, compressed or transferred) in the span"""
+        self.attributes["bytes"] = self.attributes.get("bytes", 0) + n
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def wait_seconds(self) -> float:
+        return max(self.duration - self.cpu_seconds, 0.0)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        self.tracer.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cpu_seconds = time.thread_time() - self._start_cpu
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        if self._token is not None:
+            _current_span.reset(self._token)
+        self.tracer.on_end(self)
+
+    def __repr__(self):
+        return (
+            f"Span(name={self.name!r}, duration={self.duration:.3f}, cpu_seconds={self.cpu_seconds:.3f}, "
+            f"attributes={self.attributes!r})"
+        )
+
+
+class _NoSpan:
+    """the span used when tracing is disabled, it records nothing"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_bytes(self, n: int):
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """Tracer receives the spans of the operations, it is dependency-free,
+    implement `on_start` and `on_end` to export the spans (e.g. to OpenTelemetry).
+
+    The hooks are called by the thread which runs the span, they should be fast and thread-safe.
+    """
+
+    # the spans are not created at all if False
+    enabled = True
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class NoTracer(Tracer):
+    enabled = False
+
+
+class InMemoryTracer(Tracer):
+    """keep the finished spans in memory, for debugging and testing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+
+    def on_end(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def find(self, name: str) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.name == name]
+
+
+_default_tracer: Tracer = NoTracer()
+
+
+def set_default_tracer(tracer: Tracer):
+    global _default_tracer
+    _default_tracer = tracer
+
+
+def get_default_tracer() -> Tracer:
+    return _default_tracer
+
+
+def start_span(name: str, **attributes):
+    """start a span as the child of the current span, use it as a context manager"""
+    tracer = _default_tracer
+    if not tracer.enabled:
+        return _NO_SPAN
+    return Span(tracer, name, attributes, parent=_current_span.get())
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def propagate(func: Callable[..., T]) -> Callable[..., T]:
+    """bind func to the current context, so the spans it starts in another thread
+    (e.g. in a `ThreadPoolExecutor`) are the children of the current span.
+    """
+    if not _default_tracer.enabled:
+        return func
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs) -> T:
+        # a context can't be entered by many threads at the same time
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
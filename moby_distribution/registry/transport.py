@@ -0,0 +1,228 @@
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+
+
+class Transport:
+    """Transport sends the HTTP requests of `DockerRegistryV2Client`, it can be replaced to use
+    another HTTP library (or protocol), or to serve the requests in process without network.
+
+    A transport should:
+    - accept the keyword arguments `headers`, `params`, `data` (bytes or a file-like object to upload),
+      `json`, `stream` (the body will be consumed by `iter_content`), `timeout` and `allow_redirects`.
+    - return the response compatible with `requests.Response`, at least `status_code`, `ok`, `headers`
+      (case-insensitive), `content`, `json()`, `iter_content()`, `is_redirect`, `close()` and `request`
+      (with `method`, `url` and `headers`).
+    - raise `requests.exceptions.ConnectionError` or `requests.exceptions.Timeout` (or their subclasses)
+      on network failures, so they can be retried.
+    """
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        raise NotImplementedError
+
+    def close(self):
+        """release the resources, e.g. the pooled connections"""
+
+
+class RequestsTransport(Transport):
+    """the transport sending requests by `requests.Session`"""
+
+    def __init__(self, session: Optional[requests.Session] = None):
+        self.session = session or requests.Session()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if method == "HEAD":
+            # keep the same as `requests.head`
+            kwargs.setdefault("allow_redirects", False)
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class _HttpxRawStream:
+    """the file-like adapter of the streaming `httpx.Response`, used as the `raw` of `requests.Response`"""
+
+    def __init__(self, transport: "HttpxTransport", response):
+        self._transport = transport
+        self._response = response
+        self._buffer = b""
+        self._iterator = None
+
+    def stream(self, chunk_size: int = 1024, decode_content: bool = True):
+        iterator = self._response.aiter_bytes(chunk_size)
+        while True:
+            try:
+                yield self._transport._run(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self._iterator is None:
+            self._iterator = self.stream(amt or 65536)
+        while amt is None or len(self._buffer) < amt:
+            chunk = next(self._iterator, b"")
+            if not chunk:
+                break
+            self._buffer += chunk
+        if amt is None:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self._transport._run(self._response.aclose())
+
+
+class HttpxTransport(Transport):
+    """the transport sending requests by `httpx` with HTTP/2 enabled, so the concurrent requests to a host
+    are multiplexed over a few connections instead of a connection for each request in flight.
+
+    The requests are sent by an `httpx.AsyncClient` running in a background thread, the calling threads
+    wait for the results, so the transport can be shared by many threads like `RequestsTransport`.
+
+    `httpx` is an optional dependency, install it with the HTTP/2 support by `pip install moby-distribution[http2]`.
+    The extra keyword arguments are passed to `httpx.AsyncClient`, e.g. `http1=False` to talk HTTP/2 to
+    a cleartext (http://) registry with prior knowledge.
+
+    :param verify: whether to verify the certificate of the registry.
+    :param max_connections: the max number of connections to each host.
+    :param httpx_client: use the given `httpx.AsyncClient` instead of creating one.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, http2: bool = True, verify: bool = True, max_connections: int = 8, httpx_client=None, **kwargs):
+        try:
+            import httpx
+        except ImportError as e:  # pragma: no cover
+            raise ImportError(
+                "HttpxTransport requires httpx, install it by `pip install moby-distribution[http2]`"
+            ) from e
+
+        # asyncio is imported on first use like httpx, it is not needed by the default transport
+        import asyncio
+
+        self._httpx = httpx
+        self._asyncio = asyncio
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="httpx-transport", daemon=True)
+        self._thread.start()
+        self.httpx_client = httpx_client or httpx.AsyncClient(
+            http2=http2,
+            verify=verify,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            **kwargs,
+        )
+
+    def _run(self, coroutine):
+        """run the coroutine in the event loop of the transport, translate the network errors of httpx"""
+        future = self._asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        with self._translate_error():
+            return future.result()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers=None,
+        params=None,
+        data=None,
+        json=None,
+        stream: bool = False,
+        timeout=None,
+        allow_redirects: Optional[bool] = None,
+    ) -> requests.Response:
+        if allow_redirects is None:
+            # keep the same as `requests`
+            allow_redirects = method != "HEAD"
+        content = data
+        if hasattr(data, "read"):
+            content = self._read_chunks(data)
+
+        request = self.httpx_client.build_request(
+            method,
+            url,
+            headers={k: v for k, v in (headers or {}).items() if v is not None},
+            params=params,
+            content=content,
+            json=json,
+            timeout=self._to_httpx_timeout(timeout),
+        )
+        response = self._run(self._send(request, stream, allow_redirects))
+        return self._to_requests_response(response, stream)
+
+    async def _send(self, request, stream: bool, allow_redirects: bool):
+        response = await self.httpx_client.send(request, stream=True, follow_redirects=allow_redirects)
+        if not stream:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        return response
+
+    async def _read_chunks(self, fh):
+        # read the file in the executor, not to block the event loop
+        loop = self._asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, fh.read, self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self.httpx_client.aclose())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def _to_httpx_timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(read, connect=connect)
+        return self._httpx.Timeout(timeout)
+
+    def _to_requests_response(self, response, stream: bool) -> requests.Response:
+        prepared = requests.PreparedRequest()
+        prepared.method = response.request.method
+        prepared.url = str(response.request.url)
+        prepared.headers = CaseInsensitiveDict(response.request.headers)
+
+        resp = requests.Response()
+        resp.status_code = response.status_code
+        resp.reason = response.reason_phrase
+        resp.headers = CaseInsensitiveDict(response.headers)
+        resp.url = str(response.url)
+        resp.request = prepared
+        if stream:
+            resp.raw = _HttpxRawStream(self, response)
+        else:
+            resp._content = response.content
+            resp._content_consumed = True
+        return resp
+
+    @contextmanager
+    def _translate_error(self):
+        """translate the network errors of httpx to the ones of requests"""
+        httpx = self._httpx
+        try:
+            yield
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(str(e)) from e
+        except httpx.ConnectError as e:
+            # the request surely has not been sent
+            raise requests.exceptions.ConnectionError(NewConnectionError(None, str(e))) from e
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
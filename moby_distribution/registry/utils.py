@@ -1,21 +1,39 @@
 import logging
 import os
+import re
 import shutil
 import tempfile
+import threading
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Callable, ContextManager, Iterator, NamedTuple, Optional, Tuple, Union
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Iterator, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
-import libtrust
-from libtrust.keys import ec_key, rs_key
+if TYPE_CHECKING:
+    import libtrust
+    import requests
 
 logger = logging.getLogger(__name__)
 client_default_timeout = float("-inf")
 TypeTimeout = Optional[Union[Tuple[float, float], float]]
 
 
-def get_private_key() -> Union[libtrust.ECPrivateKey, libtrust.RSAPrivateKey]:
+def __getattr__(name: str):
+    # libtrust (and cryptography) is heavy to import, load it on first use
+    if name == "libtrust":
+        import libtrust
+
+        return libtrust
+    if name in ("ec_key", "rs_key"):
+        import libtrust.keys
+
+        return getattr(libtrust.keys, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_private_key() -> Union["libtrust.ECPrivateKey", "libtrust.RSAPrivateKey"]:
+    from libtrust.keys import ec_key, rs_key
+
     key = os.getenv("MOBY_DISTRIBUTION_PRIVATE_KEY")
     password = os.getenv("MOBY_DISTRIBUTION_PRIVATE_KEY_PASSWORD")
     if key is not None:
@@ -42,7 +60,10 @@ def validate_media_type(cls, media_type: str) -> str:
 def new_method_proxy(func):
     def inner(self, *args):
         if "_wrapped" not in self.__dict__:
-            self.__dict__["_wrapped"] = self.__dict__["_factory"]()
+            # only one thread calls the factory, the others wait for it
+            with self.__dict__["_lock"]:
+                if "_wrapped" not in self.__dict__:
+                    self.__dict__["_wrapped"] = self.__dict__["_factory"]()
         return func(self._wrapped, *args)
 
     return inner
@@ -51,6 +72,7 @@ def new_method_proxy(func):
 class LazyProxy:
     def __init__(self, obj: Callable[..., Any]):
         self.__dict__["_factory"] = obj
+        self.__dict__["_lock"] = threading.Lock()
 
     __getattr__ = new_method_proxy(getattr)
     __setattr__ = new_method_proxy(setattr)
@@ -60,6 +82,59 @@ class LazyProxy:
         return repr(self.__dict__["_wrapped"])
 
 
+_SENSITIVE_HEADERS = ("authorization", "proxy-authorization", "cookie")
+_SENSITIVE_PARAMS = re.compile(r"(signature|token|credential|password|secret|key)", re.IGNORECASE)
+REDACTED = "<redacted>"
+
+
+class LazyCurl:
+    """Render the equivalent curl command of the request only when it is being formatted,
+    so a log record which is not emitted costs nothing.
+
+    The credentials in headers and query and the body are redacted.
+
+    Usage:
+    >>> logger.debug("Requesting %s, Equivalent curl command: %s", url, LazyCurl(resp.request))
+    """
+
+    def __init__(self, request: Optional["requests.PreparedRequest"]):
+        self.request = request
+
+    def __str__(self) -> str:
+        if self.request is None:
+            return "<unknown>"
+        try:
+            import curlify
+
+            return curlify.to_curl(self._redact(self.request))
+        except Exception:
+            return "<unknown>"
+
+    @staticmethod
+    def _redact(request: "requests.PreparedRequest") -> "requests.PreparedRequest":
+        redacted = request.copy()
+        for key in list(redacted.headers.keys()):
+            if key.lower() in _SENSITIVE_HEADERS and redacted.headers[key]:
+                redacted.headers[key] = REDACTED
+
+        if redacted.body is not None:
+            size = len(redacted.body) if isinstance(redacted.body, (bytes, str)) else "unknown"
+            redacted.body = f"<{size} bytes omitted>"
+
+        if redacted.url:
+            parsed = urlparse(redacted.url)
+            if parsed.query:
+                query = [
+                    (k, REDACTED if _SENSITIVE_PARAMS.search(k) else v)
+                    for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                ]
+                redacted.url = urlunparse(parsed._replace(query=urlencode(query, safe="<>")))
+        return redacted
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
 def __generate_temp_dir__(suffix=None) -> Iterator[Path]:
     path = None
     try:
@@ -80,6 +155,19 @@ class NamedImage(NamedTuple):
     tag: Optional[str] = None
 
 
+def get_default_registry() -> str:
+    """return the domain of the default client, without initializing it (which may detect the scheme by network),
+    the domain of the official registry is returned if the default client has not been initialized.
+    """
+    from moby_distribution.registry.client import default_client
+    from moby_distribution.spec.endpoint import OFFICIAL_ENDPOINT
+
+    client = default_client.__dict__.get("_wrapped")
+    if client is not None:
+        return urlparse(client.api_base_url).netloc
+    return OFFICIAL_ENDPOINT.get_base_url(secure=True)
+
+
 def parse_image(image: str, default_registry: Optional[str] = None) -> NamedImage:
     """parse the `repository:tag` as NamedImage
 
@@ -99,10 +187,8 @@ def parse_image(image: str, default_registry: Optional[str] = None) -> NamedImag
     >>> parse_image("docker.io:5000/python:latest", default_registry="not-docker.io")
     NamedImage(domain='docker.io:5000', name='python', tag='latest')
     """
-    from moby_distribution.registry.client import default_client
-
     i = image.find("/")
-    default_registry = default_registry or urlparse(default_client.api_base_url).netloc
+    default_registry = default_registry or get_default_registry()
     tag: Optional[str] = None
 
     # case for image in default registry
@@ -122,3 +208,58 @@ def parse_image(image: str, default_registry: Optional[str] = None) -> NamedImag
         name = f"library/{name}"
 
     return NamedImage(domain=domain, name=name, tag=tag)
+
+
+_ROUTE_KIND_PATTERN = re.compile(r"/v2/.+/(manifests|blobs|tags)/")
+
+
+def get_route_kind(url: str) -> str:
+    """return the kind of the registry api route which the url requests
+
+    Usage:
+    >>> get_route_kind("https://registry/v2/library/python/manifests/latest")
+    'manifests'
+
+    >>> get_route_kind("https://registry/v2/library/python/blobs/uploads/")
+    'blobs'
+
+    >>> get_route_kind("https://registry/v2/")
+    'base'
+    """
+    matched = _ROUTE_KIND_PATTERN.search(urlparse(url).path)
+    return matched.group(1) if matched else "base"
+
+
+_ROUTE_TEMPLATE_PATTERN = re.compile(r"/v2/.+/(manifests|blobs|tags)/([^/]*)(?:/([^/]*))?$")
+
+
+def get_route_template(url: str) -> str:
+    """return the template of the registry api route which the url requests, the repository name is omitted,
+    so the requests of the same route can be aggregated.
+
+    Usage:
+    >>> get_route_template("https://registry/v2/library/python/blobs/sha256:abc")
+    'blobs/{digest}'
+
+    >>> get_route_template("https://registry/v2/library/python/blobs/uploads/6f8e3c2a")
+    'blobs/uploads/{uuid}'
+
+    >>> get_route_template("https://registry/v2/")
+    'base'
+    """
+    path = urlparse(url).path
+    if path in ("/v2", "/v2/"):
+        return "base"
+    if path == "/v2/_catalog":
+        return "catalog"
+    matched = _ROUTE_TEMPLATE_PATTERN.search(path)
+    if not matched:
+        return "other"
+    kind, name, rest = matched.groups()
+    if kind == "manifests":
+        return "manifests/{reference}"
+    if kind == "tags":
+        return "tags/list"
+    if name == "uploads":
+        return "blobs/uploads/{uuid}" if rest else "blobs/uploads/"
+    return "blobs/{digest}"
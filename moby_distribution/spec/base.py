@@ -1,9 +1,64 @@
-from typing import Dict, List, Optional
+import json
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
 
 from pydantic import BaseModel, Field
 
+try:
+    from pydantic import __version__ as pydantic_version
+except ImportError:
+    # pydantic <= 1.8.2 does not have __version__
+    from pydantic import VERSION as pydantic_version
 
-class Platform(BaseModel):
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+PYDANTIC_V2 = pydantic_version.startswith("2.")
+T = TypeVar("T", bound="SpecModel")
+
+if PYDANTIC_V2:
+    from pydantic import field_validator as _field_validator
+
+    def field_validator(*fields: str):
+        """A validator decorator works with both pydantic v1 and v2, using the native implementation of each."""
+        return _field_validator(*fields)
+
+else:
+    from pydantic import validator as _validator
+
+    def field_validator(*fields: str):
+        """A validator decorator works with both pydantic v1 and v2, using the native implementation of each."""
+        return _validator(*fields, allow_reuse=True)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """decode json document, using orjson if it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class SpecModel(BaseModel):
+    """Base model for specs, providing a fast path to parse the documents responded by registry."""
+
+    @classmethod
+    def parse(cls: Type[T], data: Union[str, bytes, Dict[str, Any]]) -> T:
+        """parse the model from json document or decoded dict.
+
+        With pydantic v2 the json document is decoded and validated natively by `model_validate_json`,
+        with pydantic v1 it is decoded by orjson if installed.
+        """
+        if PYDANTIC_V2:
+            if isinstance(data, dict):
+                return cls.model_validate(data)
+            return cls.model_validate_json(data)
+        if not isinstance(data, dict):
+            data = loads(data)
+        return cls(**data)
+
+
+class Platform(SpecModel):
     """
     Platform describes the platform which the image in the manifest runs on.
     """
@@ -15,7 +70,7 @@ class Platform(BaseModel):
     variant: str
 
 
-class Descriptor(BaseModel):
+class Descriptor(SpecModel):
     """
     Descriptor describes targeted content. Used in conjunction with a blob
     store, a descriptor can be used to fetch, store and target any kind of
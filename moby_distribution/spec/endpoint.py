@@ -1,30 +1,18 @@
 import re
 import socket
 import ssl
-from functools import wraps
-from typing import Optional, Pattern, Tuple
+from typing import Dict, Optional, Pattern, Tuple
 
 from pydantic import VERSION, BaseModel
 
-_endpoint_status_cache = {
-    # well-known endpoints
+# the endpoints known to serve https with a valid certificate, they are never probed
+WELL_KNOWN_ENDPOINTS: Dict[str, Tuple[bool, bool]] = {
     "registry.hub.docker.com": (True, True),
     "index.docker.io": (True, True),
     "quay.io": (True, True),
 }
 
 
-def cache_endpoint_status(func):
-    @wraps(func)
-    def is_secure_repository(self, *, timeout: Optional[float] = None):
-        if self.url in _endpoint_status_cache:
-            return _endpoint_status_cache[self.url]
-        _endpoint_status_cache[self.url] = func(self, timeout=timeout)
-        return _endpoint_status_cache[self.url]
-
-    return is_secure_repository
-
-
 class cached_property:
     """
     Decorator that converts a method with a single self argument into
@@ -58,13 +46,16 @@ class APIEndpoint(BaseModel):
         else:
             ignored_types = (cached_property,)
 
-    @cache_endpoint_status
     def is_secure_repository(self, *, timeout: Optional[float] = None) -> Tuple[bool, bool]:
-        """Detect if the repository is secure
+        """Detect if the repository is secure, see also `moby_distribution.registry.detect.probe_endpoint`
+        which caches the results.
 
         returns Tuple[bool, bool], the first one mean if the server support https?,
                                     the second one mean if the ssl certificate is valid?
         """
+        if self.url in WELL_KNOWN_ENDPOINTS:
+            return WELL_KNOWN_ENDPOINTS[self.url]
+
         match = url_regex().match(self.url)
         if not match:
             return False, False
@@ -91,6 +82,12 @@ class APIEndpoint(BaseModel):
 
     @cached_property
     def api_base_url(self) -> str:
+        return self.get_base_url(secure=None)
+
+    def get_base_url(self, secure: Optional[bool] = None) -> str:
+        """return the `host:port/path` of the endpoint, the default port depends on whether
+        the endpoint is secure, it will be detected if `secure` is None.
+        """
         match = url_regex().match(self.url)
         if not match:
             raise ValueError("Invalid Url")
@@ -100,7 +97,9 @@ class APIEndpoint(BaseModel):
 
         port = parts["port"]
         if not port:
-            port = "443" if self.is_secure_repository()[0] else "80"
+            if secure is None:
+                secure = self.is_secure_repository()[0]
+            port = "443" if secure else "80"
 
         path = parts["path"] or ""
         return f"{hostname}:{port}{path}"
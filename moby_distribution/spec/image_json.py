@@ -2,7 +2,9 @@ import datetime
 from textwrap import dedent
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import Field
+
+from moby_distribution.spec.base import SpecModel
 
 
 def default_created():
@@ -10,7 +12,7 @@ def default_created():
     return dt.replace(microsecond=0, tzinfo=datetime.timezone.utc)
 
 
-class HealthConfig(BaseModel):
+class HealthConfig(SpecModel):
     Test: List[str] = Field(
         ...,
         description=dedent(
@@ -39,7 +41,7 @@ class HealthConfig(BaseModel):
     )
 
 
-class ContainerConfig(BaseModel):
+class ContainerConfig(SpecModel):
     """ContainerConfig contains the configuration data when running a container using the image
     spec: https://github.com/opencontainers/image-spec/blob/main/config.md
     """
@@ -90,14 +92,14 @@ class ContainerConfig(BaseModel):
     )
 
 
-class RootFS(BaseModel):
+class RootFS(SpecModel):
     diff_ids: List[str] = Field(
         ..., description="diff id is the digest of uncompressed tarball"
     )
     type: str = "layers"
 
 
-class History(BaseModel):
+class History(SpecModel):
     created: Optional[datetime.datetime] = Field(default_factory=default_created)
     author: Optional[str] = None
     created_by: Optional[str] = None
@@ -105,7 +107,7 @@ class History(BaseModel):
     empty_layer: Optional[bool] = False
 
 
-class ImageJSON(BaseModel):
+class ImageJSON(SpecModel):
     created: datetime.datetime
     author: str = "anonymous"
     architecture: str
@@ -1,29 +1,29 @@
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field, validator
+from pydantic import Field
 
 from moby_distribution.registry.utils import validate_media_type
-from moby_distribution.spec.base import Descriptor, Platform
+from moby_distribution.spec.base import Descriptor, Platform, SpecModel, field_validator
 
 
-class FileSystemLayer(BaseModel):
+class FileSystemLayer(SpecModel):
     blobSum: str
 
 
-class JWS(BaseModel):
+class JWS(SpecModel):
     header: Dict
     protected: str
     signature: str
 
 
-class Schema1History(BaseModel):
+class Schema1History(SpecModel):
     """V1Compatibility is the raw V1 compatibility information.
     This will contain the JSON object describing the V1 of this image."""
 
     v1Compatibility: str
 
 
-class ManifestSchema1(BaseModel):
+class ManifestSchema1(SpecModel):
     """image manifest for the Registry, Schema1.
     spec: https://github.com/distribution/distribution/blob/main/docs/spec/manifest-v2-1.md
     """
@@ -40,7 +40,8 @@ class ManifestSchema1(BaseModel):
     def content_type() -> str:
         return "application/vnd.docker.distribution.manifest.v1+prettyjws"
 
-    @validator("schemaVersion")
+    @field_validator("schemaVersion")
+    @classmethod
     def validate_schema_version(cls, v):
         if v != 1:
             raise ValueError("schema version of ManifestSchema1 MUST be 1")
@@ -61,7 +62,7 @@ class DockerManifestConfigDescriptor(Descriptor):
         return "application/vnd.docker.container.image.v1+json"
 
     mediaType: str = "application/vnd.docker.container.image.v1+json"
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
 class DockerManifestLayerDescriptor(Descriptor):
@@ -73,10 +74,10 @@ class DockerManifestLayerDescriptor(Descriptor):
         ]
 
     mediaType: str = "application/vnd.docker.image.rootfs.diff.tar.gzip"
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
-class ManifestSchema2(BaseModel):
+class ManifestSchema2(SpecModel):
     """image manifest for the Registry, Schema2.
     spec: https://github.com/distribution/distribution/blob/main/docs/spec/manifest-v2-2.md"""
 
@@ -89,13 +90,14 @@ class ManifestSchema2(BaseModel):
     def content_type() -> str:
         return "application/vnd.docker.distribution.manifest.v2+json"
 
-    @validator("schemaVersion")
+    @field_validator("schemaVersion")
+    @classmethod
     def validate_schema_version(cls, v):
         if v != 2:
             raise ValueError("schema version of ManifestSchema2 MUST be 2")
         return v
 
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
 class OCIManifestConfigDescriptor(Descriptor):
@@ -103,7 +105,7 @@ class OCIManifestConfigDescriptor(Descriptor):
     def content_type() -> str:
         return "application/vnd.oci.image.config.v1+json"
 
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
 class OCIManifestLayerDescriptor(Descriptor):
@@ -116,10 +118,10 @@ class OCIManifestLayerDescriptor(Descriptor):
             "application/vnd.oci.image.layer.nondistributable.v1.tar+gzip",
         ]
 
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
-class OCIManifestSchema1(BaseModel):
+class OCIManifestSchema1(SpecModel):
     """image manifest for the OCI Image
 
     spec: https://github.com/opencontainers/image-spec/blob/main/manifest.md
@@ -135,13 +137,14 @@ class OCIManifestSchema1(BaseModel):
     def content_type() -> str:
         return "application/vnd.oci.image.manifest.v1+json"
 
-    @validator("schemaVersion")
+    @field_validator("schemaVersion")
+    @classmethod
     def validate_schema_version(cls, v):
         if v != 2:
             raise ValueError("schema version of OCIManifestSchema1 MUST be 2")
         return v
 
-    _validate_media_type = validator("mediaType", allow_reuse=True)(validate_media_type)
+    _validate_media_type = field_validator("mediaType")(validate_media_type)
 
 
 class ManifestDescriptor(Descriptor):
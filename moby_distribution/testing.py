@@ -0,0 +1,478 @@
+"""An in-process stand-in of the Docker Registry HTTP API V2, to test and benchmark without a real registry.
+
+Usage:
+>>> with FakeRegistry(latency=0.01, bandwidth=50 * 1024 * 1024) as registry:
+...     client = DockerRegistryV2Client(registry.url)
+...     ImageRef.from_tarball(workplace, src, to_repo="library/python", client=client).push()
+
+The registry serves the blobs, the chunked and monolithic uploads, the cross-repository mounts, the manifests,
+the tags and the catalog (with pagination), and optionally the basic or the token authentication, over HTTP/1.1
+on a local port. Everything is kept in memory.
+"""
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid as uuid_lib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from moby_distribution.registry.utils import get_route_template
+
+_BLOB_PATTERN = re.compile(r"^/v2/(?P<name>.+)/blobs/(?P<digest>[a-z0-9]+:[a-fA-F0-9]+)$")
+_UPLOAD_PATTERN = re.compile(r"^/v2/(?P<name>.+)/blobs/uploads/(?P<uuid>[^/]*)$")
+_MANIFEST_PATTERN = re.compile(r"^/v2/(?P<name>.+)/manifests/(?P<reference>[^/]+)$")
+_TAGS_PATTERN = re.compile(r"^/v2/(?P<name>.+)/tags/list$")
+
+_TOKEN_PATH = "/token"
+_SERVICE = "fake-registry"
+_CHUNK_SIZE = 64 * 1024
+
+
+class Fault:
+    """Fault makes the matching requests fail, see also `FakeRegistry.inject_fault`
+
+    :param method: the method to match, any method if None.
+    :param route: the route template to match (see `get_route_template`, e.g. `blobs/uploads/{uuid}`), any if None.
+    :param status: the status code to respond, the connection is dropped without a response if None.
+    :param times: the number of the requests to fail, unlimited if None.
+    :param probability: the probability to fail a matching request.
+    """
+
+    def __init__(
+        self,
+        method: Optional[str] = None,
+        route: Optional[str] = None,
+        status: Optional[int] = 503,
+        times: Optional[int] = 1,
+        probability: float = 1.0,
+    ):
+        self.method = method
+        self.route = route
+        self.status = status
+        self.times = times
+        self.probability = probability
+
+    def matches(self, method: str, route: str) -> bool:
+        if self.times is not None and self.times <= 0:
+            return False
+        return (self.method is None or self.method == method) and (self.route is None or self.route == route)
+
+
+class _Throttle:
+    """share the bandwidth between all the connections, as if they were on the same link"""
+
+    def __init__(self, bandwidth: Optional[float]):
+        self.bandwidth = bandwidth
+        self._lock = threading.Lock()
+        self._available_at = 0.0
+
+    def consume(self, n: int):
+        if not self.bandwidth or n <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._available_at = max(self._available_at, now) + n / self.bandwidth
+            delay = self._available_at - now
+        time.sleep(delay)
+
+
+class _Response(Exception):
+    """raise to respond early, e.g. with an error"""
+
+    def __init__(self, status: int, headers: Optional[Dict[str, str]] = None, body: bytes = b""):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+
+
+def _error(status: int, code: str, message: str, headers: Optional[Dict[str, str]] = None) -> _Response:
+    body = json.dumps({"errors": [{"code": code, "message": message, "detail": None}]}).encode()
+    return _Response(status, {"Content-Type": "application/json", **(headers or {})}, body)
+
+
+def _digest(data: bytes) -> str:
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+class FakeRegistry:
+    """FakeRegistry serves the Docker Registry HTTP API V2 from memory, in a background thread
+
+    :param latency: the seconds to wait before responding each request, to simulate the round trip.
+    :param bandwidth: the bytes per second of the request and response bodies, shared by all connections,
+                      unlimited if None.
+    :param auth: None, "basic" or "token", the token is issued by the realm `{url}/token`.
+    :param users: the username and password of the users, anonymous access is allowed if None.
+    :param seed: the seed of the random faults.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        bandwidth: Optional[float] = None,
+        auth: Optional[str] = None,
+        users: Optional[Dict[str, str]] = None,
+        seed: Optional[int] = None,
+    ):
+        if auth not in (None, "basic", "token"):
+            raise ValueError(f"unsupported auth: {auth}")
+        self.latency = latency
+        self.throttle = _Throttle(bandwidth)
+        self.auth = auth
+        self.users = users
+        self.blobs: Dict[str, bytes] = {}
+        self.repo_blobs: Dict[str, Set[str]] = {}
+        self.manifests: Dict[str, Dict[str, Tuple[str, bytes]]] = {}
+        self.tags: Dict[str, Dict[str, str]] = {}
+        self.uploads: Dict[str, Tuple[str, bytearray]] = {}
+        self.faults: List[Fault] = []
+        # the (method, route template) of the requests received
+        self.requests: List[Tuple[str, str]] = []
+        self._tokens: Set[str] = set()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("the registry is not started")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeRegistry":
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        server.daemon_threads = True
+        server.registry = self  # type: ignore
+        self._server = server
+        threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.05}, name="fake-registry", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeRegistry":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def inject_fault(self, *args, **kwargs) -> Fault:
+        """make the matching requests fail, the arguments are passed to `Fault`
+
+        Usage:
+        >>> registry.inject_fault("PATCH", "blobs/uploads/{uuid}", status=None)  # drop the connection once
+        >>> registry.inject_fault(status=503, times=None, probability=0.01)  # fail 1% of the requests
+        """
+        fault = Fault(*args, **kwargs)
+        with self._lock:
+            self.faults.append(fault)
+        return fault
+
+    def add_blob(self, repo: str, data: bytes) -> str:
+        """put the blob into the repo, return its digest"""
+        digest = _digest(data)
+        with self._lock:
+            self.blobs[digest] = data
+            self.repo_blobs.setdefault(repo, set()).add(digest)
+        return digest
+
+    def add_manifest(self, repo: str, reference: str, manifest: bytes, media_type: str) -> str:
+        """put the manifest into the repo and tag it if the reference is a tag, return its digest"""
+        digest = _digest(manifest)
+        with self._lock:
+            self.manifests.setdefault(repo, {})[digest] = (media_type, manifest)
+            if reference != digest:
+                self.tags.setdefault(repo, {})[reference] = digest
+        return digest
+
+    def reset_requests(self):
+        with self._lock:
+            self.requests.clear()
+
+    def _take_fault(self, method: str, route: str) -> Optional[Fault]:
+        with self._lock:
+            for fault in self.faults:
+                if fault.matches(method, route) and self._random.random() < fault.probability:
+                    if fault.times is not None:
+                        fault.times -= 1
+                    return fault
+        return None
+
+    # the handlers of the routes, they return (status, headers, body) or raise `_Response`
+
+    def _dispatch(self, method: str, path: str, query: Dict[str, str], headers, body: bytes):
+        if path == _TOKEN_PATH:
+            return self._issue_token(query, headers)
+        self._authorize(path, query, headers)
+        if path in ("/v2", "/v2/"):
+            return 200, {"Content-Type": "application/json"}, b"{}"
+        if path == "/v2/_catalog":
+            with self._lock:
+                repositories = sorted(self.repo_blobs.keys() | self.manifests.keys())
+            return self._paginate(path, "repositories", repositories, query)
+
+        matched = _UPLOAD_PATTERN.match(path)
+        if matched:
+            return self._handle_upload(method, matched["name"], matched["uuid"], query, headers, body)
+        matched = _BLOB_PATTERN.match(path)
+        if matched:
+            return self._handle_blob(method, matched["name"], matched["digest"])
+        matched = _MANIFEST_PATTERN.match(path)
+        if matched:
+            return self._handle_manifest(method, matched["name"], matched["reference"], headers, body)
+        matched = _TAGS_PATTERN.match(path)
+        if matched and method == "GET":
+            name = matched["name"]
+            with self._lock:
+                if name not in self.tags:
+                    raise _error(404, "NAME_UNKNOWN", "repository name not known to registry")
+                tags = sorted(self.tags[name])
+            return self._paginate(f"/v2/{name}/tags/list", "tags", tags, query, name=name)
+        raise _error(404, "UNSUPPORTED", "the operation is unsupported")
+
+    def _challenge(self, path: str) -> str:
+        if self.auth == "basic":
+            return f'Basic realm="{_SERVICE}"'
+        challenge = f'Bearer realm="{self.url}{_TOKEN_PATH}",service="{_SERVICE}"'
+        for pattern in (_UPLOAD_PATTERN, _BLOB_PATTERN, _MANIFEST_PATTERN, _TAGS_PATTERN):
+            matched = pattern.match(path)
+            if matched:
+                return challenge + f',scope="repository:{matched["name"]}:pull,push"'
+        return challenge
+
+    def _check_password(self, authorization: str) -> bool:
+        if self.users is None:
+            return True
+        if not authorization.startswith("Basic "):
+            return False
+        username, _, password = base64.b64decode(authorization[6:]).decode().partition(":")
+        return self.users.get(username) == password
+
+    def _authorize(self, path: str, query: Dict[str, str], headers):
+        if self.auth is None:
+            return
+        authorization = headers.get("Authorization") or ""
+        if self.auth == "basic" and authorization and self._check_password(authorization):
+            return
+        if self.auth == "token" and authorization.startswith("Bearer ") and authorization[7:] in self._tokens:
+            return
+        raise _error(401, "UNAUTHORIZED", "authentication required", {"WWW-Authenticate": self._challenge(path)})
+
+    def _issue_token(self, query: Dict[str, str], headers):
+        if self.auth != "token" or query.get("service") != _SERVICE:
+            raise _error(404, "UNSUPPORTED", "the operation is unsupported")
+        if not self._check_password(headers.get("Authorization") or ""):
+            raise _error(401, "UNAUTHORIZED", "invalid credentials")
+        token = uuid_lib.uuid4().hex
+        with self._lock:
+            self._tokens.add(token)
+        return 200, {"Content-Type": "application/json"}, json.dumps({"token": token, "expires_in": 300}).encode()
+
+    def _paginate(self, path: str, key: str, items: List[str], query: Dict[str, str], name: Optional[str] = None):
+        last = query.get("last")
+        if last:
+            items = [item for item in items if item > last]
+        headers = {"Content-Type": "application/json"}
+        if "n" in query:
+            n = int(query["n"])
+            if len(items) > n:
+                items = items[:n]
+                headers["Link"] = f'<{path}?{urlencode({"n": n, "last": items[-1]})}>; rel="next"'
+        data: Dict[str, object] = {key: items}
+        if name is not None:
+            data["name"] = name
+        return 200, headers, json.dumps(data).encode()
+
+    def _handle_blob(self, method: str, name: str, digest: str):
+        with self._lock:
+            data = self.blobs.get(digest) if digest in self.repo_blobs.get(name, ()) else None
+            if data is not None and method == "DELETE":
+                self.repo_blobs[name].discard(digest)
+                return 202, {}, b""
+        if data is None:
+            raise _error(404, "BLOB_UNKNOWN", "blob unknown to registry")
+        if method not in ("GET", "HEAD"):
+            raise _error(405, "UNSUPPORTED", "the operation is unsupported")
+        headers = {"Content-Type": "application/octet-stream", "Docker-Content-Digest": digest}
+        return 200, headers, data
+
+    def _upload_headers(self, name: str, upload_id: str, received: int) -> Dict[str, str]:
+        # the locations are absolute, like the ones of the distribution registry
+        return {
+            "Location": f"{self.url}/v2/{name}/blobs/uploads/{upload_id}",
+            "Docker-Upload-UUID": upload_id,
+            "Range": f"0-{max(received - 1, 0)}",
+        }
+
+    def _commit_blob(self, name: str, digest: Optional[str], data: bytes):
+        if not digest or _digest(data) != digest:
+            raise _error(400, "DIGEST_INVALID", "provided digest did not match uploaded content")
+        self.add_blob(name, data)
+        headers = {"Location": f"{self.url}/v2/{name}/blobs/{digest}", "Docker-Content-Digest": digest}
+        return 201, headers, b""
+
+    def _start_upload(self, name: str, query: Dict[str, str], body: bytes):
+        """mount the blob, upload the monolithic blob, or initiate a resumable upload"""
+        mount, from_repo = query.get("mount"), query.get("from")
+        if mount and from_repo:
+            with self._lock:
+                mountable = mount in self.repo_blobs.get(from_repo, ())
+                if mountable:
+                    self.repo_blobs.setdefault(name, set()).add(mount)
+            if mountable:
+                return 201, {"Location": f"{self.url}/v2/{name}/blobs/{mount}", "Docker-Content-Digest": mount}, b""
+        elif "digest" in query:
+            return self._commit_blob(name, query["digest"], body)
+        upload_id = uuid_lib.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = (name, bytearray())
+        return 202, self._upload_headers(name, upload_id, 0), b""
+
+    def _handle_upload(self, method: str, name: str, upload_id: str, query: Dict[str, str], headers, body: bytes):
+        if method == "POST" and not upload_id:
+            return self._start_upload(name, query, body)
+
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None or upload[0] != name:
+            raise _error(404, "BLOB_UPLOAD_UNKNOWN", "blob upload unknown to registry")
+        buffer = upload[1]
+
+        if method == "GET":
+            return 204, self._upload_headers(name, upload_id, len(buffer)), b""
+        if method == "DELETE":
+            with self._lock:
+                self.uploads.pop(upload_id, None)
+            return 204, {}, b""
+        if method in ("PATCH", "PUT") and body:
+            content_range = headers.get("Content-Range")
+            if content_range and int(content_range.split("-", 1)[0]) != len(buffer):
+                raise _Response(416, self._upload_headers(name, upload_id, len(buffer)))
+            buffer.extend(body)
+        if method == "PATCH":
+            return 202, self._upload_headers(name, upload_id, len(buffer)), b""
+        if method == "PUT":
+            response = self._commit_blob(name, query.get("digest"), bytes(buffer))
+            with self._lock:
+                self.uploads.pop(upload_id, None)
+            return response
+        raise _error(405, "UNSUPPORTED", "the operation is unsupported")
+
+    def _handle_manifest(self, method: str, name: str, reference: str, headers, body: bytes):
+        if method == "PUT":
+            media_type = headers.get("Content-Type") or "application/vnd.docker.distribution.manifest.v2+json"
+            self._check_manifest_blobs(name, body)
+            digest = self.add_manifest(name, reference, body, media_type)
+            return 201, {"Location": f"{self.url}/v2/{name}/manifests/{digest}", "Docker-Content-Digest": digest}, b""
+
+        with self._lock:
+            digest = reference if ":" in reference else self.tags.get(name, {}).get(reference)
+            manifest = self.manifests.get(name, {}).get(digest) if digest else None
+            if manifest is not None and method == "DELETE":
+                del self.manifests[name][digest]  # type: ignore
+                for tag, tagged in list(self.tags.get(name, {}).items()):
+                    if tagged == digest:
+                        del self.tags[name][tag]
+                return 202, {}, b""
+        if manifest is None:
+            raise _error(404, "MANIFEST_UNKNOWN", "manifest unknown")
+        if method not in ("GET", "HEAD"):
+            raise _error(405, "UNSUPPORTED", "the operation is unsupported")
+        media_type, data = manifest
+        return 200, {"Content-Type": media_type, "Docker-Content-Digest": digest}, data  # type: ignore
+
+    def _check_manifest_blobs(self, name: str, body: bytes):
+        """the config and the layers of the manifest (except the schema1 one) must be in the repo"""
+        try:
+            manifest = json.loads(body)
+        except ValueError:
+            raise _error(400, "MANIFEST_INVALID", "manifest invalid") from None
+        if manifest.get("schemaVersion") == 1:
+            return
+        descriptors = [manifest.get("config") or {}] + list(manifest.get("layers") or [])
+        with self._lock:
+            known = self.repo_blobs.get(name, set())
+            for descriptor in descriptors:
+                if descriptor.get("digest") not in known and not descriptor.get("urls"):
+                    raise _error(400, "MANIFEST_BLOB_UNKNOWN", f"blob unknown: {descriptor.get('digest')}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ThreadingHTTPServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self, registry: FakeRegistry) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";", 1)[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+                registry.throttle.consume(size)
+            return b"".join(chunks)
+
+        remaining = int(self.headers.get("Content-Length") or 0)
+        chunks = []
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, _CHUNK_SIZE))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            registry.throttle.consume(len(chunk))
+        return b"".join(chunks)
+
+    def _handle(self):
+        registry: FakeRegistry = self.server.registry  # type: ignore
+        parsed = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        route = "token" if parsed.path == _TOKEN_PATH else get_route_template(parsed.path)
+        with registry._lock:
+            registry.requests.append((self.command, route))
+        body = self._read_body(registry)
+
+        fault = registry._take_fault(self.command, route)
+        if registry.latency:
+            time.sleep(registry.latency)
+        if fault is not None and fault.status is None:
+            self.close_connection = True
+            return
+        try:
+            if fault is not None:
+                raise _error(fault.status, "UNAVAILABLE", "injected fault")  # type: ignore
+            status, headers, data = registry._dispatch(self.command, parsed.path, query, self.headers, body)
+        except _Response as e:
+            status, headers, data = e.status, e.headers, e.body
+        self._respond(registry, status, headers, data)
+
+    def _respond(self, registry: FakeRegistry, status: int, headers: Dict[str, str], data: bytes):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Docker-Distribution-API-Version", "registry/2.0")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        for offset in range(0, len(data), _CHUNK_SIZE):
+            chunk = data[offset : offset + _CHUNK_SIZE]
+            registry.throttle.consume(len(chunk))
+            self.wfile.write(chunk)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
@@ -58,3 +58,15 @@ class TestBlob:
         Blob(repo=temp_repo, client=registry_client).delete(manifest.config.digest)
         with pytest.raises(ResourceNotFound):
             Blob(fileobj=fh2, repo=temp_repo, client=registry_client).download(digest=manifest.config.digest)
+
+    def test_stat_many(self, repo, reference, registry_client):
+        manifest = ManifestRef(repo=repo, reference=reference, client=registry_client).get()
+        digests = [layer.digest for layer in manifest.layers] + [manifest.config.digest]
+        missing = "sha256:" + "0" * 64
+
+        descriptors = Blob.stat_many(repo, digests + [missing], client=registry_client)
+        assert set(descriptors) == set(digests)
+        assert descriptors[manifest.config.digest].digest == manifest.config.digest
+
+        existence = Blob.exists_many(repo, [manifest.config.digest, missing], client=registry_client)
+        assert existence == {manifest.config.digest: True, missing: False}
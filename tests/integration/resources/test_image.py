@@ -2,6 +2,7 @@ import gzip
 import hashlib
 import json
 import tarfile
+from unittest import mock
 
 import docker
 import pytest
@@ -68,6 +69,36 @@ class TestImageRef:
             Blob(repo=temp_repo, digest=layer.digest, client=registry_client).delete()
         Blob(repo=temp_repo, digest=manifest.config.digest, client=registry_client).delete()
 
+    def test_push_v2_noop(self, repo, reference, temp_repo, temp_reference, registry_client):
+        ref = ImageRef.from_image(
+            from_repo=repo,
+            from_reference=reference,
+            to_repo=temp_repo,
+            to_reference=temp_reference,
+            client=registry_client,
+        )
+        manifest = ref.push_v2()
+
+        retagged = ImageRef.from_image(
+            from_repo=repo,
+            from_reference=reference,
+            to_repo=temp_repo,
+            to_reference=temp_reference + "-retag",
+            client=registry_client,
+        )
+        with mock.patch.object(Blob, "upload") as upload, mock.patch.object(Blob, "mount_from") as mount_from:
+            assert ManifestRef.compute_digest(retagged.push_v2()) == ManifestRef.compute_digest(manifest)
+            assert not upload.called
+            assert not mount_from.called
+        assert sorted(Tags(repo=temp_repo, client=registry_client).list()) == sorted(
+            [temp_reference, temp_reference + "-retag"]
+        )
+
+        ManifestRef(repo=temp_repo, reference=temp_reference, client=registry_client).delete()
+        for layer in manifest.layers:
+            Blob(repo=temp_repo, digest=layer.digest, client=registry_client).delete()
+        Blob(repo=temp_repo, digest=manifest.config.digest, client=registry_client).delete()
+
     def test_add_exists_layer(self, repo, reference, registry_client):
         ref = ImageRef.from_image(from_repo=repo, from_reference=reference, client=registry_client)
         ref.add_layer(ref.layers[0])
@@ -75,6 +106,14 @@ class TestImageRef:
         assert ref.layers[0].digest == ref.layers[-1].digest
         assert image_json.rootfs.diff_ids[0] == image_json.rootfs.diff_ids[-1]
 
+    def test_add_exists_layer_without_download(self, repo, reference, registry_client):
+        ref = ImageRef.from_image(from_repo=repo, from_reference=reference, client=registry_client)
+        with mock.patch.object(Blob, "download") as download:
+            ref.add_layer(ref.layers[0])
+            assert not download.called
+        image_json = ref.image_json
+        assert image_json.rootfs.diff_ids[0] == image_json.rootfs.diff_ids[-1]
+
     def test_add_local_layer(self, tmp_path, repo, reference, registry_client):
         ref = ImageRef.from_image(from_repo=repo, from_reference=reference, client=registry_client)
 
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from moby_distribution.registry.cache import LayerMetadataIndex, default_layer_index, set_default_layer_index
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.exceptions import ResourceNotFound
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources import image
+from moby_distribution.registry.resources.image import ImageRef, LayerRef
+from moby_distribution.spec.manifest import ManifestSchema2
+from moby_distribution.testing import FakeRegistry
+
+assets = Path(__file__).parent.parent.parent / "spec" / "assets"
+
+
+@pytest.fixture
+def initial_config():
+    return json.dumps(json.loads((assets / "image_json.pydantic_v2.json").read_text()), separators=(",", ":"))
+
+
+@pytest.fixture
+def image_ref(initial_config):
+    return ImageRef(repo="dummy", reference="latest", layers=[], initial_config=initial_config, client=None)
+
+
+@pytest.fixture(autouse=True)
+def layer_index():
+    index = LayerMetadataIndex()
+    set_default_layer_index(index)
+    yield index
+    default_layer_index.__dict__.pop("_wrapped", None)
+
+
+@pytest.fixture
+def gzip_layer(tmp_path):
+    path = tmp_path / "layer.tar.gz"
+    path.write_bytes(gzip.compress(b"dummy layer"))
+    return path
+
+
+class TestImageJSON:
+    def test_parse_once(self, image_ref):
+        with mock.patch.object(image.ImageJSON, "parse", wraps=image.ImageJSON.parse) as parse:
+            assert image_ref.image_json is image_ref.image_json
+            assert image_ref.image_json_str
+            assert parse.call_count == 1
+
+    def test_clean(self, image_ref, initial_config):
+        assert image_ref.image_json_str == initial_config
+        assert image_ref.image_json_digest == f"sha256:{hashlib.sha256(initial_config.encode()).hexdigest()}"
+
+    def test_update_config(self, image_ref, initial_config):
+        image_ref.update_config(Env=["FOO=bar"])
+
+        assert image_ref.image_json.config.Env == ["FOO=bar"]
+        assert json.loads(image_ref.image_json_str)["config"]["Env"] == ["FOO=bar"]
+        assert image_ref.image_json_digest != f"sha256:{hashlib.sha256(initial_config.encode()).hexdigest()}"
+
+    def test_update_unknown_config(self, image_ref):
+        with pytest.raises(ValueError):
+            image_ref.update_config(Unknown=1)
+
+    def test_edit_image_json(self, image_ref):
+        before = image_ref.image_json_digest
+        with image_ref.edit_image_json() as image_json:
+            image_json.config.User = "nobody"
+        assert json.loads(image_ref.image_json_str)["config"]["User"] == "nobody"
+        assert image_ref.image_json_digest != before
+
+    @pytest.mark.parametrize(
+        "edit", [lambda image_json: None, lambda image_json: setattr(image_json, "os", image_json.os)]
+    )
+    def test_edit_image_json_unchanged(self, image_ref, initial_config, edit):
+        with image_ref.edit_image_json() as image_json:
+            edit(image_json)
+        image_ref.update_config(User=image_ref.image_json.config.User)
+
+        assert image_ref.image_json_str == initial_config
+        assert image_ref.image_json_digest == f"sha256:{hashlib.sha256(initial_config.encode()).hexdigest()}"
+
+    def test_add_layer_invalidate(self, image_ref, gzip_layer):
+        before = image_ref.image_json_str
+        image_ref.add_layer(LayerRef(local_path=gzip_layer))
+
+        diff_id = f"sha256:{hashlib.sha256(b'dummy layer').hexdigest()}"
+        assert image_ref.image_json.rootfs.diff_ids[-1] == diff_id
+        assert json.loads(image_ref.image_json_str)["rootfs"]["diff_ids"][-1] == diff_id
+        assert image_ref.image_json_str != before
+
+
+class TestAddLayer:
+    def test_record_local_layer(self, image_ref, gzip_layer, layer_index):
+        descriptor = image_ref.add_layer(LayerRef(local_path=gzip_layer))
+        assert layer_index.get(descriptor.digest) == f"sha256:{hashlib.sha256(b'dummy layer').hexdigest()}"
+
+    def test_remote_layer_known_diff_id(self, image_ref, layer_index):
+        with FakeRegistry() as registry, DockerRegistryV2Client(registry.url, rate_limiter=NoRateLimit()) as client:
+            digest = registry.add_blob("other", b"layer")
+            layer_index.record(digest, "sha256:1")
+            image_ref.client = client
+            descriptor = image_ref.add_layer(LayerRef(repo="other", digest=digest, size=5, exists=True))
+            # the layer is checked by HEAD, but not downloaded
+            assert registry.requests == [("HEAD", "blobs/{digest}")]
+
+        assert descriptor.digest == digest
+        assert descriptor.size == 5
+        assert image_ref.image_json.rootfs.diff_ids[-1] == "sha256:1"
+
+    @pytest.mark.parametrize("size, data, error", [(10, b"layer", ValueError), (5, None, ResourceNotFound)])
+    def test_remote_layer_known_diff_id_mismatch(self, image_ref, layer_index, size, data, error):
+        with FakeRegistry() as registry, DockerRegistryV2Client(registry.url, rate_limiter=NoRateLimit()) as client:
+            digest = registry.add_blob("other", data) if data else f"sha256:{hashlib.sha256(b'layer').hexdigest()}"
+            layer_index.record(digest, "sha256:1")
+            image_ref.client = client
+            with pytest.raises(error):
+                image_ref.add_layer(LayerRef(repo="other", digest=digest, size=size, exists=True))
+
+        assert not image_ref.layers
+
+    @pytest.mark.parametrize(
+        "rootfs, expected",
+        [({"type": "layers", "diff_ids": ["sha256:1"]}, "sha256:1"), (None, None), ({"diff_ids": None}, None)],
+    )
+    def test_from_image_record_diff_ids(self, layer_index, rootfs, expected):
+        with FakeRegistry() as registry, DockerRegistryV2Client(registry.url, rate_limiter=NoRateLimit()) as client:
+            config = json.dumps({"architecture": "amd64", "os": "linux", "rootfs": rootfs}).encode()
+            manifest = {
+                "schemaVersion": 2,
+                "mediaType": ManifestSchema2.content_type(),
+                "config": {
+                    "mediaType": "application/vnd.docker.container.image.v1+json",
+                    "size": len(config),
+                    "digest": registry.add_blob("a", config),
+                },
+                "layers": [
+                    {
+                        "mediaType": "application/vnd.docker.image.rootfs.diff.tar.gzip",
+                        "size": 5,
+                        "digest": registry.add_blob("a", b"layer"),
+                    }
+                ],
+            }
+            registry.add_manifest("a", "latest", json.dumps(manifest).encode(), ManifestSchema2.content_type())
+
+            image_ref = ImageRef.from_image(from_repo="a", from_reference="latest", client=client)
+
+        assert layer_index.get(image_ref.layers[0].digest) == expected
+
+
+class TestPushV2:
+    @pytest.fixture
+    def registry(self):
+        with FakeRegistry() as registry:
+            yield registry
+
+    @pytest.fixture
+    def client(self, registry):
+        with DockerRegistryV2Client(registry.url, rate_limiter=NoRateLimit()) as client:
+            yield client
+
+    @pytest.fixture
+    def new_image(self, client, initial_config, tmp_path):
+        def new_image(reference, contents):
+            ref = ImageRef(repo="a", reference=reference, layers=[], initial_config=initial_config, client=client)
+            for content in contents:
+                path = tmp_path / f"{hashlib.sha256(content).hexdigest()}.tar.gz"
+                path.write_bytes(gzip.compress(content, mtime=0))
+                ref.add_layer(LayerRef(local_path=path))
+            return ref
+
+        return new_image
+
+    def test_upload_missing_layers_only(self, registry, new_image):
+        new_image("v1", [b"base", b"app-v1"]).push_v2()
+        registry.requests.clear()
+
+        manifest = new_image("v2", [b"base", b"app-v2"]).push_v2()
+        assert all(layer.digest in registry.repo_blobs["a"] for layer in manifest.layers)
+        # the new layer and the new config are uploaded, the base layer is not
+        assert registry.requests.count(("POST", "blobs/uploads/")) == 2
+        assert registry.requests.count(("PUT", "manifests/{reference}")) == 1
+
+    def test_retag_existing_manifest(self, registry, new_image):
+        pushed = new_image("v1", [b"base"]).push_v2()
+        registry.requests.clear()
+
+        assert new_image("v1", [b"base"]).push_v2() == pushed
+        assert ("PUT", "manifests/{reference}") not in registry.requests
+
+        assert new_image("latest", [b"base"]).push_v2() == pushed
+        assert registry.tags["a"]["latest"] == registry.tags["a"]["v1"]
+        # only tagged, no blob is checked or uploaded
+        assert registry.requests.count(("PUT", "manifests/{reference}")) == 1
+        assert not [route for _, route in registry.requests if route.startswith("blobs/")]
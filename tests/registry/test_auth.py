@@ -14,6 +14,7 @@ from moby_distribution.registry.auth import (
     DockerRegistryTokenAuthentication,
     HTTPBasicAuthentication,
     TokenAuthorizationProvider,
+    UniversalAuthentication,
 )
 from moby_distribution.registry.exceptions import AuthFailed
 
@@ -93,6 +94,19 @@ class TestDockerRegistryTokenAuthentication:
                 auth_response
             )
 
+    def test_authenticate_with_session(self, auth_response):
+        session = requests.Session()
+        adapter = requests_mock.Adapter()
+        session.mount("mock://", adapter)
+        adapter.register_uri("GET", "mock://auth.docker.io/token", json=auth_response)
+
+        www_authenticate = 'Bearer realm="mock://auth.docker.io/token",service="dummy",scope="dummy"'
+        with mock.patch("moby_distribution.registry.auth.requests.get") as module_get:
+            authed = UniversalAuthentication(www_authenticate, session=session).authenticate("username", "password")
+            assert not module_get.called
+        assert isinstance(authed, TokenAuthorizationProvider)
+        assert adapter.call_count == 1
+
     def test_authenticate_failed(self, mock_adapter):
         www_authenticate = (
             'Bearer realm="mock://auth.docker.io/token",service="dummy",scope="dummy"'
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from moby_distribution.registry.cache import (
+    EndpointStatusCache,
+    LayerMetadataIndex,
+    get_cache_dir,
+    parse_endpoint_statuses,
+)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return tmp_path / "cache" / "layers.json"
+
+
+class TestGetCacheDir:
+    def test_env(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("MOBY_DISTRIBUTION_CACHE_DIR", str(tmp_path))
+        assert get_cache_dir() == tmp_path
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("MOBY_DISTRIBUTION_CACHE_DIR", "")
+        assert get_cache_dir() is None
+
+    def test_memory_only_by_default(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("MOBY_DISTRIBUTION_CACHE_DIR", raising=False)
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        assert get_cache_dir() is None
+
+
+class TestLayerMetadataIndex:
+    def test_record_and_get(self, index_path):
+        index = LayerMetadataIndex(index_path)
+        assert index.get("sha256:a") is None
+
+        index.record_many(["sha256:a", "sha256:b"], ["sha256:1", "sha256:2"])
+        assert index.get("sha256:a") == "sha256:1"
+        assert index.get("sha256:b") == "sha256:2"
+        assert json.loads(index_path.read_text()) == {"sha256:a": "sha256:1", "sha256:b": "sha256:2"}
+
+    def test_load_persisted(self, index_path):
+        LayerMetadataIndex(index_path).record("sha256:a", "sha256:1")
+        assert LayerMetadataIndex(index_path).get("sha256:a") == "sha256:1"
+
+    def test_merge_with_other_process(self, index_path):
+        index = LayerMetadataIndex(index_path)
+        index.record("sha256:a", "sha256:1")
+        LayerMetadataIndex(index_path).record("sha256:b", "sha256:2")
+
+        index.record("sha256:c", "sha256:3")
+        assert json.loads(index_path.read_text()) == {
+            "sha256:a": "sha256:1",
+            "sha256:b": "sha256:2",
+            "sha256:c": "sha256:3",
+        }
+
+    def test_max_entries(self, index_path):
+        index = LayerMetadataIndex(index_path, max_entries=2)
+        index.record_many(["sha256:a", "sha256:b"], ["sha256:1", "sha256:2"])
+        # the recently used entry is kept
+        assert index.get("sha256:a") == "sha256:1"
+        index.record("sha256:c", "sha256:3")
+
+        assert index.get("sha256:b") is None
+        assert index.get("sha256:a") == "sha256:1"
+        assert index.get("sha256:c") == "sha256:3"
+        assert len(json.loads(index_path.read_text())) == 2
+
+    def test_not_rewritten_if_known(self, index_path):
+        index = LayerMetadataIndex(index_path)
+        index.record("sha256:a", "sha256:1")
+        index_path.unlink()
+
+        index.record("sha256:a", "sha256:1")
+        assert not index_path.exists()
+
+    def test_broken_file(self, index_path):
+        index_path.parent.mkdir(parents=True)
+        index_path.write_text("not json")
+        index = LayerMetadataIndex(index_path)
+        assert index.get("sha256:a") is None
+        index.record("sha256:a", "sha256:1")
+        assert LayerMetadataIndex(index_path).get("sha256:a") == "sha256:1"
+
+    def test_memory_only(self):
+        index = LayerMetadataIndex()
+        index.record("sha256:a", "sha256:1")
+        assert index.get("sha256:a") == "sha256:1"
+
+
+class TestEndpointStatusCache:
+    @pytest.fixture
+    def now(self):
+        return [1000.0]
+
+    @pytest.fixture
+    def cache_path(self, tmp_path):
+        return tmp_path / "cache" / "endpoints.json"
+
+    def test_ttl(self, cache_path, now):
+        cache = EndpointStatusCache(cache_path, ttl=100, negative_ttl=10, clock=lambda: now[0])
+        cache.put("secure", (True, False))
+        cache.put("insecure", (False, False))
+        assert cache.get("secure") == (True, False)
+        assert cache.get("insecure") == (False, False)
+
+        now[0] += 10
+        assert cache.get("secure") == (True, False)
+        assert cache.get("insecure") is None
+        now[0] += 90
+        assert cache.get("secure") is None
+
+    def test_load_persisted(self, cache_path, now):
+        EndpointStatusCache(cache_path, clock=lambda: now[0]).put("registry:5000", (False, False))
+        assert EndpointStatusCache(cache_path, clock=lambda: now[0]).get("registry:5000") == (False, False)
+        assert json.loads(cache_path.read_text())["registry:5000"]["https"] is False
+
+    def test_primed(self, cache_path):
+        cache = EndpointStatusCache(cache_path, primed={"registry": (True, True)})
+        cache.prime({"harbor": (True, False)})
+        assert cache.get("registry") == (True, True)
+        assert cache.get("harbor") == (True, False)
+        assert not cache_path.exists()
+
+    def test_broken_file(self, cache_path):
+        cache_path.parent.mkdir(parents=True)
+        cache_path.write_text(json.dumps({"registry": {"https": "yes"}}))
+        assert EndpointStatusCache(cache_path).get("registry") is None
+
+
+def test_parse_endpoint_statuses():
+    assert parse_endpoint_statuses("registry.local:5000=http, harbor.corp=https-insecure,quay.io=https,bad") == {
+        "registry.local:5000": (False, False),
+        "harbor.corp": (True, False),
+        "quay.io": (True, True),
+    }
@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry.auth import UniversalAuthentication
+from moby_distribution.registry.client import DockerRegistryV2Client, PoolConfig
+
+
+@pytest.fixture
+def client():
+    return DockerRegistryV2Client("mock://registry", username="username", password="password")
+
+
+@pytest.fixture
+def mock_adapter(client):
+    adapter = requests_mock.Adapter()
+    client.session.mount("mock://", adapter)
+    return adapter
+
+
+class TestPoolConfig:
+    def test_default(self, client):
+        adapter = client.session.get_adapter("https://registry")
+        assert adapter._pool_maxsize == PoolConfig().pool_maxsize
+        assert client.session.headers.get("Connection") != "close"
+
+    def test_custom(self):
+        client = DockerRegistryV2Client(
+            "https://registry", pool_config=PoolConfig(pool_maxsize=64, pool_block=True, keep_alive=False)
+        )
+        for prefix in ["http://", "https://"]:
+            adapter = client.session.get_adapter(prefix + "storage.example.com")
+            assert adapter._pool_maxsize == 64
+            assert adapter._pool_block is True
+        assert client.session.headers["Connection"] == "close"
+
+
+class TestConcurrentAuthentication:
+    def test_authenticate_once(self, client, mock_adapter):
+        concurrency = 8
+        barrier = threading.Barrier(concurrency)
+
+        def callback(request, context):
+            if request.headers.get("Authorization", "").startswith("Basic "):
+                context.status_code = 200
+                return "{}"
+            # make sure all the requests are challenged at the same time
+            barrier.wait(timeout=5)
+            context.status_code = 401
+            context.headers["www-authenticate"] = 'Basic realm="registry"'
+            return ""
+
+        mock_adapter.register_uri("GET", "mock://registry/v2/", text=callback)
+        with mock.patch.object(
+            UniversalAuthentication, "authenticate", autospec=True, side_effect=UniversalAuthentication.authenticate
+        ) as authenticate, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            assert all(pool.map(lambda _: client.ping(), range(concurrency)))
+        assert authenticate.call_count == 1
+
+    def test_reauthenticate_for_new_challenge(self, client):
+        with mock.patch.object(UniversalAuthentication, "authenticate") as authenticate:
+            client._refresh_authorization('Basic realm="a"', stale="")
+            client._refresh_authorization('Basic realm="b"', stale="")
+        assert authenticate.call_count == 2
+
+
+class TestTokenAuthentication:
+    def test_auth_through_client_session(self, client, mock_adapter):
+        mock_adapter.register_uri(
+            "GET",
+            "mock://registry/v2/",
+            [
+                {
+                    "status_code": 401,
+                    "headers": {"www-authenticate": 'Bearer realm="mock://auth/token",service="registry"'},
+                },
+                {"status_code": 200, "json": {}},
+            ],
+        )
+        mock_adapter.register_uri("GET", "mock://auth/token", json={"token": "dummy"})
+
+        assert client.ping()
+        assert mock_adapter.last_request.headers["Authorization"] == "Bearer dummy"
+        assert client.auth_stats.count == 1
+        assert client.auth_stats.last_seconds > 0
+
+
+class TestValidateResponse:
+    def test_success_without_rendering_curl(self, client, mock_adapter):
+        mock_adapter.register_uri("GET", "mock://registry/v2/", json={})
+        with mock.patch("curlify.to_curl") as to_curl:
+            assert client.ping()
+        assert not to_curl.called
+
+    def test_failure_log(self, client, mock_adapter, caplog):
+        mock_adapter.register_uri("GET", "mock://registry/v2/", status_code=500)
+        client._authed = mock.MagicMock(provide=mock.MagicMock(return_value="Bearer secret"))
+        with caplog.at_level("WARNING"):
+            assert not client.ping()
+        assert "curl" in caplog.text
+        assert "Bearer secret" not in caplog.text
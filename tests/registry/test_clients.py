@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.clients import ClientPool
+from moby_distribution.spec.endpoint import APIEndpoint
+
+
+@pytest.fixture
+def from_api_endpoint():
+    def create(api_endpoint, **kwargs):
+        return mock.MagicMock(api_endpoint=api_endpoint, **kwargs)
+
+    with mock.patch.object(DockerRegistryV2Client, "from_api_endpoint", side_effect=create) as m:
+        yield m
+
+
+@pytest.fixture
+def now():
+    return [0.0]
+
+
+@pytest.fixture
+def pool(now):
+    return ClientPool(max_size=2, idle_timeout=60, clock=lambda: now[0])
+
+
+class TestClientPool:
+    def test_shared(self, pool, from_api_endpoint):
+        endpoint = APIEndpoint(url="registry")
+        client = pool.get(endpoint, username="u", password="p")
+        assert pool.get(endpoint, username="u", password="p") is client
+        assert from_api_endpoint.call_count == 1
+
+        assert pool.get(endpoint, username="u", password="other") is not client
+        assert pool.get(endpoint, username="u", password="p", default_timeout=10) is not client
+
+    def test_idle_timeout(self, pool, now, from_api_endpoint):
+        client = pool.get(APIEndpoint(url="registry"))
+        now[0] = 59
+        assert pool.get(APIEndpoint(url="registry")) is client
+
+        now[0] = 59 + 60
+        pool.evict_idle()
+        assert len(pool) == 0
+        assert client.close.called
+        assert pool.get(APIEndpoint(url="registry")) is not client
+
+    def test_recreate_expired(self, pool, now, from_api_endpoint):
+        client = pool.get(APIEndpoint(url="registry"))
+        now[0] = 60
+        recreated = pool.get(APIEndpoint(url="registry"))
+        assert recreated is not client
+        assert client.close.called
+        assert not recreated.close.called
+        assert len(pool) == 1
+
+    def test_max_size(self, pool, now, from_api_endpoint):
+        clients = []
+        for url in ("a", "b", "a", "c"):
+            now[0] += 1
+            clients.append(pool.get(APIEndpoint(url=url)))
+        assert len(pool) == 2
+        # "b" is the least recently used one
+        assert clients[1].close.called
+        assert not clients[0].close.called
+
+    def test_not_close_given_transport(self, pool, now, from_api_endpoint):
+        client = pool.get(APIEndpoint(url="registry"), transport=mock.MagicMock())
+        pool.clear()
+        assert not client.close.called
+
+    def test_create_once(self, pool, from_api_endpoint):
+        barrier = threading.Barrier(4)
+
+        def create(api_endpoint, **kwargs):
+            time.sleep(0.1)
+            return mock.MagicMock()
+
+        from_api_endpoint.side_effect = create
+
+        def get(_):
+            barrier.wait()
+            return pool.get(APIEndpoint(url="registry"))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            clients = list(executor.map(get, range(4)))
+        assert all(client is clients[0] for client in clients)
+        assert from_api_endpoint.call_count == 1
@@ -0,0 +1,196 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.concurrency import (
+    BLOB_DOWNLOAD,
+    BLOB_UPLOAD,
+    MANIFEST,
+    OTHER,
+    ConcurrencyGovernor,
+    default_governor,
+    get_operation,
+    set_default_governor,
+)
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *args):
+        with self._lock:
+            self.current -= 1
+
+
+@pytest.mark.parametrize(
+    "method, url, expected",
+    [
+        ("GET", "https://registry/v2/a/manifests/latest", MANIFEST),
+        ("PUT", "https://registry/v2/a/manifests/latest", MANIFEST),
+        ("GET", "https://registry/v2/a/blobs/sha256:x", BLOB_DOWNLOAD),
+        ("POST", "https://registry/v2/a/blobs/uploads/", BLOB_UPLOAD),
+        ("patch", "https://registry/v2/a/blobs/uploads/uuid", BLOB_UPLOAD),
+        ("HEAD", "https://registry/v2/a/blobs/sha256:x", OTHER),
+        ("GET", "https://registry/v2/", OTHER),
+    ],
+)
+def test_get_operation(method, url, expected):
+    assert get_operation(method, url) == expected
+
+
+class TestConcurrencyGovernor:
+    def run_concurrently(self, func, concurrency=8):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: func(), range(concurrency)))
+
+    def test_per_operation(self):
+        governor = ConcurrencyGovernor(per_host=None, per_operation={BLOB_UPLOAD: 2})
+        uploading, other = InFlightCounter(), InFlightCounter()
+
+        def upload():
+            with governor.hold("registry", BLOB_UPLOAD), uploading:
+                time.sleep(0.02)
+
+        def do_other():
+            with governor.hold("registry", OTHER), other:
+                time.sleep(0.02)
+
+        self.run_concurrently(upload)
+        self.run_concurrently(do_other)
+        assert uploading.peak == 2
+        assert other.peak > 2
+
+    def test_saturated_operation_not_block_others(self):
+        governor = ConcurrencyGovernor(per_host=4, per_operation={BLOB_UPLOAD: 2})
+        release = threading.Event()
+
+        def upload():
+            with governor.hold("registry", BLOB_UPLOAD):
+                release.wait(5)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for _ in range(8):
+                pool.submit(upload)
+            time.sleep(0.05)
+
+            manifest_got = threading.Event()
+
+            def get_manifest():
+                with governor.hold("registry", MANIFEST):
+                    manifest_got.set()
+
+            threading.Thread(target=get_manifest, daemon=True).start()
+            try:
+                # the uploads waiting for their slots don't hold the slots of the host
+                assert manifest_got.wait(1)
+            finally:
+                release.set()
+
+    def test_per_host(self):
+        governor = ConcurrencyGovernor(per_host=3, per_operation={})
+        counters = {"a": InFlightCounter(), "b": InFlightCounter()}
+
+        def request():
+            for host in ("a", "b"):
+                with governor.hold(host, OTHER), counters[host]:
+                    time.sleep(0.02)
+
+        self.run_concurrently(request)
+        assert counters["a"].peak == 3
+        assert counters["b"].peak == 3
+
+    def test_reentrant(self):
+        governor = ConcurrencyGovernor(per_host=1, per_operation={})
+        with governor.hold("registry", BLOB_DOWNLOAD):
+            with governor.hold("registry", OTHER):
+                pass
+        # the slot is released
+        with governor.hold("registry", OTHER):
+            pass
+
+    def test_reentrant_other_operation(self):
+        governor = ConcurrencyGovernor(per_host=None, per_operation={BLOB_UPLOAD: 1})
+        release = threading.Event()
+
+        def upload():
+            with governor.hold("registry", BLOB_UPLOAD):
+                release.wait(5)
+
+        uploading = threading.Thread(target=upload, daemon=True)
+        uploading.start()
+        time.sleep(0.05)
+
+        nested_got = threading.Event()
+
+        def download_then_upload():
+            with governor.hold("registry", BLOB_DOWNLOAD), governor.hold("registry", BLOB_UPLOAD):
+                nested_got.set()
+
+        threading.Thread(target=download_then_upload, daemon=True).start()
+        try:
+            # the nested upload waits for the slot of its type
+            assert not nested_got.wait(0.1)
+        finally:
+            release.set()
+        assert nested_got.wait(1)
+        uploading.join()
+
+    def test_release_on_error(self):
+        governor = ConcurrencyGovernor(per_host=1, per_operation={BLOB_UPLOAD: 1})
+        with pytest.raises(ValueError), governor.hold("registry", BLOB_UPLOAD):
+            raise ValueError
+        with governor.hold("registry", BLOB_UPLOAD):
+            pass
+
+
+class TestClientGovernor:
+    def test_default_unlimited(self):
+        client = DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+        assert client.governor.per_host is None
+        assert client.governor.per_operation == {}
+
+    def test_set_default_governor(self):
+        governor = ConcurrencyGovernor()
+        set_default_governor(governor)
+        try:
+            client = DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+            assert client.governor.per_host == 32
+        finally:
+            default_governor.__dict__.pop("_wrapped", None)
+
+    def test_shared_by_clients(self):
+        governor = ConcurrencyGovernor(per_host=None, per_operation={BLOB_DOWNLOAD: 2})
+        downloading = InFlightCounter()
+
+        def get_blob(request, context):
+            with downloading:
+                time.sleep(0.02)
+            return b"content"
+
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("GET", "mock://registry/v2/a/blobs/sha256:x", content=get_blob)
+
+        def download():
+            client = DockerRegistryV2Client("mock://registry", governor=governor, rate_limiter=NoRateLimit())
+            client.session.mount("mock://", adapter)
+            Blob(repo="a", digest="sha256:x", client=client, fileobj=io.BytesIO()).download()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: download(), range(8)))
+        assert adapter.call_count == 8
+        assert downloading.peak == 2
@@ -0,0 +1,120 @@
+import time
+from unittest import mock
+
+import pytest
+
+from moby_distribution.registry.cache import EndpointStatusCache, default_endpoint_status_cache
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.detect import detect_api_base_url, probe_endpoint
+from moby_distribution.spec.endpoint import APIEndpoint
+
+
+@pytest.fixture(autouse=True)
+def endpoint_status_cache():
+    cache = EndpointStatusCache()
+    with mock.patch.dict(default_endpoint_status_cache.__dict__, {"_wrapped": cache}):
+        yield cache
+
+
+def delayed(seconds, outcome):
+    def func(*args, **kwargs):
+        time.sleep(seconds)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return func
+
+
+@pytest.fixture
+def race():
+    def race(probe, https, http, timeout=5):
+        def ping_v2(api_base_url, timeout=None):
+            return (https if api_base_url.startswith("https://") else http)()
+
+        with mock.patch.object(APIEndpoint, "is_secure_repository", side_effect=probe), mock.patch(
+            "moby_distribution.registry.detect.ping_v2", side_effect=ping_v2
+        ):
+            start = time.monotonic()
+            result = detect_api_base_url(APIEndpoint(url="registry.local"), timeout=timeout)
+            return result, time.monotonic() - start
+
+    return race
+
+
+@pytest.mark.parametrize(
+    "probe, https, http, expected",
+    [
+        # the valid certificate is confirmed by the https ping before the TLS probe
+        (delayed(1, (True, True)), delayed(0, True), delayed(0, True), ("https://registry.local:443", True)),
+        (delayed(0, (True, True)), delayed(1, None), delayed(1, None), ("https://registry.local:443", True)),
+        (delayed(0, (True, False)), delayed(0.1, False), delayed(0, True), ("https://registry.local:443", False)),
+        # https is not served, needn't wait for the TLS probe
+        (delayed(1, TimeoutError()), delayed(0, None), delayed(0, True), ("http://registry.local:80", False)),
+        (delayed(0, (False, False)), delayed(1, None), delayed(1, None), ("http://registry.local:80", False)),
+    ],
+)
+def test_race(race, probe, https, http, expected):
+    result, elapsed = race(probe, https, http)
+    assert result == expected
+    assert elapsed < 0.5
+
+
+def test_deadline(race):
+    result, elapsed = race(delayed(1, (True, True)), delayed(1, True), delayed(1, True), timeout=0.2)
+    assert result == ("https://registry.local:443", True)
+    assert elapsed < 0.5
+
+
+@pytest.mark.parametrize(
+    "probe, https, http, expected",
+    [
+        # the API is confirmed over http only
+        (delayed(1, (True, True)), delayed(1, True), delayed(0, True), ("http://registry.local:80", False)),
+        # https is ruled out by the ping
+        (delayed(1, (True, True)), delayed(0, None), delayed(1, True), ("http://registry.local:80", False)),
+        # the https ping failed unexpectedly, it doesn't rule https out
+        (delayed(1, (True, True)), delayed(0, RuntimeError()), delayed(0, None), ("https://registry.local:443", True)),
+    ],
+)
+def test_deadline_without_https(race, probe, https, http, expected):
+    result, _ = race(probe, https, http, timeout=0.2)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "status, expected",
+    [
+        ((True, True), ("https://registry.local:443", True)),
+        ((True, False), ("https://registry.local:443", False)),
+        ((False, False), ("http://registry.local:80", False)),
+    ],
+)
+def test_cached(race, endpoint_status_cache, status, expected):
+    endpoint_status_cache.prime({"registry.local": status})
+    result, elapsed = race(delayed(1, (True, True)), delayed(1, True), delayed(1, True))
+    assert result == expected
+    assert elapsed < 0.5
+
+
+def test_probe_endpoint_cached(endpoint_status_cache):
+    endpoint = APIEndpoint(url="registry.local")
+    endpoint_status_cache.prime({"registry.local": (True, True)})
+    with mock.patch.object(APIEndpoint, "is_secure_repository", return_value=(False, False)) as probe:
+        assert probe_endpoint(endpoint) == (True, True)
+        assert not probe.called
+
+        endpoint_status_cache.invalidate("registry.local")
+        assert probe_endpoint(endpoint, timeout=1) == (False, False)
+        assert probe_endpoint(endpoint) == (False, False)
+        probe.assert_called_once_with(timeout=1)
+    assert endpoint_status_cache.get("registry.local") == (False, False)
+
+
+def test_from_api_endpoint():
+    with mock.patch(
+        "moby_distribution.registry.client.detect_api_base_url", return_value=("https://registry.local:443", False)
+    ):
+        client = DockerRegistryV2Client.from_api_endpoint(APIEndpoint(url="registry.local"))
+    assert client.api_base_url == "https://registry.local:443"
+    assert client.session.verify is False
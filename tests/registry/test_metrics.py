@@ -0,0 +1,131 @@
+from unittest import mock
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry import exceptions
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.metrics import Histogram, HistogramMetrics, NoMetrics, RequestEvent
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.retry import RetryBudget, RetryPolicy
+
+
+def make_event(**kwargs):
+    event = dict(
+        method="GET",
+        route="blobs/{digest}",
+        host="registry",
+        status=200,
+        error=None,
+        bytes_sent=0,
+        bytes_received=0,
+        latency=0.01,
+        retries=0,
+        auth_round_trips=0,
+    )
+    event.update(kwargs)
+    return RequestEvent(**event)
+
+
+class TestHistogram:
+    def test_quantile(self):
+        histogram = Histogram(bounds=[0.01, 0.1, 1])
+        for value in [0.005] * 90 + [0.05] * 9 + [5]:
+            histogram.observe(value)
+        assert histogram.quantile(0.5) == 0.01
+        assert histogram.quantile(0.95) == 0.1
+        assert histogram.quantile(1) == 5
+        assert Histogram().quantile(0.5) == 0.0
+
+
+class TestHistogramMetrics:
+    def test_aggregate(self):
+        metrics = HistogramMetrics()
+        metrics.record(make_event(bytes_received=10, retries=1))
+        metrics.record(make_event(bytes_received=20))
+        metrics.record(make_event(status=None, error="ConnectionError"))
+
+        snapshot = metrics.snapshot()
+        assert snapshot["GET blobs/{digest} 2xx"]["count"] == 2
+        assert snapshot["GET blobs/{digest} 2xx"]["bytes_received"] == 30
+        assert snapshot["GET blobs/{digest} 2xx"]["retries"] == 1
+        assert snapshot["GET blobs/{digest} error"]["errors"] == 1
+
+        metrics.reset()
+        assert metrics.snapshot() == {}
+
+
+class TestClientMetrics:
+    @pytest.fixture
+    def metrics(self):
+        return HistogramMetrics()
+
+    @pytest.fixture
+    def client(self, metrics):
+        policy = RetryPolicy(budget=RetryBudget())
+        with mock.patch.object(policy, "sleep"):
+            yield DockerRegistryV2Client(
+                "mock://registry", retry_policy=policy, rate_limiter=NoRateLimit(), metrics=metrics
+            )
+
+    @pytest.fixture
+    def mock_adapter(self, client):
+        adapter = requests_mock.Adapter()
+        client.session.mount("mock://", adapter)
+        client.storage_session.mount("mock://", adapter)
+        return adapter
+
+    def test_request(self, client, metrics, mock_adapter):
+        url = "mock://registry/v2/a/manifests/latest"
+        mock_adapter.register_uri("PUT", url, [{"status_code": 503}, {"status_code": 201, "content": b"{}"}])
+        with mock.patch.object(metrics, "record", wraps=metrics.record) as record:
+            client.put(url=url, data=b"manifest")
+
+        event = record.call_args[0][0]
+        assert event.method == "PUT"
+        assert event.route == "manifests/{reference}"
+        assert event.host == "registry"
+        assert event.status == 201
+        assert event.bytes_sent == len(b"manifest")
+        assert event.bytes_received == 2
+        assert event.retries == 1
+        assert event.auth_round_trips == 0
+
+    def test_auth_round_trip(self, client, metrics, mock_adapter):
+        url = "mock://registry/v2/a/blobs/sha256:x"
+        mock_adapter.register_uri(
+            "HEAD",
+            url,
+            [
+                {"status_code": 401, "headers": {"www-authenticate": 'Basic realm="registry"'}},
+                {"status_code": 200, "headers": {"Content-Length": "1024"}},
+            ],
+        )
+        with mock.patch.object(client, "_refresh_authorization"):
+            client.head(url=url)
+
+        stats = metrics.snapshot()["HEAD blobs/{digest} 2xx"]
+        assert stats["count"] == 1
+        assert stats["auth_round_trips"] == 1
+        assert stats["bytes_received"] == 0
+
+    def test_error(self, client, metrics, mock_adapter):
+        mock_adapter.register_uri("GET", "mock://registry/v2/a/tags/list", status_code=404)
+        with pytest.raises(exceptions.ResourceNotFound):
+            client.get(url="mock://registry/v2/a/tags/list")
+        assert metrics.snapshot()["GET tags/list 4xx"]["errors"] == 1
+
+    def test_storage(self, client, metrics, mock_adapter):
+        mock_adapter.register_uri("GET", "mock://storage/x", content=b"content", headers={"Content-Length": "7"})
+        client.storage_get("mock://storage/x", stream=True)
+        assert metrics.snapshot()["GET storage 2xx"]["bytes_received"] == 7
+
+    def test_disabled(self, mock_adapter):
+        client = DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+        assert isinstance(client.metrics, NoMetrics)
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("GET", "mock://registry/v2/", json={})
+        client.session.mount("mock://", adapter)
+        with mock.patch("moby_distribution.registry.client.RequestTrace") as trace:
+            assert client.ping()
+        assert not trace.called
@@ -0,0 +1,206 @@
+import io
+import itertools
+from unittest import mock
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.exceptions import TransferStalled
+from moby_distribution.registry.progress import (
+    ImageProgress,
+    ProgressObserver,
+    StallPolicy,
+    TransferMeter,
+    TransferProgress,
+)
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources import blobs
+from moby_distribution.registry.resources.blobs import Accessor, Blob
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingObserver(ProgressObserver):
+    def __init__(self):
+        self.blobs = []
+        self.images = []
+
+    def on_progress(self, progress: TransferProgress):
+        self.blobs.append(progress)
+
+    def on_image_progress(self, progress: TransferProgress):
+        self.images.append(progress)
+
+
+class TestTransferMeter:
+    def test_report(self):
+        clock = Clock()
+        reported = []
+        meter = TransferMeter("sha256:x", total=300, callback=reported.append, interval=1, clock=clock)
+
+        meter.update(100)
+        assert reported == []
+
+        clock.now = 1
+        meter.update(100)
+        clock.now = 3
+        meter.update(100)
+        progress = meter.finish()
+
+        assert [p.bytes_done for p in reported] == [200, 300, 300]
+        assert reported[0].rate == 200
+        assert reported[1].rate == 50
+        assert reported[1].average_rate == 100
+        assert reported[1].fraction == 1.0
+        assert progress.finished
+        assert not reported[0].finished
+
+    def test_stall(self):
+        clock = Clock()
+        meter = TransferMeter("sha256:x", stall_policy=StallPolicy(min_rate=10, window=5), interval=1, clock=clock)
+        for second in range(1, 6):
+            clock.now = second
+            meter.update(100)
+
+        # 2 bytes per second over the last 5 seconds
+        for second in range(6, 10):
+            clock.now = second
+            meter.update(2)
+        clock.now = 10
+        with pytest.raises(TransferStalled) as e:
+            meter.update(2)
+        assert e.value.name == "sha256:x"
+        assert e.value.rate == 2
+
+    def test_not_stall_in_window(self):
+        clock = Clock()
+        reported = []
+        policy = StallPolicy(min_rate=10, window=5)
+        meter = TransferMeter("sha256:x", callback=reported.append, stall_policy=policy, interval=1, clock=clock)
+        # below the min rate, but the window hasn't passed since the transfer started
+        clock.now = 4
+        meter.update(1)
+        assert meter.bytes_done == 1
+        assert [p.bytes_done for p in reported] == [1]
+        assert reported[0].rate < 10
+
+        clock.now = 5
+        with pytest.raises(TransferStalled):
+            meter.update(1)
+
+
+def test_image_progress():
+    clock = Clock()
+    observer = RecordingObserver()
+    image_progress = ImageProgress("a:latest", observer, total=20, interval=0, clock=clock)
+    image_progress.on_progress(TransferProgress("sha256:x", 5, 10, 0, 0, 0, False))
+    image_progress.on_progress(TransferProgress("sha256:y", 10, 10, 0, 0, 0, True))
+    image_progress.on_progress(TransferProgress("sha256:x", 10, 10, 0, 0, 0, True))
+    image_progress.finish()
+
+    assert [p.name for p in observer.blobs] == ["sha256:x", "sha256:y", "sha256:x"]
+    assert [p.bytes_done for p in observer.images] == [5, 15, 20, 20]
+    assert observer.images[-1].finished
+
+
+def test_accessor_size(tmp_path):
+    (tmp_path / "blob").write_bytes(b"content")
+    assert Accessor(local_path=tmp_path / "blob").size() == 7
+
+    fh = io.BytesIO(b"content")
+    fh.read(3)
+    assert Accessor(fileobj=fh).size() == 4
+    assert fh.tell() == 3
+
+
+class TestBlobProgress:
+    location = "mock://registry/v2/a/blobs/uploads/uuid"
+
+    @pytest.fixture
+    def client(self):
+        return DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+
+    @pytest.fixture
+    def adapter(self, client):
+        adapter = requests_mock.Adapter()
+        client.session.mount("mock://", adapter)
+        client.storage_session.mount("mock://", adapter)
+        return adapter
+
+    def test_download(self, client, adapter):
+        adapter.register_uri(
+            "GET", "mock://registry/v2/a/blobs/sha256:x", content=b"x" * 4096, headers={"Content-Length": "4096"}
+        )
+        observer = RecordingObserver()
+        Blob(repo="a", digest="sha256:x", client=client, fileobj=io.BytesIO(), progress=observer).download()
+
+        assert observer.blobs[-1].bytes_done == 4096
+        assert observer.blobs[-1].total == 4096
+        assert observer.blobs[-1].finished
+
+    def test_download_stalled(self, client, adapter):
+        adapter.register_uri("GET", "mock://registry/v2/a/blobs/sha256:x", content=b"x" * 4096)
+        blob = Blob(
+            repo="a",
+            digest="sha256:x",
+            client=client,
+            fileobj=io.BytesIO(),
+            stall_policy=StallPolicy(min_rate=1024, window=2),
+        )
+
+        def new_transfer_meter(name, total, observer, stall_policy):
+            # a second passes for every 1024 bytes received
+            return TransferMeter(name, total, stall_policy=stall_policy, clock=itertools.count().__next__)
+
+        with mock.patch.object(blobs, "new_transfer_meter", new_transfer_meter):
+            blob.download()
+            blob.stall_policy = StallPolicy(min_rate=2048, window=2)
+            with pytest.raises(TransferStalled):
+                blob.download()
+
+    def test_upload(self, client, adapter):
+        adapter.register_uri(
+            "POST", "mock://registry/v2/a/blobs/uploads/", status_code=202, headers={"location": self.location}
+        )
+        adapter.register_uri(
+            "PATCH", self.location, status_code=202, headers={"location": self.location, "range": "0-6"}
+        )
+        adapter.register_uri("PUT", self.location, status_code=201)
+        adapter.register_uri("HEAD", requests_mock.ANY, headers={"Content-Type": "application/octet-stream"})
+
+        observer = RecordingObserver()
+        Blob(repo="a", client=client, fileobj=io.BytesIO(b"content"), progress=observer).upload()
+
+        assert observer.blobs[-1].bytes_done == 7
+        assert observer.blobs[-1].total == 7
+        assert observer.blobs[-1].finished
+
+    def test_upload_stalled(self, client, adapter):
+        adapter.register_uri(
+            "POST", "mock://registry/v2/a/blobs/uploads/", status_code=202, headers={"location": self.location}
+        )
+        adapter.register_uri(
+            "PATCH", self.location, status_code=202, headers={"location": self.location, "range": "0-6"}
+        )
+        adapter.register_uri("PUT", self.location, status_code=201)
+        adapter.register_uri("DELETE", self.location, status_code=204)
+        blob = Blob(
+            repo="a", client=client, fileobj=io.BytesIO(b"content"), stall_policy=StallPolicy(min_rate=1024, window=1)
+        )
+
+        def new_transfer_meter(name, total, observer, stall_policy):
+            # a second passes for every chunk uploaded
+            return TransferMeter(name, total, stall_policy=stall_policy, interval=0, clock=itertools.count().__next__)
+
+        with mock.patch.object(blobs, "new_transfer_meter", new_transfer_meter), pytest.raises(TransferStalled):
+            blob.upload()
+
+        # the upload session is cancelled instead of committed
+        assert [request.method for request in adapter.request_history] == ["POST", "PATCH", "DELETE"]
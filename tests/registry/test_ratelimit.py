@@ -0,0 +1,140 @@
+from unittest import mock
+
+import pytest
+import requests
+import requests_mock
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import RateLimiter, RateLimitInfo, TokenBucket, parse_rate_limit
+from moby_distribution.registry.retry import NoRetry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_response(status_code=200, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    return resp
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, None),
+        (
+            {"RateLimit-Limit": "100;w=21600", "RateLimit-Remaining": "76;w=21600"},
+            RateLimitInfo(limit=100, remaining=76, window=21600),
+        ),
+        (
+            {"RateLimit-Limit": "10", "RateLimit-Remaining": "3", "RateLimit-Reset": "30"},
+            RateLimitInfo(limit=10, remaining=3, window=30),
+        ),
+        ({"X-RateLimit-Limit": "10", "X-RateLimit-Remaining": "-1"}, RateLimitInfo(limit=10, remaining=0, window=60)),
+        ({"RateLimit-Limit": "many", "RateLimit-Remaining": "3"}, None),
+        ({"RateLimit-Limit": "0", "RateLimit-Remaining": "0"}, None),
+    ],
+)
+def test_parse_rate_limit(headers, expected):
+    assert parse_rate_limit(make_response(headers=headers)) == expected
+
+
+class TestTokenBucket:
+    def test_unlimited(self):
+        bucket = TokenBucket(clock=FakeClock())
+        assert all(bucket.reserve() == 0 for _ in range(100))
+
+    def test_pacing(self):
+        clock = FakeClock()
+        bucket = TokenBucket(clock=clock)
+        bucket.update(RateLimitInfo(limit=10, remaining=2, window=10))
+
+        assert [bucket.reserve() for _ in range(4)] == [0, 0, 1, 2]
+        clock.sleep(1)
+        # the waiting reservations are kept even if the registry has not counted them
+        bucket.update(RateLimitInfo(limit=10, remaining=5, window=10))
+        assert bucket.reserve() == 2
+
+    def test_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(clock=clock)
+        bucket.update(RateLimitInfo(limit=10, remaining=0, window=10))
+        clock.sleep(100)
+        assert [bucket.reserve() for _ in range(10)] == [0] * 10
+        assert bucket.reserve() == 1
+
+    def test_block(self):
+        clock = FakeClock()
+        bucket = TokenBucket(clock=clock)
+        bucket.block(5)
+        assert bucket.reserve() == 5
+        clock.sleep(5)
+        assert bucket.reserve() == 0
+
+
+class TestRateLimiter:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def limiter(self, clock):
+        limiter = RateLimiter(max_wait=10, clock=clock)
+        with mock.patch.object(limiter, "sleep", side_effect=clock.sleep):
+            yield limiter
+
+    def test_max_wait(self, limiter):
+        limiter.update("key", make_response(headers={"RateLimit-Limit": "1;w=3600", "RateLimit-Remaining": "0"}))
+        limiter.acquire("key")
+        limiter.sleep.assert_called_once_with(10)
+
+    def test_default_max_wait(self, clock):
+        limiter = RateLimiter(clock=clock)
+        limiter.update("key", make_response(headers={"RateLimit-Limit": "100;w=21600", "RateLimit-Remaining": "0"}))
+        with mock.patch.object(limiter, "sleep") as sleep:
+            limiter.acquire("key")
+        sleep.assert_called_once_with(5)
+
+    def test_blocked_by_429(self, limiter):
+        limiter.update("key", make_response(429, {"Retry-After": "3"}))
+        limiter.acquire("other")
+        limiter.sleep.assert_not_called()
+        limiter.acquire("key")
+        limiter.sleep.assert_called_once_with(3)
+
+    def test_shared_by_clients(self, limiter):
+        clients = [
+            DockerRegistryV2Client("mock://registry", rate_limiter=limiter, retry_policy=NoRetry()) for _ in range(2)
+        ]
+        requested = []
+
+        def get_manifest(request, context):
+            requested.append(request)
+            context.headers.update({"RateLimit-Limit": "60;w=60", "RateLimit-Remaining": f"{2 - len(requested)};w=60"})
+            return "{}"
+
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("GET", "mock://registry/v2/library/python/manifests/latest", text=get_manifest)
+        adapter.register_uri("GET", "mock://registry/v2/library/python/blobs/sha256:x", content=b"")
+        for client in clients:
+            client.session.mount("mock://", adapter)
+
+        clients[0].get(url="mock://registry/v2/library/python/manifests/latest")
+        for client in clients * 2:
+            client.get(url="mock://registry/v2/library/python/manifests/latest")
+        # the remaining request is allowed, the others are paced at 1 request per second
+        assert limiter.sleep.call_args_list == [mock.call(1)] * 3
+
+        # the blobs are not limited
+        limiter.sleep.reset_mock()
+        clients[1].get(url="mock://registry/v2/library/python/blobs/sha256:x")
+        limiter.sleep.assert_not_called()
@@ -0,0 +1,109 @@
+import io
+from unittest import mock
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.redirects import RedirectCache, get_signed_url_expiry
+from moby_distribution.registry.resources.blobs import Blob
+
+SIGNED_URL = "mock://storage/blobs/x?X-Amz-Date=20240101T000000Z&X-Amz-Expires=900&X-Amz-Signature=s"
+# 2024-01-01T00:00:00Z
+NOW = 1704067200
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (SIGNED_URL, NOW + 900),
+        ("https://storage.googleapis.com/x?X-Goog-Date=20240101T000000Z&X-Goog-Expires=60", NOW + 60),
+        ("https://cdn.example.com/x?Expires=1704067300&Signature=s", 1704067300),
+        ("https://account.blob.core.windows.net/x?se=2024-01-01T00:10:00Z&sig=s", NOW + 600),
+        ("https://storage/x", None),
+        ("https://storage/x?Expires=soon", None),
+    ],
+)
+def test_get_signed_url_expiry(url, expected):
+    assert get_signed_url_expiry(url) == expected
+
+
+class TestRedirectCache:
+    def test_expiry(self):
+        now = [NOW]
+        cache = RedirectCache(margin=30, clock=lambda: now[0])
+        cache.put("key", SIGNED_URL)
+        assert cache.get("key") == SIGNED_URL
+
+        now[0] = NOW + 900 - 30
+        assert cache.get("key") is None
+
+    def test_unknown_expiry(self):
+        cache = RedirectCache(clock=lambda: NOW)
+        cache.put("key", "mock://storage/x")
+        assert cache.get("key") is None
+
+        cache = RedirectCache(margin=0, default_ttl=60, clock=lambda: NOW)
+        cache.put("key", "mock://storage/x")
+        assert cache.get("key") == "mock://storage/x"
+
+    def test_max_entries(self):
+        cache = RedirectCache(max_entries=2, clock=lambda: NOW)
+        for key in ("a", "b", "c"):
+            cache.put(key, SIGNED_URL)
+        assert [cache.get(key) for key in ("a", "b", "c")] == [None, SIGNED_URL, SIGNED_URL]
+
+
+class TestBlobRedirect:
+    blob_url = "mock://registry/v2/a/blobs/sha256:x"
+
+    @pytest.fixture
+    def client(self):
+        client = DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+        client._authed = mock.MagicMock(**{"provide.return_value": "Bearer registry-token"})
+        client.redirect_cache = RedirectCache(clock=lambda: NOW)
+        return client
+
+    @pytest.fixture
+    def adapter(self, client):
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("GET", self.blob_url, status_code=307, headers={"Location": SIGNED_URL})
+        adapter.register_uri("GET", SIGNED_URL, content=b"content")
+        client.session.mount("mock://", adapter)
+        client.storage_session.mount("mock://", adapter)
+        return adapter
+
+    def download(self, client) -> bytes:
+        fh = io.BytesIO()
+        Blob(repo="a", digest="sha256:x", client=client, fileobj=fh).download()
+        return fh.getvalue()
+
+    def test_strip_authorization(self, client, adapter):
+        assert self.download(client) == b"content"
+
+        registry_request, storage_request = adapter.request_history
+        assert registry_request.headers["Authorization"] == "Bearer registry-token"
+        assert "Authorization" not in storage_request.headers
+
+    def test_reuse_signed_url(self, client, adapter):
+        assert self.download(client) == b"content"
+        assert self.download(client) == b"content"
+        assert [r.url for r in adapter.request_history] == [self.blob_url, SIGNED_URL, SIGNED_URL]
+
+    def test_revoked_signed_url(self, client, adapter):
+        client.redirect_cache.put(("a", "sha256:x"), SIGNED_URL.replace("Signature=s", "Signature=revoked"))
+        adapter.register_uri("GET", SIGNED_URL.replace("Signature=s", "Signature=revoked"), status_code=403)
+
+        assert self.download(client) == b"content"
+        assert [r.url for r in adapter.request_history][1:] == [self.blob_url, SIGNED_URL]
+
+    def test_same_host_redirect(self, client, adapter):
+        adapter.register_uri(
+            "GET", self.blob_url, status_code=307, headers={"Location": self.blob_url + "/content"}
+        )
+        adapter.register_uri("GET", self.blob_url + "/content", content=b"content")
+
+        assert self.download(client) == b"content"
+        assert adapter.request_history[-1].headers["Authorization"] == "Bearer registry-token"
+        assert client.redirect_cache.get(("a", "sha256:x")) is None
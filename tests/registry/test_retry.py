@@ -0,0 +1,188 @@
+from unittest import mock
+
+import pytest
+import requests
+import requests_mock
+
+from moby_distribution.registry import exceptions
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import BlobWriter
+from moby_distribution.registry.retry import NoRetry, RetryBudget, RetryPolicy
+
+
+@pytest.fixture
+def policy():
+    policy = RetryPolicy(budget=RetryBudget())
+    with mock.patch.object(policy, "sleep") as sleep:
+        policy.sleep_mock = sleep
+        yield policy
+
+
+@pytest.fixture
+def client(policy):
+    return DockerRegistryV2Client("mock://registry", retry_policy=policy, rate_limiter=NoRateLimit())
+
+
+@pytest.fixture
+def mock_adapter(client):
+    adapter = requests_mock.Adapter()
+    client.session.mount("mock://", adapter)
+    return adapter
+
+
+def make_response(status_code, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    return resp
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize(
+        "method, url, expected",
+        [
+            ("GET", "https://registry/v2/a/blobs/sha256:x", True),
+            ("HEAD", "https://registry/v2/a/blobs/sha256:x", True),
+            ("PUT", "https://registry/v2/a/manifests/latest", True),
+            ("PUT", "https://registry/v2/a/blobs/uploads/uuid", False),
+            ("PATCH", "https://registry/v2/a/blobs/uploads/uuid", False),
+            ("POST", "https://registry/v2/a/blobs/uploads/", False),
+        ],
+    )
+    def test_is_idempotent(self, method, url, expected):
+        assert RetryPolicy.is_idempotent(method, url) is expected
+
+    @pytest.mark.parametrize(
+        "idempotent, response, error, expected",
+        [
+            (True, make_response(503), None, True),
+            (True, make_response(404), None, False),
+            (True, None, requests.exceptions.ReadTimeout(), True),
+            (False, make_response(503), None, False),
+            (False, make_response(429), None, True),
+            (False, None, requests.exceptions.ReadTimeout(), False),
+            (False, None, requests.exceptions.ConnectTimeout(), True),
+        ],
+    )
+    def test_should_retry(self, policy, idempotent, response, error, expected):
+        assert policy.should_retry(1, idempotent=idempotent, response=response, error=error) is expected
+
+    def test_max_attempts(self, policy):
+        assert policy.should_retry(policy.max_attempts - 1, idempotent=True, response=make_response(503))
+        assert not policy.should_retry(policy.max_attempts, idempotent=True, response=make_response(503))
+        assert not NoRetry().should_retry(1, idempotent=True, response=make_response(503))
+
+    def test_budget(self):
+        budget = RetryBudget(max_tokens=4, token_ratio=1)
+        policy = RetryPolicy(budget=budget)
+        assert policy.should_retry(1, idempotent=True, response=make_response(503))
+        assert policy.should_retry(1, idempotent=True, response=make_response(503))
+        assert not policy.should_retry(1, idempotent=True, response=make_response(503))
+        policy.on_success()
+        assert policy.should_retry(1, idempotent=True, response=make_response(503))
+
+    @pytest.mark.parametrize(
+        "headers, expected",
+        [
+            ({}, 0),
+            ({"Retry-After": "7"}, 7),
+            ({"Retry-After": "-1"}, 0),
+            ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0),
+            ({"Retry-After": "invalid"}, 0),
+        ],
+    )
+    def test_retry_after(self, headers, expected):
+        assert RetryPolicy.retry_after(make_response(429, headers)) == expected
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5, jitter=False)
+        assert [policy.backoff(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+        assert policy.backoff(1, make_response(429, {"Retry-After": "10"})) == 10
+
+        policy.jitter = True
+        assert all(0 <= policy.backoff(3) <= 4 for _ in range(10))
+
+    def test_give_up_long_retry_after(self, policy):
+        response = make_response(429, {"Retry-After": str(policy.max_retry_after + 1)})
+        assert not policy.should_retry(1, idempotent=True, response=response)
+
+
+class TestClientRetry:
+    def test_retry_transient_status(self, client, mock_adapter, policy):
+        mock_adapter.register_uri(
+            "GET",
+            "mock://registry/v2/",
+            [
+                {"status_code": 503},
+                {"status_code": 429, "headers": {"Retry-After": "3"}},
+                {"status_code": 200, "json": {}},
+            ],
+        )
+        assert client.ping()
+        assert mock_adapter.call_count == 3
+        assert policy.sleep_mock.call_args_list[-1] == mock.call(3)
+
+    def test_retry_connection_error(self, client, mock_adapter):
+        mock_adapter.register_uri(
+            "GET",
+            "mock://registry/v2/",
+            [{"exc": requests.exceptions.ConnectionError}, {"status_code": 200, "json": {}}],
+        )
+        assert client.ping()
+        assert mock_adapter.call_count == 2
+
+    def test_give_up(self, client, mock_adapter, policy):
+        mock_adapter.register_uri("GET", "mock://registry/v2/", status_code=503)
+        with pytest.raises(exceptions.RequestErrorWithResponse):
+            client.get(url="mock://registry/v2/")
+        assert mock_adapter.call_count == policy.max_attempts
+
+    def test_not_retry_non_idempotent(self, client, mock_adapter):
+        mock_adapter.register_uri("POST", "mock://registry/v2/a/blobs/uploads/", status_code=503)
+        with pytest.raises(exceptions.RequestErrorWithResponse):
+            client.post(url="mock://registry/v2/a/blobs/uploads/")
+        assert mock_adapter.call_count == 1
+
+
+class TestBlobWriterResume:
+    location = "mock://registry/v2/a/blobs/uploads/uuid"
+
+    def test_resume_from_received_offset(self, client, mock_adapter):
+        received = []
+
+        def patch(request, context):
+            if not received:
+                # the registry received the first 3 bytes, but the connection is broken
+                received.append(request.body[:3])
+                context.status_code = 502
+                return ""
+            received.append(request.body)
+            context.status_code = 202
+            context.headers.update({"location": self.location, "range": "0-9"})
+            return ""
+
+        mock_adapter.register_uri("PATCH", self.location, text=patch)
+        mock_adapter.register_uri(
+            "GET", self.location, status_code=204, headers={"location": self.location, "range": "0-2"}
+        )
+
+        writer = BlobWriter("uuid", self.location, client)
+        assert writer.write(b"0123456789") == 10
+        assert writer.tell() == 10
+        assert received == [b"012", b"3456789"]
+        assert mock_adapter.request_history[-1].headers["content-range"] == "3-9"
+
+    def test_finished_before_failure(self, client, mock_adapter):
+        mock_adapter.register_uri("PATCH", self.location, exc=requests.exceptions.ReadTimeout)
+        mock_adapter.register_uri(
+            "GET", self.location, status_code=204, headers={"location": self.location, "range": "0-9"}
+        )
+
+        writer = BlobWriter("uuid", self.location, client)
+        assert writer.write(b"0123456789") == 10
+        assert [r.method for r in mock_adapter.request_history] == ["PATCH", "GET"]
+
+    @pytest.mark.parametrize("value, expected, offset", [(None, 5, 5), ("0-9", 0, 10), ("0-0", 0, 0), ("0-0", 1, 1)])
+    def test_parse_range(self, value, expected, offset):
+        assert BlobWriter._parse_range(value, expected) == offset
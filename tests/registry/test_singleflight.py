@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.singleflight import SingleFlight
+
+
+def run_concurrently(func, concurrency=8):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: func(), range(concurrency)))
+
+
+class TestSingleFlight:
+    def test_share_result(self):
+        group = SingleFlight()
+        calls = []
+        barrier = threading.Barrier(4)
+
+        def func():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        def do():
+            barrier.wait(timeout=5)
+            return group.do("key", func)
+
+        results = run_concurrently(do, concurrency=4)
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+
+    def test_share_error(self):
+        group = SingleFlight()
+        barrier = threading.Barrier(4)
+
+        def func():
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        def do():
+            barrier.wait(timeout=5)
+            with pytest.raises(ValueError, match="boom"):
+                group.do("key", func)
+
+        run_concurrently(do, concurrency=4)
+        # the failure is not cached
+        assert group.do("key", lambda: 1) == 1
+
+    def test_different_keys(self):
+        group = SingleFlight()
+        assert group.do("a", lambda: group.do("b", lambda: "b")) == "b"
+
+    def test_nested_same_key(self):
+        group = SingleFlight()
+        assert group.do("key", lambda: group.do("key", lambda: "nested")) == "nested"
+
+
+class TestBlobCoalescing:
+    @pytest.fixture
+    def adapter(self):
+        def head(request, context):
+            time.sleep(0.05)
+            context.headers.update({"Content-Type": "application/octet-stream", "Content-Length": "7"})
+            return b""
+
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("HEAD", "mock://registry/v2/a/blobs/sha256:x", content=head)
+        adapter.register_uri("GET", "mock://registry/v2/a/blobs/sha256:x", content=b"content")
+        return adapter
+
+    def make_blob(self, adapter, username=None):
+        client = DockerRegistryV2Client("mock://registry", username=username, rate_limiter=NoRateLimit())
+        client.session.mount("mock://", adapter)
+        return Blob(repo="a", digest="sha256:x", client=client)
+
+    def test_stat(self, adapter):
+        barrier = threading.Barrier(4)
+
+        def stat():
+            blob = self.make_blob(adapter)
+            barrier.wait(timeout=5)
+            return blob.stat()
+
+        descriptors = run_concurrently(stat, concurrency=4)
+        assert adapter.call_count == 1
+        assert {descriptor.size for descriptor in descriptors} == {7}
+
+    def test_not_shared_between_credentials(self, adapter):
+        barrier = threading.Barrier(2)
+
+        def stat(username):
+            blob = self.make_blob(adapter, username=username)
+            barrier.wait(timeout=5)
+            return blob.stat()
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(stat, ["alice", "bob"]))
+        assert adapter.call_count == 2
+
+    def test_read(self, adapter):
+        assert self.make_blob(adapter).read() == b"content"
@@ -0,0 +1,97 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests_mock
+
+from moby_distribution.registry import tracing
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.tracing import (
+    InMemoryTracer,
+    NoTracer,
+    get_current_span,
+    propagate,
+    set_default_tracer,
+    start_span,
+)
+
+
+@pytest.fixture
+def tracer():
+    tracer = InMemoryTracer()
+    set_default_tracer(tracer)
+    yield tracer
+    set_default_tracer(NoTracer())
+
+
+def test_disabled():
+    span = start_span("image.push")
+    assert span is tracing._NO_SPAN
+    with span:
+        span.add_bytes(1)
+    assert get_current_span() is None
+
+    def func():
+        pass
+
+    assert propagate(func) is func
+
+
+def test_nested(tracer):
+    with start_span("image.push", repo="a") as parent:
+        assert get_current_span() is parent
+        with start_span("layer.upload") as child:
+            child.add_bytes(10)
+            child.add_bytes(5)
+    assert get_current_span() is None
+
+    assert [span.name for span in tracer.spans] == ["layer.upload", "image.push"]
+    assert child.parent is parent
+    assert parent.parent is None
+    assert child.attributes == {"bytes": 15}
+    assert parent.attributes == {"repo": "a"}
+    assert parent.duration >= child.duration
+
+
+def test_wait_and_cpu(tracer):
+    with start_span("wait") as span:
+        time.sleep(0.05)
+    assert span.wait_seconds >= 0.04
+    assert span.cpu_seconds < span.duration
+
+
+def test_error(tracer):
+    with pytest.raises(ValueError), start_span("manifest.put"):
+        raise ValueError
+    assert tracer.find("manifest.put")[0].attributes["error"] == "ValueError"
+
+
+def test_propagate_to_thread_pool(tracer):
+    def work(i):
+        with start_span("layer.upload", index=i):
+            return get_current_span().parent
+
+    with start_span("layers.upload") as parent, ThreadPoolExecutor(max_workers=2) as pool:
+        parents = list(pool.map(propagate(work), range(4)))
+        # without propagation, the spans started in another thread have no parent
+        orphan = pool.submit(work, 4).result()
+
+    assert parents == [parent] * 4
+    assert orphan is None
+    assert len(tracer.find("layer.upload")) == 5
+
+
+def test_blob_download(tracer):
+    client = DockerRegistryV2Client("mock://registry", rate_limiter=NoRateLimit())
+    adapter = requests_mock.Adapter()
+    adapter.register_uri("GET", "mock://registry/v2/a/blobs/sha256:x", content=b"content")
+    client.session.mount("mock://", adapter)
+    client.storage_session.mount("mock://", adapter)
+
+    Blob(repo="a", digest="sha256:x", client=client, fileobj=io.BytesIO()).download()
+
+    (span,) = tracer.find("blob.download")
+    assert span.attributes == {"repo": "a", "digest": "sha256:x", "bytes": 7}
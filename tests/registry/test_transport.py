@@ -0,0 +1,141 @@
+import io
+import json
+
+import pytest
+import requests
+import requests_mock
+from requests.structures import CaseInsensitiveDict
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.retry import RetryPolicy
+from moby_distribution.registry.transport import HttpxTransport, RequestsTransport, Transport
+
+
+class InMemoryTransport(Transport):
+    """serve the blobs from memory"""
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.requests = []
+        self.closed = False
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        request = requests.Request(method, url, headers=kwargs.get("headers")).prepare()
+        resp = requests.Response()
+        resp.request = request
+        resp.url = url
+        resp.headers = CaseInsensitiveDict()
+        if url.endswith("/v2/"):
+            resp.status_code = 200
+            resp.raw = io.BytesIO(json.dumps({}).encode())
+            return resp
+
+        digest = url.rsplit("/", 1)[-1]
+        if digest not in self.blobs:
+            resp.status_code = 404
+            resp.raw = io.BytesIO(b"")
+            return resp
+        resp.status_code = 200
+        resp.headers.update(
+            {"Content-Type": "application/octet-stream", "Content-Length": str(len(self.blobs[digest]))}
+        )
+        resp.raw = io.BytesIO(b"" if method == "HEAD" else self.blobs[digest])
+        return resp
+
+    def close(self):
+        self.closed = True
+
+
+class TestTransport:
+    def test_custom_transport(self):
+        transport = InMemoryTransport({"sha256:x": b"content"})
+        client = DockerRegistryV2Client("https://registry", transport=transport, rate_limiter=NoRateLimit())
+        assert client.session is None
+        assert client.ping()
+
+        blob = Blob(repo="a", digest="sha256:x", client=client, fileobj=io.BytesIO())
+        assert blob.stat().size == 7
+        blob.download()
+        assert blob.fileobj.getvalue() == b"content"
+        assert [method for method, _, _ in transport.requests] == ["GET", "HEAD", "GET"]
+        assert transport.requests[-1][2]["stream"] is True
+
+        client.close()
+        assert transport.closed
+
+    def test_requests_transport_head_not_follow_redirects(self):
+        transport = RequestsTransport()
+        adapter = requests_mock.Adapter()
+        adapter.register_uri("HEAD", "mock://registry/a", status_code=307, headers={"Location": "mock://storage/a"})
+        transport.session.mount("mock://", adapter)
+
+        resp = transport.request("HEAD", url="mock://registry/a")
+        assert resp.status_code == 307
+        assert adapter.call_count == 1
+
+
+class TestHttpxTransport:
+    @pytest.fixture
+    def httpx(self):
+        return pytest.importorskip("httpx")
+
+    @pytest.fixture
+    def requested(self):
+        return []
+
+    @pytest.fixture
+    def transport(self, httpx, requested):
+        def handler(request):
+            requested.append(request)
+            if request.url.path == "/redirect":
+                return httpx.Response(307, headers={"Location": "https://registry/v2/"})
+            if request.url.path == "/broken":
+                raise httpx.ConnectError("refused", request=request)
+            if request.url.path == "/slow":
+                raise httpx.ReadTimeout("timeout", request=request)
+            return httpx.Response(200, headers={"Docker-Content-Digest": "sha256:x"}, content=request.content or b"{}")
+
+        transport = HttpxTransport(httpx_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        yield transport
+        transport.close()
+
+    def test_request(self, transport):
+        resp = transport.request("PUT", "https://registry/v2/", headers={"Authorization": "Bearer t"}, data=b"body")
+        assert resp.ok
+        assert resp.content == b"body"
+        assert resp.headers["docker-content-digest"] == "sha256:x"
+        assert resp.request.headers["authorization"] == "Bearer t"
+
+    def test_stream(self, transport):
+        resp = transport.request("GET", "https://registry/v2/", stream=True)
+        assert b"".join(resp.iter_content(chunk_size=1)) == b"{}"
+
+    def test_upload_fileobj(self, transport, requested):
+        transport.request("PATCH", "https://registry/v2/", data=io.BytesIO(b"x" * 10))
+        assert requested[-1].content == b"x" * 10
+
+    def test_redirects(self, transport):
+        assert transport.request("HEAD", "https://registry/redirect").status_code == 307
+        assert transport.request("GET", "https://registry/redirect").status_code == 200
+        assert transport.request("GET", "https://registry/redirect", allow_redirects=False).status_code == 307
+
+    def test_translate_error(self, transport):
+        with pytest.raises(requests.exceptions.ConnectionError) as e:
+            transport.request("GET", "https://registry/broken")
+        assert RetryPolicy._surely_unprocessed(error=e.value)
+        with pytest.raises(requests.exceptions.Timeout):
+            transport.request("GET", "https://registry/slow")
+
+    def test_close(self, transport):
+        transport.close()
+        assert transport._loop.is_closed()
+        assert not transport._thread.is_alive()
+        # closing twice is harmless
+        transport.close()
+
+    def test_client(self, transport):
+        client = DockerRegistryV2Client("https://registry", transport=transport, rate_limiter=NoRateLimit())
+        assert client.ping()
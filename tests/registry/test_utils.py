@@ -1,11 +1,24 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from unittest import mock
 
 import pytest
+import requests
 from pydantic import BaseModel, validator
 
-from moby_distribution.registry.utils import LazyProxy, NamedImage, get_private_key, parse_image, validate_media_type
+from moby_distribution.registry.utils import (
+    LazyCurl,
+    LazyProxy,
+    NamedImage,
+    get_private_key,
+    get_route_kind,
+    get_route_template,
+    parse_image,
+    validate_media_type,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -82,6 +95,21 @@ class TestLazyProxy:
 
         assert m.get.called
 
+    def test_initialize_once(self):
+        calls = []
+        lock = threading.Lock()
+
+        def factory():
+            with lock:
+                calls.append(1)
+            time.sleep(0.1)
+            return mock.MagicMock()
+
+        proxy = LazyProxy(factory)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: proxy.get(), range(8)))
+        assert len(calls) == 1
+
 
 class TestValidateMediaType:
     def test_single(self):
@@ -142,3 +170,76 @@ class TestValidateMediaType:
 )
 def test_parse_image(image, default_registry, expected):
     assert parse_image(image, default_registry) == expected
+
+
+def test_parse_image_offline():
+    default_client = LazyProxy(mock.MagicMock(side_effect=AssertionError("should not be initialized")))
+    with mock.patch("moby_distribution.registry.client.default_client", default_client):
+        assert parse_image("python") == NamedImage(
+            domain="registry.hub.docker.com:443", name="library/python", tag=None
+        )
+
+        default_client.__dict__["_wrapped"] = mock.MagicMock(api_base_url="http://localhost:5000")
+        assert parse_image("python") == NamedImage(domain="localhost:5000", name="library/python", tag=None)
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://registry/v2/", "base"),
+        ("https://registry/v2/library/python/manifests/latest", "manifests"),
+        ("https://registry/v2/library/python/blobs/sha256:x", "blobs"),
+        ("https://registry/v2/library/python/blobs/uploads/uuid?_state=x", "blobs"),
+        ("https://registry/v2/library/python/tags/list", "tags"),
+        ("https://registry/v2/manifests/blobs/manifests/latest", "manifests"),
+    ],
+)
+def test_get_route_kind(url, expected):
+    assert get_route_kind(url) == expected
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://registry/v2/", "base"),
+        ("https://registry/v2/_catalog", "catalog"),
+        ("https://registry/v2/library/python/manifests/latest", "manifests/{reference}"),
+        ("https://registry/v2/library/python/blobs/sha256:x", "blobs/{digest}"),
+        ("https://registry/v2/library/python/blobs/uploads/", "blobs/uploads/"),
+        ("https://registry/v2/library/python/blobs/uploads/uuid?_state=x", "blobs/uploads/{uuid}"),
+        ("https://registry/v2/library/python/tags/list", "tags/list"),
+        ("https://registry/v2/blobs/uploads/manifests/latest", "manifests/{reference}"),
+        ("https://storage/bucket/object", "other"),
+    ],
+)
+def test_get_route_template(url, expected):
+    assert get_route_template(url) == expected
+
+
+class TestLazyCurl:
+    @pytest.fixture
+    def prepared_request(self):
+        return requests.Request(
+            "PATCH",
+            "https://registry/v2/a/blobs/uploads/1?_state=abc&X-Amz-Signature=secret",
+            headers={"Authorization": "Bearer token", "Content-Type": "application/octet-stream"},
+            data=b"\x00" * 1024,
+        ).prepare()
+
+    def test_lazy(self, prepared_request):
+        with mock.patch("curlify.to_curl", return_value="curl") as to_curl:
+            curl = LazyCurl(prepared_request)
+            assert not to_curl.called
+            str(curl)
+            assert to_curl.called
+
+    def test_redact(self, prepared_request):
+        curl = str(LazyCurl(prepared_request))
+        assert "Bearer token" not in curl
+        assert "secret" not in curl
+        assert "_state=abc" in curl
+        assert "<1024 bytes omitted>" in curl
+        assert prepared_request.headers["Authorization"] == "Bearer token"
+
+    def test_unknown(self):
+        assert str(LazyCurl(None)) == "<unknown>"
@@ -151,3 +151,11 @@ def test_api_base_url(url, support_https, expected):
         "moby_distribution.spec.endpoint.APIEndpoint.is_secure_repository", return_value=[support_https, False]
     ):
         assert APIEndpoint(url=url).api_base_url == expected
+
+
+@pytest.mark.parametrize("url", ["index.docker.io", "registry.hub.docker.com", "quay.io"])
+def test_well_known_api_base_url(url):
+    with mock.patch("socket.create_connection", side_effect=AssertionError("should not probe")) as create_connection:
+        assert APIEndpoint(url=url).api_base_url == f"{url}:443"
+        assert APIEndpoint(url=url).is_secure_repository() == (True, True)
+    assert not create_connection.called
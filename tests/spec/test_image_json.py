@@ -18,3 +18,10 @@ def test_image_json(image_json_dict):
         assert ImageJSON(**image_json_dict).json(exclude_unset=True) == json.dumps(
             image_json_dict
         )
+
+
+def test_parse(image_json_dict):
+    image_json = ImageJSON.parse(json.dumps(image_json_dict))
+    assert image_json.config.User == image_json_dict["config"]["User"]
+    assert image_json.rootfs.diff_ids == image_json_dict["rootfs"]["diff_ids"]
+    assert [h.created_by for h in image_json.history] == [h.get("created_by") for h in image_json_dict["history"]]
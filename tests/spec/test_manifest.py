@@ -1,3 +1,8 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
 from moby_distribution.spec import manifest
 
 
@@ -16,3 +21,26 @@ def test_oci_schema1(oci_manifest_schema1_dict):
     assert (
         manifest.OCIManifestSchema1(**oci_manifest_schema1_dict).dict(exclude_unset=True) == oci_manifest_schema1_dict
     )
+
+
+@pytest.mark.parametrize(
+    "model, fixture_name",
+    [
+        (manifest.ManifestSchema1, "docker_manifest_schema1_dict"),
+        (manifest.ManifestSchema2, "docker_manifest_schema2_dict"),
+        (manifest.OCIManifestSchema1, "oci_manifest_schema1_dict"),
+    ],
+)
+def test_parse(request, model, fixture_name):
+    data = request.getfixturevalue(fixture_name)
+
+    parsed = model.parse(json.dumps(data))
+    assert parsed == model(**data)
+    assert model.parse(json.dumps(data).encode()) == parsed
+    assert model.parse(data) == parsed
+    assert isinstance(parsed.config if hasattr(parsed, "config") else parsed.fsLayers[0], BaseModel)
+
+
+def test_parse_invalid():
+    with pytest.raises(ValueError):
+        manifest.ManifestSchema2.parse({"schemaVersion": 1, "config": {}, "layers": []})
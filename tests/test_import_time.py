@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# the modules which should be loaded on first use, not by listing tags
+HEAVY_MODULES = [
+    "libtrust",
+    "cryptography",
+    "curlify",
+    "www_authenticate",
+    "asyncio",
+    "tarfile",
+    "gzip",
+    "moby_distribution.registry.resources.image",
+]
+# generous enough for slow CI machines, most of it is spent on `requests` and `pydantic`
+IMPORT_TIME_BUDGET = 2.0
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from moby_distribution import DockerRegistryV2Client, Tags
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+@pytest.fixture(scope="module")
+def imported():
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT])
+    return json.loads(output)
+
+
+@pytest.mark.parametrize("module", HEAVY_MODULES)
+def test_lazy_import(imported, module):
+    assert module not in imported["modules"]
+
+
+def test_import_time(imported):
+    assert imported["elapsed"] < IMPORT_TIME_BUDGET
+
+
+def test_exports():
+    import moby_distribution
+
+    for name in moby_distribution.__all__:
+        assert getattr(moby_distribution, name) is not None
+    with pytest.raises(AttributeError):
+        moby_distribution.NotExported
@@ -0,0 +1,160 @@
+import gzip
+import io
+import json
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from moby_distribution.registry.client import DockerRegistryV2Client
+from moby_distribution.registry.exceptions import (
+    AuthFailed,
+    PermissionDeny,
+    RequestErrorWithResponse,
+    ResourceNotFound,
+)
+from moby_distribution.registry.ratelimit import NoRateLimit
+from moby_distribution.registry.resources import blobs
+from moby_distribution.registry.resources.blobs import Blob
+from moby_distribution.registry.resources.image import ImageRef, LayerRef
+from moby_distribution.registry.resources.tags import Tags
+from moby_distribution.registry.retry import RetryPolicy
+from moby_distribution.testing import FakeRegistry
+
+assets = Path(__file__).parent / "spec" / "assets"
+
+
+@pytest.fixture
+def registry():
+    with FakeRegistry() as registry:
+        yield registry
+
+
+def new_client(registry: FakeRegistry, **kwargs) -> DockerRegistryV2Client:
+    return DockerRegistryV2Client(
+        registry.url,
+        rate_limiter=NoRateLimit(),
+        retry_policy=RetryPolicy(backoff_base=0, jitter=False, budget=None),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def client(registry):
+    with new_client(registry) as client:
+        yield client
+
+
+class TestBlobs:
+    def test_upload_and_download(self, registry, client):
+        descriptor = Blob(repo="a/b", fileobj=io.BytesIO(b"content"), client=client).upload()
+        assert registry.blobs[descriptor.digest] == b"content"
+        assert descriptor.size == 7
+
+        fh = io.BytesIO()
+        Blob(repo="a/b", digest=descriptor.digest, fileobj=fh, client=client).download()
+        assert fh.getvalue() == b"content"
+        assert ("PATCH", "blobs/uploads/{uuid}") in registry.requests
+
+    def test_upload_at_one_time(self, registry, client):
+        descriptor = Blob(repo="a", fileobj=io.BytesIO(b"content"), client=client).upload_at_one_time()
+        assert registry.blobs[descriptor.digest] == b"content"
+
+    def test_mount(self, registry, client):
+        digest = registry.add_blob("a", b"content")
+        Blob(repo="b", digest=digest, client=client).mount_from("a")
+        assert digest in registry.repo_blobs["b"]
+        assert ("PATCH", "blobs/uploads/{uuid}") not in registry.requests
+
+    def test_coalesce_keys(self, registry, client):
+        digest = registry.add_blob("a", b"content")
+        with mock.patch.object(blobs.default_singleflight, "do", side_effect=lambda key, func: func()) as do:
+            Blob(repo="b", digest=digest, client=client).mount_from("a")
+            Blob(repo="b", digest=digest, fileobj=io.BytesIO(b"content"), client=client).upload()
+            with new_client(registry, username="u", password="other") as other:
+                Blob(repo="b", digest=digest, fileobj=io.BytesIO(b"content"), client=other).upload()
+
+        keys = [call.args[0] for call in do.call_args_list if call.args[0][-1] != "stat"]
+        mount_key, upload_key, other_key = keys
+        assert mount_key != upload_key
+        assert upload_key != other_key
+
+    def test_not_found(self, registry, client):
+        digest = registry.add_blob("a", b"content")
+        with pytest.raises(ResourceNotFound):
+            Blob(repo="b", client=client).stat(digest)
+
+    def test_resume_after_dropped_connection(self, registry, client):
+        registry.inject_fault("PATCH", "blobs/uploads/{uuid}", status=None)
+        descriptor = Blob(repo="a", fileobj=io.BytesIO(b"content"), client=client).upload()
+        assert registry.blobs[descriptor.digest] == b"content"
+        assert registry.requests.count(("PATCH", "blobs/uploads/{uuid}")) == 2
+
+    def test_chunk_retried_once_per_attempt(self, registry, client):
+        registry.inject_fault("PATCH", "blobs/uploads/{uuid}", status=429, times=None)
+        with pytest.raises(RequestErrorWithResponse):
+            Blob(repo="a", fileobj=io.BytesIO(b"content"), client=client).upload()
+        # the chunk is retried by the resume loop of the writer only, not again by the client
+        assert registry.requests.count(("PATCH", "blobs/uploads/{uuid}")) == client.retry_policy.max_attempts
+
+    def test_retry_injected_status(self, registry, client):
+        digest = registry.add_blob("a", b"content")
+        registry.inject_fault("HEAD", "blobs/{digest}", status=503, times=2)
+        assert Blob(repo="a", client=client).stat(digest).size == 7
+        assert registry.requests.count(("HEAD", "blobs/{digest}")) == 3
+
+    def test_bandwidth(self):
+        with FakeRegistry(bandwidth=1024 * 1024) as registry, new_client(registry) as client:
+            digest = registry.add_blob("a", b"x" * 256 * 1024)
+            start = time.perf_counter()
+            Blob(repo="a", digest=digest, fileobj=io.BytesIO(), client=client).download()
+            assert time.perf_counter() - start >= 0.2
+
+
+class TestManifests:
+    def test_tags_pagination(self, registry, client):
+        manifest = json.dumps({"schemaVersion": 2, "config": {"digest": registry.add_blob("a", b"{}")}, "layers": []})
+        for tag in ("v1", "v2", "v3"):
+            registry.add_manifest("a", tag, manifest.encode(), "application/vnd.docker.distribution.manifest.v2+json")
+
+        assert Tags(repo="a", client=client).list() == ["v1", "v2", "v3"]
+        resp = client.get(url=f"{registry.url}/v2/a/tags/list", params={"n": 2})
+        assert resp.json()["tags"] == ["v1", "v2"]
+        resp = client.get(url=registry.url + resp.links["next"]["url"])
+        assert resp.json() == {"name": "a", "tags": ["v3"]}
+
+    def test_push_image(self, registry, client, tmp_path):
+        layer = tmp_path / "layer.tar.gz"
+        layer.write_bytes(gzip.compress(b"layer"))
+        initial_config = (assets / "image_json.pydantic_v2.json").read_text()
+        image = ImageRef(repo="a", reference="latest", layers=[], initial_config=initial_config, client=client)
+        image.add_layer(LayerRef(local_path=layer))
+        pushed = image.push()
+
+        copied = ImageRef.from_image(from_repo="a", from_reference="latest", to_repo="b", client=client)
+        assert [layer.digest for layer in copied.push().layers] == [layer.digest for layer in pushed.layers]
+        assert registry.tags["b"]["latest"] == registry.tags["a"]["latest"]
+        assert ("PATCH", "blobs/uploads/{uuid}") in registry.requests
+
+        dest = tmp_path / "image.tar"
+        copied.save(str(dest))
+        assert dest.exists()
+
+
+class TestAuth:
+    @pytest.mark.parametrize("auth, error", [("basic", PermissionDeny), ("token", AuthFailed)])
+    def test_authenticate(self, auth, error):
+        with FakeRegistry(auth=auth, users={"admin": "password"}) as registry:
+            with new_client(registry, username="admin", password="password") as client:
+                digest = registry.add_blob("a", b"content")
+                assert Blob(repo="a", client=client).stat(digest).size == 7
+
+            with new_client(registry, username="admin", password="wrong") as client:
+                with pytest.raises(error):
+                    Blob(repo="a", client=client).stat(digest)
+
+    def test_anonymous_token(self):
+        with FakeRegistry(auth="token") as registry, new_client(registry) as client:
+            assert client.ping()
+            assert ("GET", "token") in registry.requests